@@ -0,0 +1,118 @@
+import math
+import time
+
+
+# Adaptive frame sampling, replacing a fixed frame_skip.
+# should_sample() is called for every decoded frame and keeps about `rate` frames per second
+# of stream time. record() feeds back what happened to a sampled frame, and the rate follows:
+#   activity    - motion relative to the significance threshold (flow magnitude / threshold,
+#                 0 for frames frame_diff / tiles found unchanged). Rises immediately and decays
+#                 smoothly, so an event is sampled densely from its first observation; min_rate
+#                 at or below low_activity, max_rate at or above high_activity, log-scale between.
+#                 Until there is a first observation the rate stays at initial_rate.
+#   blurred     - clarity rejects. While the scene is active and many frames are blurred (motion
+#                 blur) the rate is raised by up to blur_boost x, as blurred frames are cheap to
+#                 reject and a clear one is needed. Blur in a static scene changes nothing.
+#   queue_depth - downstream backlog (Gemini queue). Each job at or over queue_limit halves the
+#                 rate, since new mosaics would only wait or be coalesced away.
+#   cost        - seconds spent analysing the frame. The rate is capped so that rate * cost
+#                 stays within cpu_budget (fraction of one core); min_rate still wins.
+class AdaptiveSampler:
+    def __init__(self, min_rate=1.0, max_rate=6.0, initial_rate=3.0, cpu_budget=0.5,
+                 low_activity=0.5, high_activity=4.0, blur_boost=1.0, queue_limit=2, smoothing=0.3):
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("Need 0 < min_rate <= max_rate")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.cpu_budget = cpu_budget
+        self.low_activity = low_activity
+        self.high_activity = high_activity
+        self.blur_boost = blur_boost
+        self.queue_limit = queue_limit
+        self.smoothing = smoothing
+
+        self.initial_rate = min(max(initial_rate, min_rate), max_rate)
+        self.rate = self.initial_rate
+        self.activity = None
+        self.blur_rate = 0.0
+        self.cost = None
+        self.queue_depth = 0
+        self._last_sample = None
+
+        self.frames_seen = 0
+        self.frames_sampled = 0
+
+    def should_sample(self, timestamp=None):
+        """True if this frame should be analysed. timestamp is the frame's stream time in
+        seconds (defaults to now; pass index / fps when replaying recorded footage)."""
+        now = time.monotonic() if timestamp is None else timestamp
+        self.frames_seen += 1
+        if self._last_sample is not None and now - self._last_sample < 1.0 / self.rate:
+            return False
+        self._last_sample = now
+        self.frames_sampled += 1
+        return True
+
+    def _smooth(self, previous, value):
+        if previous is None:
+            return value
+        return (1 - self.smoothing) * previous + self.smoothing * value
+
+    def record(self, activity=None, blurred=False, cost=None, queue_depth=None):
+        """Feed back the outcome of one sampled frame. Returns the new rate."""
+        if activity is not None:
+            if self.activity is None or activity > self.activity:
+                self.activity = activity
+            else:
+                self.activity = self._smooth(self.activity, activity)
+        self.blur_rate = self._smooth(self.blur_rate, 1.0 if blurred else 0.0)
+        if cost is not None:
+            self.cost = self._smooth(self.cost, cost)
+        if queue_depth is not None:
+            self.queue_depth = queue_depth
+        self.rate = self._target_rate()
+        return self.rate
+
+    def _target_rate(self):
+        if self.activity is None:
+            rate = self.initial_rate
+        else:
+            span = math.log(self.high_activity / self.low_activity)
+            position = math.log(max(self.activity, 1e-6) / self.low_activity) / span
+            rate = self.min_rate * (self.max_rate / self.min_rate) ** min(max(position, 0.0), 1.0)
+            if self.activity > self.low_activity:
+                rate *= 1 + self.blur_boost * self.blur_rate
+        if self.queue_depth >= self.queue_limit:
+            rate *= 0.5 ** (self.queue_depth - self.queue_limit + 1)
+        if self.cost:
+            rate = min(rate, self.cpu_budget / self.cost)
+        return min(max(rate, self.min_rate), self.max_rate)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 2),
+            "activity": round(self.activity, 3) if self.activity is not None else None,
+            "blur_rate": round(self.blur_rate, 3),
+            "cost_ms": round(self.cost * 1000, 2) if self.cost is not None else None,
+            "cpu_fraction": round(self.cost * self.rate, 3) if self.cost is not None else None,
+            "queue_depth": self.queue_depth,
+            "frames_seen": self.frames_seen,
+            "frames_sampled": self.frames_sampled,
+        }
+
+
+def pipeline_feedback(ctx, rejected_by, motion_threshold=0.05, diff_threshold=1.5):
+    """(activity, blurred) for AdaptiveSampler.record from a FramePipeline outcome.
+
+    Activity comes from the flow magnitude when the motion stage ran, otherwise from the
+    frame difference against the last accepted frame (None when neither was computed).
+    """
+    if rejected_by in ("frame_diff", "tiles"):
+        return 0.0, False
+    if ctx.has("motion_magnitude"):
+        activity = ctx.get("motion_magnitude", None) / motion_threshold
+    elif ctx.has("frame_diff"):
+        activity = ctx.get("frame_diff", None) / diff_threshold
+    else:
+        activity = None
+    return activity, rejected_by == "clarity"
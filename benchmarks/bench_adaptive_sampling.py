@@ -0,0 +1,159 @@
+"""Replay benchmark: adaptive frame sampling vs fixed frame_skip.
+
+Replays footage (a recorded video file, or a synthetic mostly-static scene with short events, a
+camera pan and a shaky blurred stretch) through the capture loop's filter stages and reports, per
+sampling policy, the CPU spent analysing frames against the events captured. Ground-truth events
+are runs of frames that differ from their predecessor (found with a dense pass over every frame);
+an event counts as captured if at least one frame inside it is sampled and accepted, and
+"in-event" counts all accepted frames inside events (how much of the action makes it into mosaics).
+
+Usage: python benchmarks/bench_adaptive_sampling.py [--video footage.mp4] [--seconds 120] [--fps 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from adaptive_sampler import AdaptiveSampler, pipeline_feedback
+from frame_filters import FrameContext, FramePipeline, clarity_stage, frame_difference_stage, motion_stage
+
+
+def synthetic_footage(seconds, fps, size=(1280, 720), seed=0):
+    """Static scene; an object crosses every ~12 s, a pan at 40-50 s, a shaky blur at 80-85 s."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scene = cv2.GaussianBlur(rng.integers(0, 256, (height, width * 2, 3), dtype=np.uint8), (3, 3), 0)
+    side = height // 3
+    sprite = np.clip(rng.normal(230, 20, (side, side, 3)), 0, 255).astype(np.uint8)
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        x = 0
+        if 40 <= t < 50:
+            x = int((t - 40) * width / 16)
+        elif t >= 50:
+            x = width * 10 // 16
+        frame = scene[:, x:x + width].copy()
+        phase = t % 12
+        if 6 <= phase < 7.5:  # object crossing
+            ox = int((phase - 6) / 1.5 * (width - side))
+            frame[side:2 * side, ox:ox + side] = sprite
+        if 80 <= t < 85:  # camera shake: motion blur and jitter
+            frame = cv2.blur(np.roll(frame, int(rng.integers(-6, 7)), axis=1), (15, 15))
+        yield frame
+
+
+def video_footage(path, size=(640, 360)):
+    cap = cv2.VideoCapture(path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield cv2.resize(frame, size)
+    cap.release()
+
+
+def find_events(footage, fps, threshold, min_gap=0.5, min_length=3):
+    """[(first_frame, last_frame)] runs of frames that changed against the previous frame."""
+    active = []
+    previous = None
+    for frame in footage:
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (160, 90), interpolation=cv2.INTER_AREA)
+        active.append(previous is not None and float(np.mean(cv2.absdiff(small, previous))) > threshold)
+        previous = small
+    events = []
+    for i, is_active in enumerate(active):
+        if not is_active:
+            continue
+        if events and i - events[-1][1] <= min_gap * fps:
+            events[-1][1] = i
+        else:
+            events.append([i, i])
+    return [(start, end) for start, end in events if end - start + 1 >= min_length]
+
+
+def build_pipeline():
+    return FramePipeline([
+        frame_difference_stage(diff_threshold=1.5, cost=1.0),
+        clarity_stage(cost=3.0),
+        motion_stage(cost=10.0),
+    ])
+
+
+def replay(footage, fps, sampler=None, frame_skip=None):
+    pipeline = build_pipeline()
+    accepted = []
+    cpu = 0.0
+    for index, frame in enumerate(footage):
+        if sampler is not None:
+            if not sampler.should_sample(index / fps):
+                continue
+        elif index % frame_skip != 0:
+            continue
+        start = time.process_time()
+        ctx = FrameContext(frame, index=index)
+        keep, rejected_by = pipeline.run(ctx)
+        cost = time.process_time() - start
+        cpu += cost
+        if sampler is not None:
+            activity, blurred = pipeline_feedback(ctx, rejected_by)
+            sampler.record(activity, blurred, cost)
+        if keep:
+            accepted.append(index)
+    return accepted, pipeline.frames_seen, cpu
+
+
+def score(events, accepted, fps):
+    """(events captured, frames accepted inside events, mean delay to the first accepted frame)"""
+    accepted = np.array(accepted, dtype=np.int64)
+    captured = covered = 0
+    delays = []
+    for start, end in events:
+        inside = accepted[(accepted >= start) & (accepted <= end)]
+        covered += len(inside)
+        if len(inside):
+            captured += 1
+            delays.append((inside[0] - start) / fps)
+    return captured, covered, (np.mean(delays) if delays else float("nan"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", help="recorded footage to replay (default: synthetic)")
+    parser.add_argument("--seconds", type=float, default=120.0, help="synthetic footage length")
+    parser.add_argument("--fps", type=float, default=30.0, help="stream frame rate")
+    parser.add_argument("--event-threshold", type=float, default=0.1,
+                        help="mean abs difference (small gray) that marks a frame as part of an event")
+    parser.add_argument("--min-rate", type=float, default=1.0)
+    parser.add_argument("--max-rate", type=float, default=6.0)
+    parser.add_argument("--cpu-budget", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.video:
+        def footage():
+            return video_footage(args.video)
+    else:
+        def footage():
+            return synthetic_footage(args.seconds, args.fps)
+
+    events = find_events(footage(), args.fps, args.event_threshold)
+    frames = sum(1 for _ in footage())
+    duration = frames / args.fps
+    print(f"{frames} frames ({duration:.0f} s at {args.fps:g} fps), {len(events)} events")
+    print(f"{'policy':<26}{'analysed':>9}{'CPU s':>8}{'CPU %':>7}{'events':>9}{'in-event':>10}{'delay s':>9}")
+
+    policies = [(f"fixed frame_skip={skip}", None, skip) for skip in (5, 10, 20, 30)]
+    policies.append(("adaptive", AdaptiveSampler(args.min_rate, args.max_rate, cpu_budget=args.cpu_budget), None))
+    policies.append(("adaptive, 5% CPU budget", AdaptiveSampler(args.min_rate, args.max_rate, cpu_budget=0.05), None))
+    for name, sampler, skip in policies:
+        accepted, analysed, cpu = replay(footage(), args.fps, sampler=sampler, frame_skip=skip)
+        captured, covered, delay = score(events, accepted, args.fps)
+        print(f"{name:<26}{analysed:>9}{cpu:>8.2f}{cpu / duration * 100:>7.1f}"
+              f"{f'{captured}/{len(events)}':>9}{covered:>10}{delay:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Benchmark: global frame difference vs tiled change detection (+ ROI crop) on static-camera footage.
+
+Feeds the sampled frames (every --step-th) of a static-camera clip through both change gates:
+  global - the capture loop's frame_diff stage: mean absolute difference of the 160x90 gray
+           frame against the last accepted one, > 1.5
+  tiles  - change_detection.TiledChangeDetector (per-tile background model), with the mosaics
+           cropped to the changed region (crop_to_changes)
+Every 6 forwarded frames make a mosaic, as in llama-gemini.py. Reports per gate: frames forwarded
+(each one costs a novelty-stage embedding downstream), gate ms per frame, ResNet ms spent on the
+forwarded frames and mosaics, and mosaic payload bytes / estimated tokens.
+
+--video takes recorded static-camera clips (repeatable). Without it a synthetic clip is used: a
+captured_frames/ scene (or a texture) with sensor noise, slow exposure drift, a flickering screen,
+a person walking through one corner every 20 s and an object that arrives and stays. It knows
+which frames show an event, so recall (event frames forwarded) and frames forwarded while
+nothing happened are reported too.
+
+Usage: python benchmarks/bench_change_detection.py [--video clip.mp4] [--seconds 120] [--step 10] [--no-pretrained]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_adaptive_sampling import video_footage
+from change_detection import TiledChangeDetector, crop_to_changes, parse_grid
+from mosaic import MosaicComposer
+
+SIZE = (640, 360)
+SMALL_SIZE = (160, 90)
+
+
+def synthetic_static_footage(seconds, fps, scene_glob, noise=2.0, seed=0):
+    """(frame, event) pairs of a fixed camera; event is True while something actually happens."""
+    rng = np.random.default_rng(seed)
+    width, height = SIZE
+    paths = sorted(glob.glob(scene_glob)) if scene_glob else []
+    if paths:
+        scene = cv2.resize(cv2.imread(paths[0]), SIZE, interpolation=cv2.INTER_AREA)
+    else:
+        scene = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    scene = scene.astype(np.float32)
+    walker = np.clip(rng.normal(60, 25, (120, 50, 3)), 0, 255).astype(np.float32)
+    parcel = np.clip(rng.normal(200, 15, (60, 80, 3)), 0, 255).astype(np.float32)
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        frame = scene * (1.0 + 0.06 * np.sin(2 * np.pi * t / 90))  # exposure drift
+        frame[20:80, 500:600] = 128 + 60 * np.sin(2 * np.pi * t * 0.7)  # flickering screen
+        event = False
+        phase = t % 20
+        if 5 <= phase < 9:  # someone crosses the lower left corner
+            x = int((phase - 5) / 4 * 220)
+            frame[220:340, x:x + 50] = walker
+            event = True
+        if t >= seconds / 2:  # a parcel is dropped and stays
+            frame[260:320, 420:500] = parcel
+            event = event or t < seconds / 2 + 2
+        frame += rng.normal(0, noise, frame.shape)
+        yield np.clip(frame, 0, 255).astype(np.uint8), event
+
+
+def clips(args):
+    for path in args.video or []:
+        yield path, ((frame, None) for frame in video_footage(path, SIZE))
+    if not args.video:
+        yield "synthetic static camera", synthetic_static_footage(args.seconds, args.fps, args.scene)
+
+
+def small_gray(frame):
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), SMALL_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def run_gates(frames, args):
+    """{gate: {"forwarded": [indices], "masks": [...], "gate_ms": [...]}} for the sampled frames."""
+    detector = TiledChangeDetector(grid=parse_grid(args.grid), threshold=args.threshold)
+    results = {"global": {"forwarded": [], "masks": [], "gate_ms": []},
+               "tiles": {"forwarded": [], "masks": [], "gate_ms": []}}
+    reference = None
+    for index, frame in enumerate(frames):
+        started = time.perf_counter()
+        small = small_gray(frame)
+        keep = reference is None or float(np.mean(cv2.absdiff(small, reference))) > 1.5
+        if keep:
+            reference = small
+        results["global"]["gate_ms"].append((time.perf_counter() - started) * 1000)
+        if keep:
+            results["global"]["forwarded"].append(index)
+
+        started = time.perf_counter()
+        mask = detector.update(small_gray(frame))
+        results["tiles"]["gate_ms"].append((time.perf_counter() - started) * 1000)
+        if mask.any():
+            results["tiles"]["forwarded"].append(index)
+            results["tiles"]["masks"].append(mask)
+    return results, detector
+
+
+def mosaics(frames, result, composer, engine, crop):
+    """Payload and ResNet time for the mosaics of 6 forwarded frames each."""
+    payloads, tokens, crops = [], [], 0
+    embed_seconds = 0.0
+    forwarded = result["forwarded"]
+    for start in range(0, len(forwarded) - 5, 6):
+        images = [frames[i] for i in forwarded[start:start + 6]]
+        if crop:
+            images, box = crop_to_changes(images, result["masks"][start:start + 6])
+            crops += box is not None
+        if engine is not None:
+            started = time.perf_counter()
+            engine.embed(images)
+            embed_seconds += time.perf_counter() - started
+        _, _, report = composer.compose(images)
+        payloads.append(report["payload_bytes"])
+        tokens.append(report["estimated_tokens"])
+    return payloads, tokens, crops, embed_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", action="append", help="recorded static-camera clip (repeatable)")
+    parser.add_argument("--seconds", type=float, default=120, help="length of the synthetic clip")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--scene", default="captured_frames/environment_*.jpg", help="background image glob")
+    parser.add_argument("--step", type=int, default=10, help="analyse every step-th frame")
+    parser.add_argument("--grid", default="8x6", help="tile grid, columns x rows")
+    parser.add_argument("--threshold", type=float, default=4.0, help="tile change threshold (gray levels)")
+    parser.add_argument("--no-pretrained", action="store_true", help="random ResNet weights (no download)")
+    parser.add_argument("--no-embed", action="store_true", help="skip timing the ResNet stage")
+    args = parser.parse_args()
+
+    engine = None
+    if not args.no_embed:
+        from embedding_engine import EmbeddingEngine
+        engine = EmbeddingEngine("eager", device="cpu", pretrained=not args.no_pretrained)
+        engine.embed([np.zeros((SIZE[1], SIZE[0], 3), dtype=np.uint8)] * 6)  # warm-up
+
+    composer = MosaicComposer()
+    for name, footage in clips(args):
+        frames, events = [], []
+        for index, (frame, event) in enumerate(footage):
+            if index % args.step == 0:
+                frames.append(frame)
+                events.append(event)
+        results, detector = run_gates(frames, args)
+        print(f"\n{name}: {len(frames)} sampled frames, grid {args.grid}")
+
+        embed_per_frame = None
+        if engine is not None:
+            started = time.perf_counter()
+            for frame in frames[:12]:
+                engine.embed([frame])
+            embed_per_frame = (time.perf_counter() - started) / min(len(frames), 12)
+
+        print(f"{'gate':<8}{'forwarded':>10}{'gate ms':>9}{'ResNet ms':>11}{'mosaics':>9}{'cropped':>9}"
+              f"{'KB/mosaic':>11}{'KB total':>10}{'tokens':>8}")
+        for gate, result in results.items():
+            payloads, tokens, crops, embed_seconds = mosaics(frames, result, composer, engine, crop=gate == "tiles")
+            forwarded = len(result["forwarded"])
+            resnet_ms = (embed_seconds + forwarded * embed_per_frame) * 1000 if engine is not None else float("nan")
+            kb = np.mean(payloads) / 1024 if payloads else 0.0
+            print(f"{gate:<8}{forwarded:>10}{np.mean(result['gate_ms']):>9.3f}{resnet_ms:>11.0f}{len(payloads):>9}"
+                  f"{crops:>9}{kb:>11.1f}{sum(payloads) / 1024:>10.1f}{np.mean(tokens) if tokens else 0:>8.0f}")
+            if events[0] is not None:
+                forwarded_set = set(result["forwarded"])
+                event_frames = [i for i, event in enumerate(events) if event]
+                recall = sum(i in forwarded_set for i in event_frames) / max(len(event_frames), 1)
+                idle = sum(1 for i in forwarded_set if not events[i])
+                print(f"{'':<8}recall of event frames {recall:.2f}, forwarded while idle {idle}")
+        stats = detector.stats()
+        print(f"tiles ever changed: {stats['tiles_ever_changed']} of {detector.rows * detector.cols}, "
+              f"mean changed fraction {stats['mean_changed_fraction']}")
+
+
+if __name__ == "__main__":
+    main()
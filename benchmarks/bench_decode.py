@@ -0,0 +1,117 @@
+"""Benchmark: decode-side cost of the capture loop, cap.read() of every frame vs FrameSource.
+
+Replays an MJPEG clip (--video, or a synthetic 1280x720 MJPG clip written to a temporary file,
+like an IP camera's /video stream) keeping every --step-th frame, as frame_skip / the sampler do.
+For each kept frame the capture loop's resolutions are made: the 640x360 working frame, its gray
+and 160x90 gray, and the 700x400 preview. Variants:
+  read      - cap.read() of every frame, every resolution resized from the full frame (before)
+  grab      - FrameSource(reduced=False): grab() only for skipped frames, full-size decoding
+  reduced   - FrameSource: also decodes MJPEG straight to 1/2, 1/4 or 1/8 scale
+The FrameSource variants build the resolutions once through a FrameContext.
+Reports ms per stream frame and the decode time FrameSource.stats() estimates it saved, next to
+the measured difference to "read".
+
+Usage: python benchmarks/bench_decode.py [--video clip.avi] [--seconds 20] [--size 1280x720] [--step 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_adaptive_sampling import synthetic_footage
+from frame_filters import FrameContext
+from frame_source import FrameSource
+
+SIZE = (640, 360)
+SMALL_SIZE = (160, 90)
+PREVIEW_SIZE = (700, 400)
+
+
+def write_mjpeg_clip(path, seconds, fps, size):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    if not writer.isOpened():
+        raise SystemExit("No MJPG encoder available; pass --video")
+    for frame in synthetic_footage(seconds, fps, size=size):
+        writer.write(frame)
+    writer.release()
+
+
+def run_read(path, step):
+    cap = cv2.VideoCapture(path)
+    frames = 0
+    started = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+        if frames % step:
+            continue
+        resized = cv2.resize(frame, SIZE)
+        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+        cv2.resize(gray, SMALL_SIZE, interpolation=cv2.INTER_AREA)
+        cv2.resize(frame, PREVIEW_SIZE)
+    elapsed = time.perf_counter() - started
+    cap.release()
+    return frames, elapsed, None
+
+
+def run_source(path, step, reduced):
+    source = FrameSource(path, size=SIZE, reduced=reduced)
+    frames = 0
+    started = time.perf_counter()
+    while source.grab():
+        frames += 1
+        if frames % step:
+            continue
+        ret, frame = source.retrieve()
+        if not ret:
+            continue
+        ctx = FrameContext(frame, index=frames)
+        ctx.small_gray  # resized -> gray -> small gray, each made once
+        cv2.resize(frame, PREVIEW_SIZE)
+    elapsed = time.perf_counter() - started
+    stats = source.stats()
+    source.release()
+    return frames, elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", help="MJPEG clip (default: synthetic)")
+    parser.add_argument("--seconds", type=float, default=20, help="synthetic clip length")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--size", default="1280x720", help="synthetic clip resolution")
+    parser.add_argument("--step", type=int, default=10, help="keep every step-th frame")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.video
+        if path is None:
+            path = os.path.join(workdir, "synthetic.avi")
+            write_mjpeg_clip(path, args.seconds, args.fps, tuple(int(v) for v in args.size.split("x")))
+
+        variants = [("read", lambda: run_read(path, args.step)),
+                    ("grab", lambda: run_source(path, args.step, reduced=False)),
+                    ("reduced", lambda: run_source(path, args.step, reduced=True))]
+        results = {}
+        for name, run in variants:
+            results[name] = min((run() for _ in range(args.repeat)), key=lambda result: result[1])
+
+    frames, baseline, _ = results["read"]
+    print(f"{frames} frames, keeping every {args.step}th; best of {args.repeat} runs")
+    print(f"{'variant':<9}{'ms/frame':>10}{'speedup':>9}{'measured saved s':>18}{'estimated saved s':>19}  mode")
+    for name, (frames, elapsed, stats) in results.items():
+        estimate = f"{stats['decode_saved_seconds']:>19.3f}" if stats else f"{'':>19}"
+        mode = f"  {stats['mode']} 1/{stats['scale']} -> {stats['decoded_size']}" if stats else ""
+        print(f"{name:<9}{elapsed / frames * 1000:>10.3f}{baseline / elapsed:>8.1f}x{baseline - elapsed:>18.3f}"
+              f"{estimate}{mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark: storing descriptions, rewriting descriptions.json per result vs DescriptionStore.
+
+Reports the time save_description spends per result as the history grows (the old JSON rewrite
+is O(n) per result) and the time until everything is on disk.
+
+Usage: python benchmarks/bench_descriptions.py [--results 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from description_store import DescriptionStore
+
+DESCRIPTION = "A desk with a laptop, a coffee mug and a stack of papers under warm afternoon light. " * 4
+
+
+def rewrite_json(path, results):
+    descriptions = []
+    latencies = []
+    for i in range(results):
+        start = time.perf_counter()
+        descriptions.append({"filename": f"frame_{i}.jpg", "description": DESCRIPTION,
+                             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")})
+        with open(path, 'w') as json_file:
+            json.dump(descriptions, json_file, indent=4)
+        latencies.append(time.perf_counter() - start)
+    return latencies, 0.0
+
+
+def store(path, results):
+    descriptions = DescriptionStore(path, legacy_json=None)
+    latencies = []
+    for i in range(results):
+        start = time.perf_counter()
+        descriptions.add(f"frame_{i}.jpg", DESCRIPTION, prompt="describe")
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    descriptions.close()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--results", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.results} results")
+    print(f"{'method':<18}{'first 100 ms':>13}{'last 100 ms':>13}{'total s':>9}{'flush s':>9}{'file KB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, run, filename in (("rewrite json", rewrite_json, "descriptions.json"),
+                                    ("DescriptionStore", store, "descriptions.db")):
+            path = os.path.join(directory, filename)
+            latencies, flush = run(path, args.results)
+            first = sum(latencies[:100]) / len(latencies[:100]) * 1000
+            last = sum(latencies[-100:]) / len(latencies[-100:]) * 1000
+            print(f"{name:<18}{first:>13.3f}{last:>13.3f}{sum(latencies) + flush:>9.2f}{flush:>9.3f}"
+                  f"{os.path.getsize(path) // 1024:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Micro-benchmark: frames/sec of the ResNet embedding backends vs the old per-frame PIL path.
+
+Usage: python benchmarks/bench_embedding.py [--batch 16] [--iters 10] [--no-pretrained]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_engine import BACKENDS, EmbeddingEngine
+
+
+def make_frames(count, size=(640, 360)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8) for _ in range(count)]
+
+
+# The pre-engine path: PIL conversion + unsqueeze(0), one forward pass per frame
+def bench_legacy(model, frames, iters):
+    preprocess = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor()])
+
+    def run():
+        with torch.no_grad():
+            for frame in frames:
+                pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                model(preprocess(pil_image).unsqueeze(0))
+
+    run()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iters):
+        run()
+    return len(frames) * iters / (time.perf_counter() - start)
+
+
+def bench_engine(engine, frames, iters):
+    engine.embed(frames)  # warm-up (compiles/traces where needed)
+    start = time.perf_counter()
+    for _ in range(iters):
+        engine.embed(frames)
+    return len(frames) * iters / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--no-pretrained", action="store_true", help="use random weights (no download)")
+    args = parser.parse_args()
+
+    frames = make_frames(args.batch)
+    pretrained = not args.no_pretrained
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, batch={args.batch}")
+
+    eager = EmbeddingEngine("eager", device="cpu", pretrained=pretrained)
+    print(f"{'legacy (PIL, 1/pass)':<22} {bench_legacy(eager.model, frames, args.iters):8.1f} frames/sec")
+
+    for backend in args.backends.split(","):
+        try:
+            engine = EmbeddingEngine(backend, device="cpu", pretrained=pretrained)
+            fps = bench_engine(engine, frames, args.iters)
+            print(f"{backend:<22} {fps:8.1f} frames/sec")
+        except Exception as e:
+            print(f"{backend:<22} unavailable: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark: EmbeddingIndex novelty queries at 1k / 10k / 100k stored embeddings.
+
+Compares the exact (matmul) and IVF modes with the old per-pair sklearn cosine_similarity
+check, and reports IVF top-1 recall (finding a neighbour as similar as the exact answer).
+
+Usage: python benchmarks/bench_embedding_index.py [--sizes 1000,10000,100000] [--queries 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import EmbeddingIndex
+
+
+# Clustered non-negative vectors, roughly like pooled ResNet features of a few recurring views
+def make_embeddings(count, centers, rng):
+    dim = centers.shape[1]
+    labels = rng.integers(0, len(centers), count)
+    return np.abs(centers[labels] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32))
+
+
+def time_per_call(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = np.abs(rng.standard_normal((50, args.dim))).astype(np.float32)
+    print(f"{'entries':>8} {'mode':<8}{'build ms':>10}{'query us':>10}{'top-1 recall':>14}")
+
+    try:
+        from sklearn.metrics.pairwise import cosine_similarity
+        pair = make_embeddings(2, centers, rng)
+        _, pair_us = time_per_call(lambda _: cosine_similarity(pair[:1], pair[1:])[0][0], range(args.queries))
+        print(f"{'1':>8} {'sklearn':<8}{'-':>10}{pair_us:>10.1f}{'-':>14}   (old single-pair check)")
+    except ImportError:
+        pass
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        data = make_embeddings(size, centers, rng)
+        queries = make_embeddings(args.queries, centers, rng)
+        exact_answers = None
+        for mode in ("exact", "ivf"):
+            index = EmbeddingIndex(dim=args.dim, capacity=size, mode=mode)
+            start = time.perf_counter()
+            for i, vector in enumerate(data):
+                index.add(vector, i)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            answers, query_us = time_per_call(lambda q: index.search(q, k=1), queries)
+            answers = [a[0][0] if a else -1.0 for a in answers]
+            if mode == "exact":
+                exact_answers = answers
+                recall = "-"
+            else:
+                recall = f"{np.mean([a >= b - 1e-5 for a, b in zip(answers, exact_answers)]):.3f}"
+            print(f"{size:>8} {mode:<8}{build_ms:>10.1f}{query_us:>10.1f}{recall:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark: disk round-trip mosaic encoding vs the in-memory JPEG path.
+
+Compares the old path (cv2.imwrite to captured_frames/, read back, base64) with
+encode_jpeg_base64 at several quality / max-dimension settings. Reports bytes sent and
+encode latency, plus end-to-end latency through the Gemini client against the local stub.
+
+Usage: python benchmarks/bench_encoding.py [--iters 20] [--image path/to/mosaic.jpg]
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gemini_client import GeminiClient
+from gemini_stub import start_stub_server
+from image_encoding import encode_jpeg_base64
+
+
+def legacy_encode(image, folder):
+    filename = os.path.join(folder, "combined_frame.jpg")
+    cv2.imwrite(filename, image)
+    with open(filename, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+
+def make_mosaic(path=None):
+    if path:
+        image = cv2.imread(path)
+        if image is None:
+            raise SystemExit(f"Could not read {path}")
+        return image
+    # Six 640x360 frames side by side like llama-gemini's mosaic, smooth gradients + noise
+    rng = np.random.default_rng(0)
+    tiles = []
+    for i in range(6):
+        x = np.linspace(0, 255, 640, dtype=np.float32)
+        tile = np.broadcast_to(x[None, :, None], (360, 640, 3)).copy()
+        tile = (tile * (i + 1) / 6 + rng.normal(0, 12, tile.shape)).clip(0, 255).astype(np.uint8)
+        tiles.append(tile)
+    return np.hstack(tiles)
+
+
+def timed(fn, iters):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, float(np.median(samples)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--image", help="mosaic to encode (default: synthetic 3840x360)")
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    image = make_mosaic(args.image)
+    base_url, _, stop = start_stub_server(latency=args.stub_latency)
+    client = GeminiClient(api_key="stub", base_url=base_url)
+
+    variants = [("legacy imwrite+read", None)]
+    variants += [(f"memory q={q} max={d or 'full'}", (q, d)) for q, d in [(95, 0), (90, 0), (80, 0), (80, 1920), (70, 1280)]]
+
+    print(f"mosaic {image.shape[1]}x{image.shape[0]}, median of {args.iters} runs")
+    print(f"{'path':<28}{'bytes sent':>12}{'encode ms':>11}{'end-to-end ms':>15}")
+    with tempfile.TemporaryDirectory() as folder:
+        for name, params in variants:
+            if params is None:
+                encode = lambda: legacy_encode(image, folder)
+            else:
+                quality, max_dim = params
+                encode = lambda: encode_jpeg_base64(image, quality=quality, max_dim=max_dim)[0]
+            payload, encode_ms = timed(encode, args.iters)
+            _, total_ms = timed(lambda: client.generate_sync("Describe the scene.", encode()), args.iters)
+            print(f"{name:<28}{len(payload):>12}{encode_ms:>11.2f}{total_ms:>15.2f}")
+
+    client.close()
+    stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark: per-frame imagehash / float64 Laplacian scoring vs frame_quality's batch versions.
+
+Scores a stack of frames (synthetic textures, or tiles cut from --images mosaics such as those
+in captured_frames/) both ways and checks that the batch pHash is bit-identical to
+imagehash.phash and that the clarity verdicts agree. Reports ms per frame for pHash, Laplacian
+variance and the clarity check, and Hamming distance matching against a history of hashes.
+
+Usage: python benchmarks/bench_frame_quality.py [--iters 20] [--batch 8] [--images 'captured_frames/*.jpg']
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_quality import hamming_distances, is_clear_batch, laplacian_variance, phash_batch
+
+
+def legacy_phash(frame):
+    import imagehash
+    from PIL import Image
+
+    return int(str(imagehash.phash(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))), 16)
+
+
+def legacy_is_clear(gray, laplacian_threshold=300, edge_threshold=100):
+    if cv2.Laplacian(gray, cv2.CV_64F).var() < laplacian_threshold:
+        return False
+    return np.sum(cv2.Canny(gray, 100, 200) > 0) > edge_threshold
+
+
+def load_frames(pattern, count, size=(640, 360)):
+    frames = []
+    rng = np.random.default_rng(0)
+    for path in sorted(glob.glob(pattern)) if pattern else []:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        for x in range(0, image.shape[1] - size[0] + 1, size[0]):
+            frames.append(cv2.resize(image[:, x:x + size[0]], size))
+    while len(frames) < count:
+        texture = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        frames.append(cv2.GaussianBlur(texture, (2 * (len(frames) % 4) + 1,) * 2, 0))
+    return np.stack(frames)
+
+
+def per_frame_ms(fn, frames, iters):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start) / iters / frames * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=8, help="frames per batch call")
+    parser.add_argument("--images", help="glob of images to cut 640x360 frames from")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.batch)
+    grays = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames])
+
+    legacy_hashes = [legacy_phash(frame) for frame in frames]
+    batch_hashes = phash_batch(frames)
+    mismatched = sum(int(a) != b for a, b in zip(batch_hashes, legacy_hashes))
+    clear_agree = np.array_equal(is_clear_batch(grays), [legacy_is_clear(gray) for gray in grays])
+    print(f"{len(frames)} frames: pHash mismatches {mismatched}, clarity verdicts agree: {clear_agree}")
+
+    stack, gray_stack = frames[:args.batch], grays[:args.batch]
+    n = len(stack)
+    rows = [
+        ("pHash", lambda: [legacy_phash(frame) for frame in stack], lambda: phash_batch(stack)),
+        ("Laplacian variance", lambda: [cv2.Laplacian(gray, cv2.CV_64F).var() for gray in gray_stack],
+         lambda: laplacian_variance(gray_stack)),
+        ("clarity check", lambda: [legacy_is_clear(gray) for gray in gray_stack], lambda: is_clear_batch(gray_stack)),
+    ]
+    history = np.array(legacy_hashes * (60 // len(legacy_hashes) + 1), dtype=np.uint64)[:60]
+    history_ints = [int(h) for h in history]
+    rows.append(("Hamming vs 60 hashes",
+                 lambda: [min(bin(h ^ other).count("1") for other in history_ints) for h in legacy_hashes[:n]],
+                 lambda: hamming_distances(batch_hashes[:n], history).min(axis=1)))
+
+    print(f"batches of {n}, ms per frame, mean of {args.iters} runs")
+    print(f"{'score':<22}{'per frame':>11}{'batch':>9}{'speedup':>9}")
+    for name, legacy, batch in rows:
+        legacy_ms = per_frame_ms(legacy, n, args.iters)
+        batch_ms = per_frame_ms(batch, n, args.iters)
+        print(f"{name:<22}{legacy_ms:>11.3f}{batch_ms:>9.3f}{legacy_ms / batch_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark: cost of the hot-path instrumentation per call, with metrics on and off (METRICS=0).
+
+Each mode runs in a fresh interpreter, since METRICS is read when metrics.py is imported.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+sys.path.insert(0, ROOT)
+from metrics import stage_histogram, timed
+
+def bare(x):
+    return x
+
+decorated = timed("bench")(bare)
+histogram = stage_histogram("bench_loop")
+
+def per_call_ns(body):
+    start = time.perf_counter()
+    body()
+    return (time.perf_counter() - start) / CALLS * 1e9
+
+def call_bare():
+    for i in range(CALLS):
+        bare(i)
+
+def call_decorated():
+    for i in range(CALLS):
+        decorated(i)
+
+def call_timer():
+    for i in range(CALLS):
+        with histogram.time():
+            bare(i)
+
+baseline = per_call_ns(call_bare)
+print(json.dumps({"bare": baseline,
+                  "timed": per_call_ns(call_decorated) - baseline,
+                  "timer": per_call_ns(call_timer) - baseline}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'call ns':>9}{'@timed ns':>11}{'timer ns':>10}  (overhead per call)")
+    for mode, enabled in (("on", "1"), ("off", "0")):
+        output = subprocess.run(
+            [sys.executable, "-c", f"ROOT = {ROOT!r}\nCALLS = {args.calls}\n" + PROBE],
+            env=dict(os.environ, METRICS=enabled), capture_output=True, text=True, check=True,
+        )
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['bare']:>9.0f}{result['timed']:>11.0f}{result['timer']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark: fixed hstack / 2x2 mosaics vs the budgeted MosaicComposer.
+
+Builds mosaics from six (or --frames) synthetic 640x360 frames the old way (np.hstack, or two
+hstacked rows vstacked, then encode_jpeg_base64 at quality 90) and with MosaicComposer under
+several budgets. Reports layout, canvas size, quality, base64 payload, estimated Gemini image
+tokens and compose + encode latency.
+
+Usage: python benchmarks/bench_mosaic.py [--iters 20] [--frames 6] [--video clip.mp4]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_encoding import encode_jpeg_base64
+from mosaic import MosaicComposer, estimate_tokens
+
+
+def synthetic_frames(count, width=640, height=360):
+    # Smooth gradients with a moving block and sensor noise, so JPEG sizes are realistic
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    frames = []
+    for i in range(count):
+        frame = np.broadcast_to(x[None, :, None], (height, width, 3)).copy()
+        frame[:, :, i % 3] *= (i + 1) / count
+        left = (i * width // count) % (width - 80)
+        frame[height // 3:height // 3 + 80, left:left + 80] = (40 * i) % 255
+        frames.append((frame + rng.normal(0, 8, frame.shape)).clip(0, 255).astype(np.uint8))
+    return frames
+
+
+def video_frames(path, count):
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    frames = []
+    for index in np.linspace(0, total - 1, count).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ok, frame = cap.read()
+        if ok:
+            frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read frames from {path}")
+    return frames
+
+
+def legacy_hstack(frames):
+    return encode_jpeg_base64(np.hstack(frames), quality=90)[0]
+
+
+def legacy_grid(frames):
+    half = len(frames) // 2
+    return encode_jpeg_base64(np.vstack([np.hstack(frames[:half]), np.hstack(frames[half:half * 2])]), quality=90)[0]
+
+
+def median_ms(fn, iters):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, float(np.median(samples)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=6)
+    parser.add_argument("--video", help="take the frames from this video instead of synthetic ones")
+    args = parser.parse_args()
+
+    frames = video_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames)
+    height, width = frames[0].shape[:2]
+    scores = np.linspace(1.0, 0.1, len(frames))
+
+    print(f"{len(frames)} frames of {width}x{height}, median of {args.iters} runs")
+    print(f"{'mosaic':<34}{'layout':>7}{'size':>11}{'q':>4}{'payload':>10}{'tokens':>8}{'ms':>8}")
+
+    for name, build, layout, size in [
+            ("legacy hstack", legacy_hstack, f"1x{len(frames)}", (width * len(frames), height)),
+            ("legacy 2-row grid", legacy_grid, f"2x{len(frames) // 2}", (width * (len(frames) // 2), height * 2))]:
+        payload, ms = median_ms(lambda: build(frames), args.iters)
+        print(f"{name:<34}{layout:>7}{f'{size[0]}x{size[1]}':>11}{90:>4}{len(payload):>10}"
+              f"{estimate_tokens(*size):>8}{ms:>8.2f}")
+
+    budgets = [
+        ("composer, no budget", {}),
+        ("composer, 1M pixels", {"max_pixels": 1_000_000}),
+        ("composer, 300 KB", {"max_bytes": 300_000}),
+        ("composer, 100 KB", {"max_bytes": 100_000}),
+        ("composer, 258 tokens", {"max_tokens": 258}),
+        ("composer, 516 tokens + 200 KB", {"max_tokens": 516, "max_bytes": 200_000}),
+        ("composer, 4 most novel tiles", {"max_tiles": 4, "order": "novelty"}),
+    ]
+    for name, budget in budgets:
+        composer = MosaicComposer(**budget)
+        (payload, _, report), ms = median_ms(lambda: composer.compose(frames, scores=scores), args.iters)
+        size = f"{report['size'][0]}x{report['size'][1]}"
+        print(f"{name:<34}{report['layout']:>7}{size:>11}{report['quality']:>4}{len(payload):>10}"
+              f"{report['estimated_tokens']:>8}{ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark: motion estimation backends against the full-resolution Farneback gate.
+
+Runs every backend in motion.BACKENDS on pairs of gray 640x360 frames taken from recorded clips
+(--video, repeatable) and/or the synthetic footage of bench_adaptive_sampling (static scene with
+an object crossing, a pan and a shaky blurred stretch, plus sensor noise; used when no --video is
+given, or with --synthetic). Each frame is paired with the frame --stride frames earlier, like the
+sampler feeding the motion stage.
+
+Reports per backend: median / p95 latency, correlation with Farneback's magnitude (log scale),
+and agreement of the gate decision (magnitude > --threshold) with Farneback, after the backend's
+calibration. --calibrate fits the calibrations (motion.calibrate) on these pairs first, reports
+with them and prints them for motion.BACKENDS or MOTION_OFFSET / MOTION_SCALE.
+
+Usage: python benchmarks/bench_motion.py [--video clip.mp4] [--synthetic] [--seconds 90] [--stride 5] [--calibrate]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_adaptive_sampling import synthetic_footage, video_footage
+from motion import BACKENDS, calibrate
+
+
+def clips(args):
+    """One iterator of gray frames per clip."""
+    for path in args.video or []:
+        yield (cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in video_footage(path))
+    if args.synthetic or not args.video:
+        rng = np.random.default_rng(1)
+        yield (np.clip(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) + rng.normal(0, args.noise, frame.shape[:2]),
+                       0, 255).astype(np.uint8)
+               for frame in synthetic_footage(args.seconds, args.fps, size=(640, 360)))
+
+
+def frame_pairs(args):
+    for frames in clips(args):
+        history = []
+        for index, gray in enumerate(frames):
+            history.append(gray)
+            if len(history) > args.stride:
+                history.pop(0)
+                if index % args.step == 0:
+                    yield history[0], gray
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", action="append", help="recorded clip (repeatable)")
+    parser.add_argument("--synthetic", action="store_true", help="add the synthetic clip to --video clips")
+    parser.add_argument("--seconds", type=float, default=90, help="length of the synthetic clip")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--noise", type=float, default=2.0, help="sensor noise sigma of the synthetic clip")
+    parser.add_argument("--stride", type=int, default=5, help="frames between the two frames of a pair")
+    parser.add_argument("--step", type=int, default=3, help="use every step-th frame as a pair's second frame")
+    parser.add_argument("--threshold", type=float, default=0.05)
+    parser.add_argument("--calibrate", action="store_true")
+    args = parser.parse_args()
+
+    pairs = list(frame_pairs(args))
+    values = {name: [] for name in BACKENDS}
+    latencies = {name: [] for name in BACKENDS}
+    for gray1, gray2 in pairs:
+        for name, (estimate, _, _) in BACKENDS.items():
+            start = time.perf_counter()
+            value = estimate(gray1, gray2)
+            latencies[name].append(time.perf_counter() - start)
+            values[name].append(value)
+
+    reference = np.array(values["farneback"])
+    moved = reference > args.threshold
+    print(f"{len(pairs)} frame pairs, stride {args.stride}; farneback above {args.threshold}: "
+          f"{int(moved.sum())} ({moved.mean():.0%})")
+    print(f"{'backend':<17}{'offset':>8}{'scale':>8}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}{'log corr':>10}"
+          f"{'agree':>8}{'missed':>8}{'extra':>7}")
+    baseline_ms = np.median(latencies["farneback"]) * 1000
+    fitted = {}
+    for name, (_, offset, scale) in BACKENDS.items():
+        raw = np.array(values[name])
+        if args.calibrate and name != "farneback":
+            offset, scale, _ = calibrate(raw, reference, args.threshold)
+            fitted[name] = (offset, scale)
+        estimate = np.maximum(raw - offset, 0) * scale
+        log_corr = np.corrcoef(np.log(reference + 1e-3), np.log(estimate + 1e-3))[0, 1]
+        gate = estimate > args.threshold
+        p50_ms = np.median(latencies[name]) * 1000
+        print(f"{name:<17}{offset:>8.3f}{scale:>8.3f}{p50_ms:>9.2f}{np.percentile(latencies[name], 95) * 1000:>9.2f}"
+              f"{baseline_ms / p50_ms:>8.1f}x{log_corr:>10.3f}{(gate == moved).mean():>8.1%}"
+              f"{int((moved & ~gate).sum()):>8}{int((gate & ~moved).sum()):>7}")
+    if fitted:
+        print("\nCalibration (offset, scale):")
+        for name, (offset, scale) in fitted.items():
+            print(f'    "{name}": ({name}, {offset:.4f}, {scale:.4f}),')
+
+
+if __name__ == "__main__":
+    main()
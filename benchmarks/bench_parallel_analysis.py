@@ -0,0 +1,138 @@
+"""Benchmark: frame analysis throughput, sequential vs ParallelFrameAnalyzer with N worker processes.
+
+Runs the capture loop's filter pipeline (frame_diff -> clarity -> motion -> pHash/embedding
+novelty) over a synthetic panning stream with static and blurred stretches, and checks that
+every parallel run accepts exactly the same frames as the sequential one.
+
+Usage: python benchmarks/bench_parallel_analysis.py [--frames 300] [--workers 1,2,4,8] [--no-features] [--no-pretrained]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_index import EmbeddingIndex
+from frame_filters import (FilterStage, FrameContext, FramePipeline, clarity_stage, frame_difference_stage,
+                           get_phash, motion_stage)
+from frame_quality import hamming_distances
+from parallel_analysis import ParallelFrameAnalyzer
+
+
+def synthetic_stream(count, size=(1280, 720), seed=0):
+    """Pan across a random texture; every third stretch of 20 frames is static or blurred."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    texture = cv2.GaussianBlur(rng.integers(0, 256, (height * 2, width * 3, 3), dtype=np.uint8), (3, 3), 0)
+    blurred = cv2.GaussianBlur(texture, (31, 31), 0)
+    x = y = 0
+    for i in range(count):
+        phase = (i // 20) % 6
+        if phase == 2:
+            pass  # static camera
+        else:
+            x = (x + int(rng.integers(4, 40))) % (texture.shape[1] - width)
+            y = (y + int(rng.integers(-8, 9))) % (texture.shape[0] - height)
+        source = blurred if phase == 4 else texture
+        yield i, source[y:y + height, x:x + width]
+
+
+class Novelty:
+    """Same novelty rule as the capture loop: pHash first, embeddings only when pHash can't decide."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.frames = EmbeddingIndex(dim=512, capacity=60)
+        self.hashes = deque(maxlen=60)
+
+    def features(self, ctx):
+        return ctx.get("features", lambda c: self.engine.embed([c.resized])[0].numpy())
+
+    def check(self, ctx, reference):
+        phash = ctx.get("phash", lambda c: get_phash(c.resized))
+        if not self.hashes or hamming_distances(phash, self.hashes).min() > 5:
+            return True
+        return self.frames.is_novel(self.features(ctx), threshold=0.9)
+
+    def remember(self, ctx):
+        self.hashes.append(ctx.get("phash", lambda c: get_phash(c.resized)))
+        self.frames.add(self.features(ctx), payload=ctx.index)
+
+
+def build_pipeline(novelty):
+    return FramePipeline([
+        frame_difference_stage(diff_threshold=1.5, cost=1.0),
+        clarity_stage(cost=3.0),
+        motion_stage(cost=10.0),
+        FilterStage("novelty", novelty.check, cost=50.0),
+    ])
+
+
+def run(frames, engine, workers, features, embedding):
+    novelty = Novelty(engine)
+    pipeline = build_pipeline(novelty)
+    accepted = []
+    analyzer = None
+    if workers:
+        analyzer = ParallelFrameAnalyzer(workers=workers, features=features, embedding=embedding)
+        # Let the workers start (and load their models) before timing
+        for index, frame in synthetic_stream(2 * workers, seed=1):
+            analyzer.submit(frame, -1)
+        list(analyzer.drain())
+
+    def merge(ctx):
+        keep, _ = pipeline.run(ctx)
+        if keep:
+            novelty.remember(ctx)
+            accepted.append(ctx.index)
+            if analyzer is not None:
+                analyzer.set_reference(ctx)
+
+    start = time.perf_counter()
+    for index, frame in synthetic_stream(frames):
+        if analyzer is None:
+            merge(FrameContext(frame, index=index))
+        else:
+            analyzer.submit(frame, index)
+            for ctx in analyzer.results():
+                merge(ctx)
+    if analyzer is not None:
+        for ctx in analyzer.drain():
+            merge(ctx)
+    elapsed = time.perf_counter() - start
+
+    stats = analyzer.stats() if analyzer else None
+    if analyzer is not None:
+        analyzer.close()
+    return accepted, frames / elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--no-features", action="store_true", help="compute embeddings in the merge stage only")
+    parser.add_argument("--no-pretrained", action="store_true", help="random weights (no download)")
+    args = parser.parse_args()
+
+    from embedding_engine import EmbeddingEngine
+
+    embedding = {"pretrained": not args.no_pretrained}
+    engine = EmbeddingEngine(**embedding)
+    print(f"{os.cpu_count()} CPUs, {args.frames} frames")
+    print(f"{'mode':<12}{'frames/s':>10}{'speed-up':>10}{'accepted':>10}{'same':>6}  motion reused/missed")
+
+    baseline, baseline_fps, _ = run(args.frames, engine, 0, False, embedding)
+    print(f"{'sequential':<12}{baseline_fps:>10.1f}{1.0:>10.2f}{len(baseline):>10}{'-':>6}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        accepted, fps, stats = run(args.frames, engine, workers, not args.no_features, embedding)
+        print(f"{f'{workers} workers':<12}{fps:>10.1f}{fps / baseline_fps:>10.2f}{len(accepted):>10}"
+              f"{str(accepted == baseline):>6}  {stats['motion_reused']}/{stats['motion_missed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""Offline replay benchmark for the capture loop and /analyze-environment.
+
+Drives llama-gemini.py's main() loop and vision-service.py's capture_and_analyze_environment from a
+recorded video file (or a synthetic clip written to a temporary file: a static scene with an object
+crossing every 12 s, a camera pan at 40-50 s and a shaky blurred stretch at 80-85 s), with Gemini
+replaced by the local stub server. No camera, network or display is needed.
+
+Reports per-stage latency percentiles, frames/sec, accept ratios and peak memory. Each scenario runs
+in a fresh interpreter (in a scratch working directory) so peak RSS and module state are its own.
+Configuration is read from the environment as usual, e.g. ANALYSIS_WORKERS=2, FRAME_SAMPLING=fixed
+or EMBEDDING_BACKEND=torchscript, and recorded in the results. --deadline-ms gives every environment
+analysis that latency budget and reports how often it was met and which degradations were applied.
+
+--json writes the results, tagged with the git commit, for tracking regressions between commits;
+--compare prints the change of each latency / throughput / memory figure against an earlier --json
+file and exits with status 1 if one got worse by more than --tolerance.
+
+Usage: python benchmarks/bench_replay.py [--video clip.mp4] [--seconds 60] [--scenarios capture_loop,environment_analysis]
+           [--requests 10] [--stub-latency 0.5] [--deadline-ms 1500] [--no-pretrained] [--tracemalloc]
+           [--json out.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench_adaptive_sampling import synthetic_footage
+from gemini_stub import start_stub_server
+
+SCENARIOS = ("capture_loop", "environment_analysis")
+CONFIG_VARS = ("ANALYSIS_WORKERS", "FRAME_SAMPLING", "SAMPLE_MIN_FPS", "SAMPLE_MAX_FPS", "SAMPLE_CPU_BUDGET",
+               "EMBEDDING_BACKEND", "EMBEDDING_PRETRAINED", "MOTION_BACKEND", "MOSAIC_JPEG_QUALITY", "MOSAIC_MAX_DIM",
+               "ARCHIVE_MOSAICS", "CHANGE_DETECTION", "CHANGE_GRID")
+# Figures compared by --compare, and whether higher is better
+HIGHER_IS_BETTER = {"fps": True, "p50_ms": False, "p95_ms": False, "peak_rss_mb": False, "peak_traced_mb": False}
+
+
+def percentiles_ms(samples):
+    values = sorted(samples)
+
+    def percentile(p):
+        if not values:
+            return None
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 3)
+
+    return {"calls": len(values), "p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+            "max_ms": percentile(1.0), "total_ms": round(sum(values) * 1000, 2)}
+
+
+# Wall-clock samples for functions the scripts look up as module globals (or instance attributes)
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, module, attr, name=None):
+        function = getattr(module, attr)
+        samples = self.samples[name or attr]
+        if asyncio.iscoroutinefunction(function):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        setattr(module, attr, timed)
+
+    def stats(self):
+        return {name: percentiles_ms(samples) for name, samples in self.samples.items()}
+
+
+def load_script(filename, name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_memory():
+    memory = {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    if tracemalloc.is_tracing():
+        memory["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    return memory
+
+
+def run_capture_loop(args):
+    """llama-gemini.py main() over the recording, headless."""
+    module = load_script("llama-gemini.py", "llama_gemini")
+    module.embedding_model.get()  # model load is reported by bench_startup.py, not here
+    timer = StageTimer()
+    timer.wrap(module, "get_frame_features", "embed")
+    timer.wrap(module, "get_phash", "phash")
+    timer.wrap(module, "phash_batch", "phash_batch")
+    timer.wrap(module, "save_combined_image", "mosaic")
+    timer.wrap(module.mosaic_composer, "compose", "encode")
+    timer.wrap(module, "process_image_with_gemini", "gemini")
+
+    summary = module.main(args.video, display=False, max_frames=args.max_frames)
+    if summary is None:
+        raise SystemExit(f"Couldn't open {args.video}")
+    stages = summary.pop("stages")
+    stages.update(timer.stats())
+    return dict(
+        summary,
+        fps=round(summary["frames_read"] / summary["loop_seconds"], 1),
+        analysed_fps=round(summary["frames_analysed"] / summary["loop_seconds"], 1),
+        accept_ratio=round(summary["frames_accepted"] / max(summary["frames_analysed"], 1), 3),
+        stages=stages,
+        gemini=module.gemini_client.metrics(),
+        **peak_memory(),
+    )
+
+
+def run_environment_analysis(args):
+    """vision-service.py capture_and_analyze_environment(), --requests times on the recording."""
+    module = load_script("vision-service.py", "vision_service")
+    module.embedding_model.get()
+    timer = StageTimer()
+    timer.wrap(module.capture_pool, "get_frames", "capture")
+    timer.wrap(module, "capture_within_deadline", "capture")
+    timer.wrap(module, "get_frames_features", "embed")
+    timer.wrap(module, "phash_batch", "phash_batch")
+    timer.wrap(module.result_cache, "lookup", "cache_lookup")
+    timer.wrap(module.mosaic_composer, "compose", "encode")
+    timer.wrap(module.compact_composer, "compose", "encode")
+    timer.wrap(module, "process_image_with_gemini", "gemini")
+
+    latencies = []
+    cached = errors = met = 0
+    degradations = defaultdict(int)
+    for i in range(args.requests):
+        start = time.perf_counter()
+        result = module.capture_and_analyze_environment(args.video, deadline=module.Deadline.from_ms(args.deadline_ms))
+        latencies.append(time.perf_counter() - start)
+        cached += bool(result.get("cached"))
+        errors += "error" in result
+        met += bool(result.get("budget", {}).get("met"))
+        for name in result.get("degradations", []):
+            degradations[name] += 1
+        time.sleep(args.interval)
+
+    capture = module.capture_pool.stats()[0]
+    sampled = (capture["sampling"] or {}).get("frames_sampled") or capture["frames_buffered"] + capture["frames_rejected"]
+    module.camera_registry.shutdown()
+    module.capture_pool.shutdown()
+    if module.archiver is not None:
+        module.archiver.close()
+    return {
+        "requests": args.requests,
+        "cached": cached,
+        "errors": errors,
+        "cold_request_ms": round(latencies[0] * 1000, 1),
+        "request": percentiles_ms(latencies[1:] or latencies),
+        "frames_read": capture["frames_read"],
+        "frames_checked": sampled,
+        "frames_buffered": capture["frames_buffered"],
+        "accept_ratio": round(capture["frames_buffered"] / max(sampled, 1), 3),
+        "sampling": capture["sampling"],
+        "stages": timer.stats(),
+        "gemini": module.gemini_client.metrics(),
+        "result_cache": module.result_cache.stats(),
+        "deadline": {"deadline_ms": args.deadline_ms, "met": met, "degradations": dict(degradations)}
+        if args.deadline_ms else None,
+        **peak_memory(),
+    }
+
+
+def run_scenario(args):
+    if args.tracemalloc:
+        tracemalloc.start()
+    scenario = {"capture_loop": run_capture_loop, "environment_analysis": run_environment_analysis}[args.scenario]
+    result = scenario(args)
+    sys.stdout.flush()
+    print("RESULT " + json.dumps(result))
+
+
+def write_synthetic_clip(path, seconds, fps, size):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        raise SystemExit("No mp4v encoder available; pass --video")
+    for frame in synthetic_footage(seconds, fps, size=size):
+        writer.write(frame)
+    writer.release()
+
+
+def describe_source(path):
+    cap = cv2.VideoCapture(path)
+    source = {
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+        "size": [int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))],
+    }
+    cap.release()
+    return source
+
+
+def git_revision():
+    def git(*command):
+        output = subprocess.run(["git", *command], cwd=ROOT, capture_output=True, text=True)
+        return output.stdout.strip() if output.returncode == 0 else None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def spawn(scenario, args, env, workdir):
+    command = [sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--video", args.video,
+               "--requests", str(args.requests), "--interval", str(args.interval),
+               "--deadline-ms", str(args.deadline_ms)]
+    if args.max_frames:
+        command += ["--max-frames", str(args.max_frames)]
+    if args.tracemalloc:
+        command.append("--tracemalloc")
+    output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if args.verbose:
+        print(output.stdout, output.stderr)
+    for line in reversed(output.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    print(output.stdout[-4000:], output.stderr[-4000:])
+    raise SystemExit(f"Scenario {scenario} failed")
+
+
+def flatten(tree, prefix=""):
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(previous, current, tolerance):
+    """Print the compared figures; returns the names of those that regressed."""
+    old = dict(flatten(previous["scenarios"]))
+    regressions = []
+    print(f"\nAgainst {previous.get('commit') or 'previous run'} (tolerance {tolerance:.0%}):")
+    for name, value in flatten(current["scenarios"]):
+        higher_is_better = HIGHER_IS_BETTER.get(name.rsplit(".", 1)[-1])
+        if higher_is_better is None or not old.get(name):
+            continue
+        change = (value - old[name]) / old[name]
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<52}{old[name]:>11.2f}{value:>11.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def report(results):
+    for scenario, result in results["scenarios"].items():
+        print(f"\n{scenario}: peak RSS {result['peak_rss_mb']} MB"
+              + (f", peak traced {result['peak_traced_mb']} MB" if "peak_traced_mb" in result else ""))
+        if scenario == "capture_loop":
+            print(f"  {result['frames_read']} frames read at {result['fps']} frames/s, "
+                  f"{result['frames_analysed']} analysed, {result['frames_accepted']} accepted "
+                  f"(ratio {result['accept_ratio']}), {result['mosaics']} mosaics")
+            decode = result.get("decode")
+            if decode:
+                print(f"  decoding: {decode['mode']} 1/{decode['scale']}, {decode['retrieved']} of "
+                      f"{decode['grabbed']} frames retrieved, {decode['decode_saved_seconds']} s "
+                      f"({decode['decode_saved_fraction']:.0%}) saved")
+        else:
+            print(f"  {result['requests']} requests ({result['cached']} cached, {result['errors']} errors), "
+                  f"cold {result['cold_request_ms']} ms, warm p50 {result['request']['p50_ms']} ms "
+                  f"p95 {result['request']['p95_ms']} ms, frame accept ratio {result['accept_ratio']}")
+            deadline = result.get("deadline")
+            if deadline:
+                applied = ", ".join(f"{name} x{count}" for name, count in deadline["degradations"].items()) or "none"
+                print(f"  deadline {deadline['deadline_ms']:g} ms met by {deadline['met']} of {result['requests']}, "
+                      f"degradations: {applied}")
+        print(f"  {'stage':<16}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>11}")
+        for name, stage in result["stages"].items():
+            print(f"  {name:<16}{stage['calls']:>8}{stage['p50_ms'] or 0:>10}{stage['p95_ms'] or 0:>10}"
+                  f"{stage['total_ms']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="recorded footage to replay (default: synthetic clip)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="synthetic clip length")
+    parser.add_argument("--fps", type=float, default=30.0, help="synthetic clip frame rate")
+    parser.add_argument("--size", default="640x360", help="synthetic clip frame size")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--max-frames", type=int, help="stop the capture loop after this many frames")
+    parser.add_argument("--requests", type=int, default=10, help="environment analyses to run")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between environment analyses")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="stub Gemini response time (s)")
+    parser.add_argument("--deadline-ms", type=float, default=0, help="latency budget per environment analysis")
+    parser.add_argument("--no-pretrained", action="store_true", help="random weights (no download)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations (slower)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' own output")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)  # run one scenario in-process
+    args = parser.parse_args()
+
+    if args.scenario:
+        return run_scenario(args)
+
+    with tempfile.TemporaryDirectory(prefix="bench-replay-") as workdir:
+        synthetic = None
+        if not args.video:
+            width, height = (int(v) for v in args.size.split("x"))
+            synthetic = {"seconds": args.seconds, "fps": args.fps, "size": [width, height]}
+            args.video = os.path.join(workdir, "synthetic.mp4")
+            write_synthetic_clip(args.video, args.seconds, args.fps, (width, height))
+        args.video = os.path.abspath(args.video)
+
+        base_url, stub, stop = start_stub_server(latency=args.stub_latency)
+        env = dict(os.environ, GEMINI_API_BASE=base_url, GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "stub"),
+                   MODEL_CACHE_DIR=os.getenv("MODEL_CACHE_DIR", os.path.join(ROOT, ".model_cache")),
+                   PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+        if args.no_pretrained:
+            env["EMBEDDING_PRETRAINED"] = "0"
+
+        results = dict(
+            git_revision(),
+            benchmark="replay",
+            created=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+            source=dict(describe_source(args.video), video=None if synthetic else args.video, synthetic=synthetic),
+            config={name: env.get(name) for name in CONFIG_VARS},
+            stub_latency=args.stub_latency,
+            deadline_ms=args.deadline_ms or None,
+            scenarios={},
+        )
+        try:
+            for scenario in args.scenarios.split(","):
+                requests_before = stub.requests
+                print(f"Running {scenario}...")
+                results["scenarios"][scenario] = spawn(scenario, args, env, workdir)
+                results["scenarios"][scenario]["stub_requests"] = stub.requests - requests_before
+        finally:
+            stop()
+
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
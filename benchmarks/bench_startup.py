@@ -0,0 +1,59 @@
+"""Measure vision-service start-up: time until /health answers and until /ready reports the model loaded.
+
+Each run imports vision-service.py in a fresh interpreter. Run it twice to see the effect of the
+TorchScript trunk cache (MODEL_CACHE_DIR, default .model_cache/) on the second boot.
+
+Usage: python benchmarks/bench_startup.py [--runs 2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import importlib.util, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, ROOT)
+spec = importlib.util.spec_from_file_location("vision_service", ROOT + "/vision-service.py")
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+client = module.app.test_client()
+client.get("/health")
+live = time.perf_counter() - start
+module.embedding_model.warm_up()
+while client.get("/ready").status_code != 200:
+    if module.embedding_model.error:
+        break
+    time.sleep(0.01)
+ready = time.perf_counter() - start
+print(json.dumps({"live_seconds": live, "ready_seconds": ready,
+                  "model_load_seconds": module.embedding_model.load_seconds,
+                  "error": module.embedding_model.error}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'run':>4}{'live s':>9}{'ready s':>9}{'model s':>9}")
+    for run in range(1, args.runs + 1):
+        output = subprocess.run(
+            [sys.executable, "-c", f"ROOT = {ROOT!r}\n" + PROBE],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        try:
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            print(output.stdout, output.stderr)
+            raise SystemExit("probe failed")
+        print(f"{run:>4}{result['live_seconds']:>9.2f}{result['ready_seconds']:>9.2f}"
+              f"{result['model_load_seconds'] or 0:>9.2f}" + (f"  error: {result['error']}" if result['error'] else ""))
+
+
+if __name__ == "__main__":
+    main()
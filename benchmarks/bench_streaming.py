@@ -0,0 +1,95 @@
+"""Benchmark: time to first text (streaming) vs time to the full response (blocking JSON).
+
+By default runs GeminiClient against the local stub, which generates its response in --latency
+seconds and streams it in --chunks pieces. With --service, measures a running vision service
+instead: POST /analyze-environment against the first and last events of
+/analyze-environment/stream (start the service with GEMINI_API_BASE pointing at
+`python benchmarks/gemini_stub.py` to keep Gemini out of the numbers).
+
+Usage: python benchmarks/bench_streaming.py [--requests 10] [--latency 2.0] [--chunks 20]
+       python benchmarks/bench_streaming.py --service http://localhost:5000 [--video-url URL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sse
+from gemini_client import GeminiClient
+from gemini_stub import start_stub_server
+
+TEXT = ("A wooden desk by a window with a laptop, a half-empty coffee mug and a stack of papers. "
+        "Warm afternoon light falls across the keyboard and a green plant sits in the corner. ") * 3
+
+
+def percentiles(samples):
+    values = sorted(samples)
+    return {p: values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000 for p in (50, 95)}
+
+
+async def client_run(args):
+    base_url, _, stop = start_stub_server(latency=args.latency, chunks=args.chunks, text=TEXT)
+    client = GeminiClient(api_key="stub", base_url=base_url)
+    blocking, first, last = [], [], []
+    try:
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            await client.generate("Describe the scene")
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            async for _ in client.stream("Describe the scene"):
+                if len(first) < len(last) + 1:
+                    first.append(time.perf_counter() - start)
+            last.append(time.perf_counter() - start)
+    finally:
+        client.close()
+        stop()
+    return blocking, first, last
+
+
+async def service_run(args):
+    blocking, first, last = [], [], []
+    body = {"video_url": args.video_url}
+    async with aiohttp.ClientSession() as session:
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            async with session.post(f"{args.service}/analyze-environment", json=body) as response:
+                await response.read()
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            async with session.post(f"{args.service}/analyze-environment/stream", json=body) as response:
+                lines = []
+                async for raw in response.content:
+                    lines.append(raw.decode("utf-8"))
+                    if len(first) < len(last) + 1 and any(event == "chunk" for event, _ in sse.parse_events(lines)):
+                        first.append(time.perf_counter() - start)
+            last.append(time.perf_counter() - start)
+    return blocking, first, last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=2.0, help="stub generation time (s)")
+    parser.add_argument("--chunks", type=int, default=20, help="stub stream events per response")
+    parser.add_argument("--service", help="base URL of a running vision service")
+    parser.add_argument("--video-url", default="http://10.52.26.19:8080/video")
+    args = parser.parse_args()
+
+    run = service_run if args.service else client_run
+    blocking, first, last = asyncio.run(run(args))
+    print(f"{'mode':<28}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, samples in (("blocking: full response", blocking), ("streaming: first text", first),
+                          ("streaming: full response", last)):
+        stats = percentiles(samples)
+        print(f"{name:<28}{stats[50]:>9.0f}{stats[95]:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
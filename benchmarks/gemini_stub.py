@@ -0,0 +1,116 @@
+"""Local stand-in for the Gemini generateContent endpoint.
+
+Point the client at it with GEMINI_API_BASE=http://127.0.0.1:<port>. Supports a fixed
+response latency and failure injection (the first N requests get an error status).
+streamGenerateContent?alt=sse is answered with the text split into --chunks events: the first after
+--first-token seconds (default: latency / chunks), the last at the full latency, like a model that
+generates the whole response in that time.
+
+Usage: python benchmarks/gemini_stub.py [--port 8089] [--latency 0.5] [--chunks 8] [--first-token 0.1]
+           [--fail-first 0] [--fail-status 503]
+"""
+import argparse
+import asyncio
+import json
+import threading
+
+from aiohttp import web
+
+
+class GeminiStub:
+    def __init__(self, latency=0.0, fail_first=0, fail_status=503, text="A stub description of the scene.",
+                 chunks=8, first_token=None):
+        self.latency = latency
+        self.chunks = chunks
+        self.first_token = first_token
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.text = text
+        self.requests = 0
+        self.payload_bytes = 0
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/models/{call}", self.handle)
+        return app
+
+    async def handle(self, request):
+        body = await request.read()
+        self.requests += 1
+        self.payload_bytes += len(body)
+        if self.requests <= self.fail_first:
+            return web.json_response({"error": {"code": self.fail_status}}, status=self.fail_status,
+                                     headers={"Retry-After": "0"})
+        if request.match_info["call"].endswith(":streamGenerateContent"):
+            return await self.stream(request)
+        await asyncio.sleep(self.latency)
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": self.text}]}}]})
+
+    def split_text(self):
+        words = self.text.split(" ")
+        count = max(1, min(self.chunks, len(words)))
+        bounds = [round(i * len(words) / count) for i in range(count + 1)]
+        return [" ".join(words[a:b]) + (" " if b < len(words) else "") for a, b in zip(bounds, bounds[1:])]
+
+    async def stream(self, request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        parts = self.split_text()
+        first = self.first_token if self.first_token is not None else self.latency / len(parts)
+        step = (self.latency - first) / (len(parts) - 1) if len(parts) > 1 else 0.0
+        try:
+            for i, text in enumerate(parts):
+                await asyncio.sleep(first if i == 0 else max(step, 0.0))
+                event = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+                await response.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+            await response.write_eof()
+        except ConnectionResetError:
+            pass  # the client stopped reading
+        return response
+
+
+# Run the stub on a background thread; returns (base_url, stub, stop)
+def start_stub_server(host="127.0.0.1", port=0, **stub_kwargs):
+    stub = GeminiStub(**stub_kwargs)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def start():
+        runner = web.AppRunner(stub.make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        state["runner"] = runner
+        state["port"] = runner.addresses[0][1]
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="gemini-stub", daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(state["runner"].cleanup(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    return f"http://{host}:{state['port']}", stub, stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--first-token", type=float)
+    args = parser.parse_args()
+    stub = GeminiStub(args.latency, args.fail_first, args.fail_status, chunks=args.chunks, first_token=args.first_token)
+    print(f"Gemini stub listening on http://127.0.0.1:{args.port}")
+    web.run_app(stub.make_app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import deque
+
+POLICIES = ("weighted", "round_robin")
+CAMERA_FIELDS = ("camera_id", "video_url", "weight", "interval", "num_frames")
+# camera_id also names the camera's archived mosaics, so it must be safe in a filename
+CAMERA_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _percentiles_ms(samples):
+    values = sorted(samples)
+
+    def percentile(p):
+        if not values:
+            return None
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1)
+
+    return {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+
+
+# One registered stream and its scheduling state / statistics
+class Camera:
+    def __init__(self, camera_id, video_url, weight=1, interval=30.0, num_frames=4):
+        self.camera_id = camera_id
+        self.video_url = video_url
+        self.weight = weight
+        self.interval = interval
+        self.num_frames = num_frames
+
+        self.added_at = time.monotonic()
+        self.next_due = self.added_at
+        self.in_flight = False
+        self.current_weight = 0  # smooth weighted round-robin state
+        self.reader = None        # capture worker the scheduler last started for this camera
+        self.open_failures = 0    # readers in a row that stopped without connecting
+        self.reconnect_at = 0.0   # no new reader before this (backoff)
+
+        self.analyses = 0
+        self.cached = 0
+        self.failed = 0
+        self.starved = 0  # due, but no fresh frames buffered yet
+        self.completed_at = deque(maxlen=200)
+        self.schedule_lag = deque(maxlen=200)  # seconds between due and started
+        self.frame_age = deque(maxlen=200)     # age of the newest frame when analysed
+        self.latency = deque(maxlen=200)       # started until result
+        self.last_result = None
+        self.last_error = None
+
+    def stats(self, window=300.0):
+        now = time.monotonic()
+        recent = sum(1 for t in self.completed_at if now - t <= window)
+        elapsed = min(window, now - self.added_at)
+        return {
+            "camera_id": self.camera_id,
+            "video_url": self.video_url,
+            "weight": self.weight,
+            "interval": self.interval,
+            "in_flight": self.in_flight,
+            "analyses": self.analyses,
+            "cached": self.cached,
+            "failed": self.failed,
+            "starved": self.starved,
+            "open_failures": self.open_failures,
+            "analyses_per_minute": round(recent / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "schedule_lag_ms": _percentiles_ms(self.schedule_lag),
+            "frame_age_ms": _percentiles_ms(self.frame_age),
+            "latency_ms": _percentiles_ms(self.latency),
+            "next_due_in": round(max(self.next_due - now, 0.0), 1),
+            "last_error": self.last_error,
+        }
+
+
+# Runs periodic analyses for many cameras in one process.
+# Frames come from the shared CaptureWorkerPool (one reader per URL, kept alive while the camera
+# is registered). A scheduler thread picks due cameras by smooth weighted round-robin (or plain
+# round-robin), embeds all of their frames in one batched forward pass, builds each mosaic with
+# prepare(frames, features, camera_id) and awaits describe(base64_image, prompt) on its own loop.
+# At most max_in_flight analyses run at once; when cameras are due faster than that, each
+# gets a share of the budget proportional to its weight and the rest shows up as schedule lag.
+# A stream that keeps failing to open is retried after retry_delay, doubling up to max_backoff.
+class CameraRegistry:
+    def __init__(self, capture_pool, prepare, describe, finish, embed=None, policy="weighted",
+                 max_batch=4, max_in_flight=4, retry_delay=2.0, max_backoff=60.0, frame_max_age=5.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}', expected one of {POLICIES}")
+        self.capture_pool = capture_pool
+        self.prepare = prepare
+        self.describe = describe
+        self.finish = finish
+        self.embed = embed
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.frame_max_age = frame_max_age
+
+        self.cameras = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.batches = 0
+        self.batched_frames = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._run_loop, name="camera-describe", daemon=True)
+        self._loop_thread.start()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._scheduler = threading.Thread(target=self._run, name="camera-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def add_camera(self, camera_id, video_url, weight=1, interval=30.0, num_frames=4):
+        if not camera_id or not video_url:
+            raise ValueError("camera_id and video_url are required")
+        if not isinstance(camera_id, str) or not CAMERA_ID_PATTERN.fullmatch(camera_id):
+            raise ValueError("camera_id must be 1-64 letters, digits, '_' or '-'")
+        if weight <= 0 or interval <= 0 or num_frames <= 0:
+            raise ValueError("weight, interval and num_frames must be positive")
+        camera = Camera(camera_id, video_url, weight=weight, interval=float(interval), num_frames=int(num_frames))
+        with self.lock:
+            if camera_id in self.cameras:
+                raise ValueError(f"Camera '{camera_id}' is already registered")
+            self.cameras[camera_id] = camera
+        camera.reader = self.capture_pool.get_worker(video_url)  # start connecting right away
+        print(f"Registered camera {camera_id} ({video_url}), weight {weight}, every {interval}s")
+        self._wakeup.set()
+        return camera
+
+    def add_from_config(self, config):
+        """add_camera() from a JSON object; unknown keys are rejected."""
+        if not isinstance(config, dict):
+            raise ValueError("Camera config must be a JSON object")
+        unknown = set(config) - set(CAMERA_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown camera fields: {sorted(unknown)}")
+        return self.add_camera(**config)
+
+    def load(self, path):
+        """Register every camera listed in a JSON file (a list of camera configs)."""
+        with open(path, 'r') as f:
+            configs = json.load(f)
+        return [self.add_from_config(config) for config in configs]
+
+    def remove_camera(self, camera_id):
+        with self.lock:
+            camera = self.cameras.pop(camera_id, None)
+            if camera is None:
+                return False
+            shared = any(other.video_url == camera.video_url for other in self.cameras.values())
+        if not shared:
+            self.capture_pool.remove(camera.video_url)
+        print(f"Removed camera {camera_id}")
+        return True
+
+    def _weight(self, camera):
+        return camera.weight if self.policy == "weighted" else 1
+
+    def _pick(self, due, count):
+        # Smooth weighted round-robin: over time each due camera is picked in proportion to its
+        # weight, without bursts of the same camera
+        picked = []
+        candidates = list(due)
+        while candidates and len(picked) < count:
+            total = sum(self._weight(camera) for camera in candidates)
+            for camera in candidates:
+                camera.current_weight += self._weight(camera)
+            best = max(candidates, key=lambda camera: camera.current_weight)
+            best.current_weight -= total
+            picked.append(best)
+            candidates.remove(best)
+        return picked
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            now = time.monotonic()
+            with self.lock:
+                cameras = list(self.cameras.values())
+                free = self.max_in_flight - self.in_flight
+            for camera in cameras:
+                self._keep_reader(camera, now)
+            due = [camera for camera in cameras if not camera.in_flight and camera.next_due <= now]
+            if due and free > 0:
+                try:
+                    self._run_batch(self._pick(due, min(free, self.max_batch)), now)
+                except Exception as e:
+                    print(f"Camera scheduler error: {e}")
+                continue
+            waiting = [camera.next_due for camera in cameras if not camera.in_flight]
+            timeout = min(waiting) - now if waiting and free > 0 else 1.0
+            self._wakeup.wait(min(max(timeout, 0.01), 1.0))
+
+    def _keep_reader(self, camera, now):
+        """Keep the camera's capture worker from being evicted, and start a new one when it has
+        stopped - after a backoff if it never managed to connect."""
+        worker = self.capture_pool.peek_worker(camera.video_url)
+        if worker is not None and worker.is_alive():
+            worker.last_access = now
+            if worker.opened.is_set():
+                camera.open_failures = 0
+            return
+        if camera.reader is not None:
+            if not camera.reader.opened.is_set():
+                camera.open_failures += 1
+                camera.last_error = camera.reader.error or "Couldn't open video stream"
+            camera.reader = None
+            backoff = self.retry_delay * 2 ** max(camera.open_failures - 1, 0)
+            camera.reconnect_at = now + min(backoff, self.max_backoff)
+        if now >= camera.reconnect_at:
+            camera.reader = self.capture_pool.get_worker(camera.video_url)
+
+    def _run_batch(self, cameras, now):
+        batch = []
+        for camera in cameras:
+            worker = self.capture_pool.peek_worker(camera.video_url)
+            frames = []
+            if worker is not None:
+                frames = worker.get_frames(camera.num_frames, timeout=0, max_age=self.frame_max_age)
+            if not frames:
+                camera.starved += 1
+                camera.next_due = now + self.retry_delay
+                continue
+            camera.schedule_lag.append(max(now - camera.next_due, 0.0))
+            camera.frame_age.append(worker.newest_frame_age() or 0.0)
+            batch.append((camera, frames))
+        if not batch:
+            return
+
+        # One forward pass for every camera picked this round
+        features = None
+        if self.embed is not None:
+            features = self.embed([frame for _, frames in batch for frame in frames])
+            self.batches += 1
+            self.batched_frames += len(features)
+
+        offset = 0
+        for camera, frames in batch:
+            camera_features = features[offset:offset + len(frames)] if features is not None else None
+            offset += len(frames)
+            started = time.monotonic()
+            camera.next_due = started + camera.interval
+            try:
+                result, pending = self.prepare(frames, camera_features, camera.camera_id)
+            except Exception as e:
+                self._record(camera, started, error=str(e))
+                continue
+            if pending is None:
+                self._record(camera, started, result)
+                continue
+            with self.lock:
+                camera.in_flight = True
+                self.in_flight += 1
+            asyncio.run_coroutine_threadsafe(self._describe(camera, pending, started), self.loop)
+
+    async def _describe(self, camera, pending, started):
+        try:
+            description = await self.describe(pending["base64_image"], pending["prompt"])
+            self._record(camera, started, self.finish(pending, description))
+        except Exception as e:
+            self._record(camera, started, error=str(e))
+        finally:
+            with self.lock:
+                camera.in_flight = False
+                self.in_flight -= 1
+            self._wakeup.set()
+
+    def _record(self, camera, started, result=None, error=None):
+        finished = time.monotonic()
+        camera.latency.append(finished - started)
+        camera.completed_at.append(finished)
+        if error is None and "error" in result:
+            error = result["error"]
+        if error is not None:
+            camera.failed += 1
+            camera.last_error = error
+            return
+        camera.analyses += 1
+        if result.get("cached"):
+            camera.cached += 1
+        camera.last_result = dict(result, camera_id=camera.camera_id,
+                                  timestamp=time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    def camera_status(self, camera_id):
+        """Stats and latest result of one camera, or None if it isn't registered."""
+        with self.lock:
+            camera = self.cameras.get(camera_id)
+        if camera is None:
+            return None
+        status = camera.stats()
+        status["last_result"] = camera.last_result
+        worker = self.capture_pool.peek_worker(camera.video_url)
+        status["capture"] = worker.stats() if worker is not None else None
+        return status
+
+    def stats(self):
+        with self.lock:
+            cameras = list(self.cameras.values())
+        return {
+            "policy": self.policy,
+            "cameras": len(cameras),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "batches": self.batches,
+            "mean_batch_frames": round(self.batched_frames / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def status(self):
+        with self.lock:
+            cameras = list(self.cameras.values())
+        return {"scheduler": self.stats(), "cameras": [camera.stats() for camera in cameras]}
+
+    def shutdown(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        self._scheduler.join(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join(timeout)
@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from adaptive_sampler import AdaptiveSampler
+from frame_quality import laplacian_variance
+from frame_source import FrameSource
+
+
+# Long-lived reader for a single video stream.
+# Keeps the stream open and fills a ring buffer with recent clear frames so
+# requests don't pay the MJPEG connect + decoder warm-up on every call.
+# Frames that aren't sampled are only grabbed, never decoded (see frame_source.FrameSource).
+# With sampler_options (AdaptiveSampler arguments) the frames that get resized and checked
+# follow how much the scene changes instead of a fixed frame_skip.
+# The newest reject_buffer frames the filter rejected are kept too, for requests that would
+# rather have a blurry frame than none (get_frames_relaxed).
+class CaptureWorker(threading.Thread):
+    def __init__(self, video_url, buffer_size=32, frame_skip=5, frame_size=(640, 360),
+                 frame_filter=None, reconnect_delay=1.0, sampler_options=None, diff_threshold=1.5,
+                 reject_buffer=8):
+        super().__init__(name=f"capture-{video_url}", daemon=True)
+        self.video_url = video_url
+        self.frame_skip = frame_skip
+        self.frame_size = frame_size
+        self.frame_filter = frame_filter
+        self.reconnect_delay = reconnect_delay
+        self.sampler = AdaptiveSampler(**sampler_options) if sampler_options is not None else None
+        self.diff_threshold = diff_threshold
+        self._previous_small = None
+
+        self.frames = deque(maxlen=buffer_size)  # (seq, captured_at, frame)
+        self.rejects = deque(maxlen=reject_buffer)  # (captured_at, frame, gray)
+        self.condition = threading.Condition()
+        self.opened = threading.Event()
+        self.stop_event = threading.Event()
+        self.error = None
+        self.last_access = time.monotonic()
+
+        self.frames_read = 0
+        self.frames_buffered = 0
+        self.frames_rejected = 0
+        self.reconnects = 0
+        self._seq = 0
+        self.source = None
+
+    def run(self):
+        cap = None
+        frame_counter = 0
+        try:
+            while not self.stop_event.is_set():
+                if cap is None:
+                    # One source for the worker's lifetime, so its decode counters survive reconnects
+                    if self.source is None:
+                        cap = self.source = FrameSource(self.video_url, size=self.frame_size)
+                    else:
+                        cap = self.source
+                        cap.open()
+                    if not cap.isOpened():
+                        cap.release()
+                        cap = None
+                        if not self.opened.is_set():
+                            # Never connected - give up so the next request retries from scratch
+                            self.error = "Couldn't open video stream"
+                            return
+                        self.reconnects += 1
+                        self.stop_event.wait(self.reconnect_delay)
+                        continue
+                    self.opened.set()
+
+                if not cap.grab():
+                    print(f"Capture worker lost {self.video_url}. Attempting to reconnect...")
+                    cap.release()
+                    cap = None
+                    continue
+
+                self.frames_read += 1
+                frame_counter += 1
+                if self.sampler is not None:
+                    if not self.sampler.should_sample():
+                        continue
+                elif frame_counter % self.frame_skip != 0:
+                    continue
+
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+
+                started = time.perf_counter()
+                frame_resized = frame if frame.shape[1::-1] == self.frame_size else cv2.resize(frame, self.frame_size)
+                gray_frame = None
+                if self.frame_filter is not None or self.sampler is not None:
+                    gray_frame = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2GRAY)
+                clear = self.frame_filter is None or self.frame_filter(gray_frame)
+                if self.sampler is not None:
+                    self._feed_sampler(gray_frame, clear, time.perf_counter() - started)
+                if not clear:
+                    self.frames_rejected += 1
+                    with self.condition:
+                        self.rejects.append((time.monotonic(), frame_resized, gray_frame))
+                        self.condition.notify_all()
+                    continue
+
+                with self.condition:
+                    self._seq += 1
+                    self.frames.append((self._seq, time.monotonic(), frame_resized))
+                    self.frames_buffered += 1
+                    self.condition.notify_all()
+        finally:
+            if cap is not None:
+                cap.release()
+            # Wake up anyone still waiting for frames
+            with self.condition:
+                self.condition.notify_all()
+
+    def _feed_sampler(self, gray_frame, clear, cost):
+        # No optical flow here: activity is the change since the previous sampled frame
+        # relative to diff_threshold, on a small gray copy
+        small = cv2.resize(gray_frame, (160, 90), interpolation=cv2.INTER_AREA)
+        activity = None
+        if self._previous_small is not None:
+            activity = float(np.mean(cv2.absdiff(small, self._previous_small))) / self.diff_threshold
+        self._previous_small = small
+        self.sampler.record(activity, blurred=not clear, cost=cost)
+
+    def wait_until_open(self, timeout=10.0):
+        """Block until the stream is connected. Returns False if it failed or timed out."""
+        deadline = time.monotonic() + timeout
+        while not self.opened.is_set():
+            if self.error is not None or not self.is_alive():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.opened.wait(min(remaining, 0.05))
+        return True
+
+    def get_frames(self, num_frames, timeout=5.0, max_age=5.0):
+        """Return up to num_frames of the newest buffered frames, oldest first.
+
+        Waits up to timeout seconds for the buffer to hold enough frames that are
+        no older than max_age seconds. Returns whatever is available on timeout.
+        """
+        self.last_access = time.monotonic()
+        deadline = self.last_access + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                fresh = [frame for _, captured_at, frame in self.frames
+                         if max_age is None or now - captured_at <= max_age]
+                remaining = deadline - now
+                if len(fresh) >= num_frames or remaining <= 0 or not self.is_alive():
+                    return fresh[-num_frames:]
+                self.condition.wait(remaining)
+
+    def get_frames_relaxed(self, num_frames, timeout, relax_after, relaxed_filter, max_age=5.0):
+        """get_frames that lowers the bar as the timeout approaches.
+
+        Waits for clear frames until relax_after seconds, then also takes rejected frames that
+        relaxed_filter(gray) accepts; if there are still fewer than num_frames at the timeout,
+        the sharpest remaining fresh rejects fill up. Returns (frames oldest first, counts of
+        the frames taken at each level: {"clear", "relaxed", "any"}).
+        """
+        self.last_access = time.monotonic()
+        started = self.last_access
+        relaxed_ok = {}  # captured_at -> relaxed_filter verdict, so each reject is checked once
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                clear = [(captured_at, frame) for _, captured_at, frame in self.frames
+                         if max_age is None or now - captured_at <= max_age][-num_frames:]
+                rejects = [reject for reject in self.rejects if max_age is None or now - reject[0] <= max_age]
+                waited = now - started
+                timed_out = waited >= timeout or not self.is_alive()
+                relaxing = waited >= relax_after
+                if len(clear) < num_frames and not timed_out and not (relaxing and rejects):
+                    # Nothing to consider yet: wait for a frame, the relax point or the timeout
+                    self.condition.wait(min(timeout, relax_after if not relaxing else timeout) - waited)
+                    continue
+
+            relaxed = []
+            if len(clear) < num_frames and relaxing:
+                # The relaxed filter runs outside the lock so the capture thread isn't held up
+                for captured_at, _, gray in rejects:
+                    if captured_at not in relaxed_ok:
+                        relaxed_ok[captured_at] = bool(relaxed_filter(gray))
+                relaxed = [(captured_at, frame) for captured_at, frame, _ in rejects if relaxed_ok[captured_at]]
+                relaxed = relaxed[-(num_frames - len(clear)):]
+            forced = []
+            if timed_out and len(clear) + len(relaxed) < num_frames:
+                others = [reject for reject in rejects if not relaxed_ok.get(reject[0])]
+                if others:
+                    sharpness = laplacian_variance(np.stack([gray for _, _, gray in others]))
+                    sharpest = np.argsort(sharpness)[::-1][:num_frames - len(clear) - len(relaxed)]
+                    forced = [others[i][:2] for i in sharpest]
+            if timed_out or len(clear) + len(relaxed) >= num_frames:
+                frames = sorted(clear + relaxed + forced, key=lambda item: item[0])
+                counts = {"clear": len(clear), "relaxed": len(relaxed), "any": len(forced)}
+                return [frame for _, frame in frames], counts
+            with self.condition:
+                self.condition.wait(max(min(timeout - (time.monotonic() - started), 0.25), 0))
+
+    def newest_frame_age(self):
+        """Seconds since the newest buffered frame was captured (None if the buffer is empty)."""
+        with self.condition:
+            if not self.frames:
+                return None
+            return time.monotonic() - self.frames[-1][1]
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        return {
+            "video_url": self.video_url,
+            "alive": self.is_alive(),
+            "opened": self.opened.is_set(),
+            "error": self.error,
+            "buffered": len(self.frames),
+            "frames_read": self.frames_read,
+            "frames_buffered": self.frames_buffered,
+            "frames_rejected": self.frames_rejected,
+            "reconnects": self.reconnects,
+            "decode": self.source.stats() if self.source is not None else None,
+            "sampling": self.sampler.stats() if self.sampler is not None else None,
+            "idle_seconds": round(time.monotonic() - self.last_access, 1),
+        }
+
+
+# One CaptureWorker per distinct video URL, evicted after idle_ttl seconds without requests
+class CaptureWorkerPool:
+    def __init__(self, idle_ttl=120.0, **worker_kwargs):
+        self.idle_ttl = idle_ttl
+        self.worker_kwargs = worker_kwargs
+        self.workers = {}
+        self.lock = threading.Lock()
+        self._reaper = threading.Thread(target=self._reap_idle, name="capture-reaper", daemon=True)
+        self._reaper_stop = threading.Event()
+        self._reaper.start()
+
+    def get_worker(self, video_url):
+        with self.lock:
+            worker = self.workers.get(video_url)
+            if worker is None or not worker.is_alive():
+                worker = CaptureWorker(video_url, **self.worker_kwargs)
+                worker.start()
+                self.workers[video_url] = worker
+            worker.last_access = time.monotonic()
+            return worker
+
+    def peek_worker(self, video_url):
+        """The stream's worker if there is one (it may have stopped); never starts one."""
+        with self.lock:
+            return self.workers.get(video_url)
+
+    def get_frames(self, video_url, num_frames, open_timeout=10.0, timeout=5.0, max_age=5.0):
+        """Pull num_frames from the stream's buffer. Returns None if the stream can't be opened."""
+        worker = self.open_worker(video_url, open_timeout)
+        if worker is None:
+            return None
+        return worker.get_frames(num_frames, timeout=timeout, max_age=max_age)
+
+    def open_worker(self, video_url, open_timeout=10.0, keep_connecting=False):
+        """The stream's worker once connected, or None if it can't be opened within open_timeout.
+        The worker is removed then, unless keep_connecting and it is still trying - a caller with
+        a short deadline leaves the connection to the next request instead of starting over."""
+        worker = self.get_worker(video_url)
+        if not worker.wait_until_open(open_timeout):
+            if not keep_connecting or worker.error is not None or not worker.is_alive():
+                self.remove(video_url)
+            return None
+        return worker
+
+    def remove(self, video_url):
+        with self.lock:
+            worker = self.workers.pop(video_url, None)
+        if worker is not None:
+            worker.stop()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [url for url, worker in self.workers.items()
+                    if now - worker.last_access > self.idle_ttl or not worker.is_alive()]
+            evicted = [self.workers.pop(url) for url in idle]
+        for worker in evicted:
+            print(f"Evicting idle capture worker for {worker.video_url}")
+            worker.stop()
+        return len(evicted)
+
+    def _reap_idle(self):
+        while not self._reaper_stop.wait(max(self.idle_ttl / 4, 1.0)):
+            self.evict_idle()
+
+    def shutdown(self):
+        self._reaper_stop.set()
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(timeout=2.0)
+
+    def stats(self):
+        with self.lock:
+            return [worker.stats() for worker in self.workers.values()]
@@ -0,0 +1,128 @@
+import os
+
+import cv2
+import numpy as np
+
+from metrics import timed
+
+
+def parse_grid(text):
+    """"8x6" -> (8, 6): columns x rows."""
+    try:
+        cols, rows = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Grid must look like 8x6 (columns x rows), got '{text}'") from None
+    if cols < 1 or rows < 1:
+        raise ValueError(f"Grid must have at least one column and row, got '{text}'")
+    return cols, rows
+
+
+# Tiled change detection for fixed cameras.
+# Keeps a running background (per pixel, of the small gray frame) and, per cell of a cols x rows
+# grid, the mean absolute difference from it plus a running noise floor. A tile has changed when
+# its difference exceeds both threshold and noise_factor x its noise floor. Unchanged tiles blend
+# into the background (and their noise floor) at learning_rate / noise_rate; changed ones at
+# absorb_rate, so an object that arrives and stays becomes background, and a tile that always
+# flickers (screens, foliage, water) raises its own noise floor, after a while.
+# Global brightness changes (exposure, daylight) are taken out first: the background is scaled by
+# the median ratio of tile means between frame and background.
+# The first frame has no background yet and reports every tile as changed.
+class TiledChangeDetector:
+    def __init__(self, grid=(8, 6), threshold=4.0, noise_factor=3.0, learning_rate=0.05,
+                 absorb_rate=0.01, noise_rate=0.05):
+        self.cols, self.rows = grid
+        self.threshold = threshold
+        self.noise_factor = noise_factor
+        self.learning_rate = learning_rate
+        self.absorb_rate = absorb_rate
+        self.noise_rate = noise_rate
+        self.background = None
+        self.noise = None
+        self.scores = None  # per-tile difference of the last frame
+
+        self.frames = 0
+        self.changed_frames = 0
+        self.changed_tiles = 0
+        self.change_counts = np.zeros((self.rows, self.cols), dtype=np.int64)  # changes per tile
+
+    def reset(self):
+        self.background = None
+        self.noise = None
+        self.scores = None
+
+    @timed("tile_change")
+    def update(self, gray):
+        """(rows, cols) bool mask of the tiles of gray (uint8) that changed; updates the model."""
+        frame = gray.astype(np.float32)
+        height, width = frame.shape
+        self.frames += 1
+        if self.background is None or self.background.shape != frame.shape:
+            self.background = frame
+            self.noise = np.zeros((self.rows, self.cols), dtype=np.float32)
+            self.scores = np.full((self.rows, self.cols), np.inf, dtype=np.float32)
+            mask = np.ones((self.rows, self.cols), dtype=bool)
+        else:
+            means = cv2.resize(frame, (self.cols, self.rows), interpolation=cv2.INTER_AREA)
+            background_means = cv2.resize(self.background, (self.cols, self.rows), interpolation=cv2.INTER_AREA)
+            gain = float(np.median(means / np.maximum(background_means, 1.0)))
+            self.background *= gain
+            difference = frame - self.background
+            # INTER_AREA down to the grid size is the mean over each tile
+            self.scores = cv2.resize(np.abs(difference), (self.cols, self.rows), interpolation=cv2.INTER_AREA)
+            mask = self.scores > np.maximum(self.threshold, self.noise_factor * self.noise)
+            self.changed_frames += bool(mask.any())
+            self.changed_tiles += int(mask.sum())
+            self.change_counts += mask
+
+            rates = np.where(mask, self.absorb_rate, self.learning_rate).astype(np.float32)
+            difference *= cv2.resize(rates, (width, height), interpolation=cv2.INTER_NEAREST)
+            self.background += difference
+            noise_rates = np.where(mask, self.absorb_rate, self.noise_rate).astype(np.float32)
+            self.noise += noise_rates * (self.scores - self.noise)
+        return mask
+
+    def stats(self):
+        tiles = self.rows * self.cols
+        return {
+            "grid": f"{self.cols}x{self.rows}",
+            "frames": self.frames,  # the first one only sets the background
+            "changed_frames": self.changed_frames,
+            "mean_changed_fraction": round(self.changed_tiles / (self.frames * tiles), 4) if self.frames else 0.0,
+            "tiles_ever_changed": int(np.count_nonzero(self.change_counts)),
+            "change_counts": self.change_counts.tolist(),
+        }
+
+
+def bounding_box(mask, size, padding=1):
+    """(x, y, w, h) in pixels around every changed tile, grown by padding tiles (None if none changed)."""
+    rows, cols = mask.shape
+    width, height = size
+    changed_rows, changed_cols = np.nonzero(mask)
+    if not len(changed_rows):
+        return None
+    top, bottom = max(changed_rows.min() - padding, 0), min(changed_rows.max() + 1 + padding, rows)
+    left, right = max(changed_cols.min() - padding, 0), min(changed_cols.max() + 1 + padding, cols)
+    x0, y0 = left * width // cols, top * height // rows
+    x1, y1 = right * width // cols, bottom * height // rows
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def crop_to_changes(frames, masks, padding=1, max_fraction=0.6):
+    """(frames, box) with every frame cropped to the bounding union of the tiles that changed in
+    any of them. Same-sized crops, so they still compose into one mosaic. When the union covers
+    more than max_fraction of the frame (or nothing changed) the frames are returned whole and
+    box is None."""
+    height, width = frames[0].shape[:2]
+    box = bounding_box(np.logical_or.reduce(masks), (width, height), padding)
+    if box is None or box[2] * box[3] > max_fraction * width * height:
+        return list(frames), None
+    x, y, w, h = box
+    return [frame[y:y + h, x:x + w] for frame in frames], box
+
+
+def detector_from_env():
+    """TiledChangeDetector configured by CHANGE_GRID (columns x rows) and CHANGE_THRESHOLD."""
+    return TiledChangeDetector(
+        grid=parse_grid(os.getenv("CHANGE_GRID", "8x6")),
+        threshold=float(os.getenv("CHANGE_THRESHOLD", "4.0")),
+    )
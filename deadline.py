@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import REGISTRY
+
+
+# Recent latencies of the stages of an analysis, for planning a request against its deadline.
+# estimate(stage) is the `quantile` of the stage's observations from the last max_age seconds
+# (at most `window` of them). A stage without recent observations falls back to its default; if
+# it belongs to one of `groups` (variants of one call, e.g. with a smaller image) whose other
+# members have been observed, that default is scaled by how their latencies compare to theirs.
+# So a variant a plan stopped choosing is still estimated from the others, and old samples of a
+# slow spell expire instead of keeping it unchosen.
+class StageEstimates:
+    def __init__(self, defaults, groups=(), window=50, quantile=0.9, max_age=300.0):
+        self.defaults = dict(defaults)
+        self.groups = {stage: group for group in groups for stage in group}
+        self.window = window
+        self.quantile = quantile
+        self.max_age = max_age
+        self.samples = {}  # stage -> deque of (monotonic time, seconds)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), seconds))
+
+    def _recent(self, stage, now):
+        return [seconds for recorded, seconds in self.samples.get(stage, ()) if now - recorded <= self.max_age]
+
+    def estimate(self, stage):
+        now = time.monotonic()
+        with self.lock:
+            samples = self._recent(stage, now)
+            ratios = [seconds / self.defaults[other]
+                      for other in self.groups.get(stage, ()) if other != stage and self.defaults.get(other)
+                      for seconds in self._recent(other, now)]
+        if samples:
+            return float(np.quantile(samples, self.quantile))
+        default = self.defaults.get(stage, 0.0)
+        if ratios:
+            return default * float(np.quantile(ratios, self.quantile))
+        return default
+
+    def total(self, *stages):
+        return sum(self.estimate(stage) for stage in stages)
+
+    def stats(self):
+        now = time.monotonic()
+        stages = sorted(set(self.defaults) | set(self.samples))
+        with self.lock:
+            counts = {stage: len(self._recent(stage, now)) for stage in stages}
+        return {stage: {"estimate_ms": round(self.estimate(stage) * 1000, 1), "samples": counts[stage]}
+                for stage in stages}
+
+
+# Time budget of one request, counted from when it arrived. seconds=None is no deadline:
+# remaining() is infinite and allows() always holds. degrade() records, in order, the
+# degradations the request's plan applied to stay within the budget.
+class Deadline:
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.degradations = []
+
+    @classmethod
+    def from_ms(cls, deadline_ms):
+        """Deadline of deadline_ms milliseconds; None or 0 is no deadline. Raises ValueError for
+        anything that isn't a non-negative number."""
+        if deadline_ms is None:
+            return cls()
+        deadline_ms = float(deadline_ms)
+        if not math.isfinite(deadline_ms) or deadline_ms < 0:
+            raise ValueError(f"deadline_ms must be a non-negative number, got {deadline_ms}")
+        return cls(deadline_ms / 1000 if deadline_ms else None)
+
+    @property
+    def bounded(self):
+        return self.seconds is not None
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        if self.seconds is None:
+            return math.inf
+        return self.seconds - self.elapsed()
+
+    def allows(self, seconds):
+        """Whether seconds of work still fit in the budget."""
+        return self.remaining() >= seconds
+
+    def degrade(self, name):
+        if name not in self.degradations:
+            self.degradations.append(name)
+            degradations_total(name).inc()
+
+    def report(self):
+        """Budget summary for the response (None without a deadline); also counts the outcome."""
+        if self.seconds is None:
+            return None
+        elapsed = self.elapsed()
+        met = elapsed <= self.seconds
+        deadlines_total("met" if met else "missed").inc()
+        return {
+            "deadline_ms": round(self.seconds * 1000),
+            "elapsed_ms": round(elapsed * 1000),
+            "met": met,
+        }
+
+
+def degradations_total(name):
+    return REGISTRY.counter("analysis_degradations", "Degradations applied to meet a request deadline",
+                            degradation=name)
+
+
+def deadlines_total(outcome):
+    return REGISTRY.counter("analysis_deadlines", "Analyses with a deadline, by whether it was met",
+                            outcome=outcome)
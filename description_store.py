@@ -0,0 +1,240 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    filename TEXT,
+    prompt TEXT,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS descriptions_timestamp ON descriptions (timestamp);
+CREATE INDEX IF NOT EXISTS descriptions_filename ON descriptions (filename);
+"""
+
+
+def _row(record):
+    """Row dict in the shape descriptions.json used (plus the prompt)."""
+    timestamp, filename, prompt, description = record
+    return {
+        "filename": filename,
+        "description": description,
+        "prompt": prompt,
+        "timestamp": time.strftime(TIMESTAMP_FORMAT, time.localtime(timestamp)),
+    }
+
+
+# Append-only history of Gemini descriptions in SQLite (WAL mode), replacing the rewrite of the
+# whole descriptions.json after every result.
+# add() only queues the row; a writer thread inserts queued rows in one transaction per batch
+# (up to batch_size rows or every flush_interval seconds), and with synchronous=NORMAL the WAL is
+# fsynced at checkpoints rather than on every commit. A kill loses at most the rows still queued
+# and never corrupts earlier ones.
+# The last `history` rows are also kept in memory for recent(); older ones are read with indexed
+# queries. max_rows / max_age (seconds) bound the table: the oldest rows are deleted every
+# compact_every inserts and the WAL is truncated. An existing descriptions.json is imported once.
+class DescriptionStore:
+    def __init__(self, path="descriptions.db", history=100, batch_size=32, flush_interval=1.0,
+                 max_rows=100000, max_age=None, compact_every=1000, legacy_json="descriptions.json"):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.compact_every = compact_every
+        self.history = deque(maxlen=history)
+
+        self.written = 0
+        self.batches = 0
+        self.compactions = 0
+        self.error = None
+        self._since_compaction = 0
+        self._queue = queue.Queue()
+        self._closed = False
+
+        connection = self._connect()
+        with connection:
+            connection.executescript(SCHEMA)
+        empty = connection.execute("SELECT NOT EXISTS (SELECT 1 FROM descriptions)").fetchone()[0]
+        if empty and legacy_json and os.path.exists(legacy_json):
+            self._import_json(connection, legacy_json)
+        rows = connection.execute(
+            "SELECT timestamp, filename, prompt, description FROM descriptions ORDER BY id DESC LIMIT ?",
+            (history,)).fetchall()
+        self.history.extend(_row(record) for record in reversed(rows))
+        connection.close()
+
+        self._writer = threading.Thread(target=self._run, name="description-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _import_json(self, connection, path):
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not import {path}: {e}")
+            return
+        rows = []
+        for entry in entries:
+            try:
+                timestamp = time.mktime(time.strptime(entry["timestamp"], TIMESTAMP_FORMAT))
+            except (KeyError, ValueError):
+                timestamp = time.time()
+            rows.append((timestamp, entry.get("filename"), None, entry.get("description", "")))
+        with connection:
+            connection.executemany(
+                "INSERT INTO descriptions (timestamp, filename, prompt, description) VALUES (?, ?, ?, ?)", rows)
+        print(f"Imported {len(rows)} descriptions from {path}")
+
+    def add(self, filename, description, prompt=None, timestamp=None):
+        """Queue a description for writing. Returns the row as recent() will report it."""
+        if self._closed:
+            raise RuntimeError("DescriptionStore is closed")
+        timestamp = time.time() if timestamp is None else timestamp
+        row = _row((timestamp, filename, prompt, description))
+        self.history.append(row)
+        self._queue.put((timestamp, filename, prompt, description))
+        return row
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                batch, waiters, stop = [], [], False
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                    if stop or waiters or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(connection, batch)
+                for waiter in waiters:
+                    waiter.set()
+                if stop:
+                    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    return
+        finally:
+            connection.close()
+
+    def _write(self, connection, batch):
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO descriptions (timestamp, filename, prompt, description) VALUES (?, ?, ?, ?)", batch)
+            self.written += len(batch)
+            self.batches += 1
+            self._since_compaction += len(batch)
+            if self._since_compaction >= self.compact_every:
+                self._compact(connection)
+        except sqlite3.Error as e:
+            self.error = str(e)
+            print(f"Failed to store {len(batch)} descriptions: {e}")
+
+    def _compact(self, connection):
+        self._since_compaction = 0
+        with connection:
+            if self.max_rows:
+                connection.execute(
+                    "DELETE FROM descriptions WHERE id <= (SELECT MAX(id) FROM descriptions) - ?", (self.max_rows,))
+            if self.max_age:
+                connection.execute("DELETE FROM descriptions WHERE timestamp < ?", (time.time() - self.max_age,))
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.compactions += 1
+
+    def flush(self, timeout=None):
+        """Block until everything added so far is committed."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def recent(self, limit=20, since=None, filename=None):
+        """Newest descriptions first, optionally only those after since (unix time) or for one
+        mosaic filename. Served from memory when the bounded history covers the request."""
+        if since is None and filename is None and limit <= len(self.history):
+            return list(reversed(self.history))[:limit]
+        self.flush()
+        query = "SELECT timestamp, filename, prompt, description FROM descriptions"
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(since)
+        if filename is not None:
+            conditions.append("filename = ?")
+            parameters.append(filename)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        parameters.append(limit)
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        try:
+            return [_row(record) for record in connection.execute(query, parameters)]
+        finally:
+            connection.close()
+
+    def count(self):
+        self.flush()
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        finally:
+            connection.close()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "compactions": self.compactions,
+            "history": len(self.history),
+            "error": self.error,
+        }
+
+    def close(self, timeout=10.0):
+        """Write what is queued, checkpoint the WAL and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print recent descriptions as JSON")
+    parser.add_argument("--db", default=os.getenv("DESCRIPTIONS_DB", "descriptions.db"))
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--filename", help="only descriptions of this mosaic")
+    parser.add_argument("--since", type=float, help="only descriptions after this unix time")
+    args = parser.parse_args()
+
+    store = DescriptionStore(args.db, history=0, legacy_json=None)
+    print(json.dumps(store.recent(args.limit, since=args.since, filename=args.filename), indent=4))
+    store.close()
@@ -0,0 +1,138 @@
+import os
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+BACKENDS = ("eager", "torchscript", "compile", "bf16", "int8")
+
+
+# Batched ResNet18 trunk for frame embeddings.
+# Takes a list of BGR uint8 frames, preprocesses them as one tensor op (no PIL) and runs a
+# single forward pass per batch. Backends:
+#   eager       - plain torch module
+#   torchscript - traced + frozen TorchScript graph
+#   compile     - torch.compile (falls back to eager if it isn't available)
+#   bf16        - channels_last memory format with bfloat16 autocast
+#   int8        - statically quantized trunk (CPU only)
+# With cache_dir, the pretrained trunk is saved as a TorchScript artifact on first use and
+# loaded from there afterwards, skipping torchvision model construction.
+class EmbeddingEngine:
+    def __init__(self, backend="eager", device=None, pretrained=True, input_size=224, max_batch=32, cache_dir=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+        if device is None:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend == "int8":
+            device = torch.device('cpu')  # quantized kernels are CPU only
+
+        self.backend = backend
+        self.device = torch.device(device)
+        self.input_size = (input_size, input_size)
+        self.max_batch = max_batch
+        self.channels_last = backend == "bf16"
+        # torch.compile needs the Python module, so that backend always builds from torchvision
+        self.cache_path = None
+        if cache_dir and pretrained and backend != "compile":
+            kind = "int8" if backend == "int8" else "float"
+            self.cache_path = os.path.join(cache_dir, f"resnet18_trunk_{kind}_{input_size}.pt")
+
+        if self.cache_path and os.path.exists(self.cache_path):
+            self.model = torch.jit.load(self.cache_path, map_location=self.device).eval()
+        else:
+            if backend == "int8":
+                self.model = self._build_int8(pretrained)
+            else:
+                self.model = self._build_float(pretrained)
+            if self.cache_path:
+                self._save_artifact()
+
+        if backend == "torchscript":
+            if not isinstance(self.model, torch.jit.ScriptModule):
+                self.model = self._trace(self.model)
+            self.model = torch.jit.freeze(self.model)
+        elif backend == "compile":
+            if hasattr(torch, "compile"):
+                self.model = torch.compile(self.model)
+            else:
+                print("torch.compile not available, using eager backend")
+                self.backend = "eager"
+        elif backend == "bf16":
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def _trace(self, model):
+        example = torch.zeros(1, 3, *self.input_size, device=self.device)
+        with torch.no_grad():
+            return torch.jit.trace(model, example)
+
+    def _save_artifact(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            torch.jit.save(self._trace(self.model), tmp_path)
+            os.replace(tmp_path, self.cache_path)
+            print(f"Cached model trunk at {self.cache_path}")
+        except Exception as e:
+            print(f"Could not cache model trunk: {e}")
+
+    def _build_float(self, pretrained):
+        from torchvision.models import resnet18
+
+        model = resnet18(weights="IMAGENET1K_V1" if pretrained else None)
+        model = nn.Sequential(*list(model.children())[:-1])  # Remove last fully connected layer
+        return model.to(self.device).eval()
+
+    def _build_int8(self, pretrained):
+        from torchvision.models import quantization
+
+        if pretrained:
+            model = quantization.resnet18(weights="IMAGENET1K_FBGEMM_V1", quantize=True)
+            model.fc = nn.Identity()
+            return model.eval()
+
+        # No pretrained quantized weights - calibrate a float model on noise (benchmarking only)
+        model = quantization.resnet18(weights=None, quantize=False)
+        model.fc = nn.Identity()
+        model.eval()
+        model.fuse_model()
+        model.qconfig = torch.ao.quantization.get_default_qconfig('fbgemm')
+        torch.ao.quantization.prepare(model, inplace=True)
+        with torch.no_grad():
+            model(torch.rand(8, 3, *self.input_size))
+        torch.ao.quantization.convert(model, inplace=True)
+        return model
+
+    def preprocess(self, frames):
+        """Stack BGR uint8 frames into a (N, 3, H, W) float tensor in [0, 1] resized to the model input."""
+        shapes = {frame.shape for frame in frames}
+        if len(shapes) > 1:
+            # Mixed sizes can't be stacked; bring them to a common size first
+            h, w = frames[0].shape[:2]
+            frames = [frame if frame.shape[:2] == (h, w) else cv2.resize(frame, (w, h)) for frame in frames]
+
+        batch = torch.from_numpy(np.ascontiguousarray(np.stack(frames)[..., ::-1]))  # BGR -> RGB
+        batch = batch.to(self.device).permute(0, 3, 1, 2).float().div_(255.0)
+        batch = F.interpolate(batch, size=self.input_size, mode='bilinear', align_corners=False, antialias=True)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def _forward(self, batch):
+        if self.backend == "bf16":
+            with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
+                return self.model(batch).float()
+        return self.model(batch)
+
+    def embed(self, frames):
+        """Return a (N, 512) float32 CPU tensor of embeddings for a list of BGR frames."""
+        if len(frames) == 0:
+            return torch.empty(0, 512)
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(frames), self.max_batch):
+                batch = self.preprocess(frames[start:start + self.max_batch])
+                outputs.append(self._forward(batch).reshape(batch.shape[0], -1))
+        return torch.cat(outputs).cpu()
+
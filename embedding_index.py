@@ -0,0 +1,123 @@
+import numpy as np
+
+MODES = ("exact", "ivf")
+
+
+# In-memory nearest-neighbour index over recent embeddings (accepted frames, mosaics...).
+# Vectors are L2-normalised on insert into a preallocated (capacity, dim) float32 matrix, so
+# cosine similarity is a single matmul. The matrix is a ring buffer: once full, the oldest
+# entry is overwritten. mode="ivf" (for long histories) clusters the vectors into n_lists
+# inverted lists once train_size vectors have been added, and a query only scores the
+# n_probe lists whose centroids are closest to it. Until then it searches exhaustively.
+class EmbeddingIndex:
+    def __init__(self, dim=512, capacity=1024, mode="exact", n_lists=64, n_probe=4, train_size=None, seed=0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown index mode '{mode}', expected one of {MODES}")
+        self.dim = dim
+        self.capacity = capacity
+        self.mode = mode
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.payloads = [None] * capacity
+        self.count = 0
+        self._next = 0
+
+        if mode == "ivf":
+            self.n_lists = n_lists
+            self.n_probe = n_probe
+            self.train_size = train_size or min(capacity, n_lists * 32)
+            self.rng = np.random.default_rng(seed)
+            self.centroids = None
+            self.lists = []
+            self.assignments = np.full(capacity, -1, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def _normalize(vectors):
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _train(self, iterations=10):
+        # Spherical k-means over everything currently stored
+        data = self.vectors[:self.count]
+        n_lists = min(self.n_lists, self.count)
+        centroids = data[self.rng.choice(self.count, n_lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = data[labels == i]
+                if len(members):
+                    centroids[i] = members.sum(axis=0)
+            centroids = self._normalize(centroids)
+        self.centroids = centroids
+        labels = np.argmax(data @ centroids.T, axis=1)
+        self.lists = [set() for _ in range(n_lists)]
+        for slot, label in enumerate(labels):
+            self.lists[label].add(slot)
+            self.assignments[slot] = label
+
+    def add(self, vector, payload=None):
+        """Insert one vector (evicting the oldest when full). Returns its slot."""
+        vector = self._normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        slot = self._next
+        if self.mode == "ivf" and self.centroids is not None:
+            if self.assignments[slot] >= 0:
+                self.lists[self.assignments[slot]].discard(slot)
+            label = int(np.argmax(self.centroids @ vector))
+            self.lists[label].add(slot)
+            self.assignments[slot] = label
+
+        self.vectors[slot] = vector
+        self.payloads[slot] = payload
+        self._next = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+        if self.mode == "ivf" and self.centroids is None and self.count >= self.train_size:
+            self._train()
+        return slot
+
+    def _candidates(self, query):
+        if self.mode == "exact" or self.centroids is None:
+            return None  # score everything
+        scores = self.centroids @ query
+        probe = np.argpartition(-scores, min(self.n_probe, len(scores)) - 1)[:self.n_probe]
+        slots = set().union(*(self.lists[i] for i in probe))
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    def search(self, vector, k=1):
+        """Return up to k (similarity, payload) pairs, most similar first."""
+        if self.count == 0:
+            return []
+        query = self._normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        candidates = self._candidates(query)
+        if candidates is None:
+            similarities = self.vectors[:self.count] @ query
+            slots = np.arange(self.count)
+        else:
+            if len(candidates) == 0:
+                return []
+            similarities = self.vectors[candidates] @ query
+            slots = candidates
+
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(float(similarities[i]), self.payloads[slots[i]]) for i in top]
+
+    def max_similarity(self, vector):
+        """Cosine similarity to the closest stored vector (-1.0 when there is nothing close)."""
+        best = self.search(vector, k=1)
+        return best[0][0] if best else -1.0
+
+    def is_novel(self, vector, threshold=0.9):
+        """True if vector is below threshold similarity to everything in the index."""
+        return self.max_similarity(vector) < threshold
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+        self.payloads = [None] * self.capacity
+        if self.mode == "ivf":
+            self.centroids = None
+            self.lists = []
+            self.assignments[:] = -1
@@ -0,0 +1,209 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from frame_quality import is_clear_batch, phash_batch
+from metrics import timed
+from motion import estimator_from_env
+
+
+# Per-frame intermediate products (resized, gray, small gray, hashes, features...).
+# Each one is computed at most once and shared between all stages that need it.
+class FrameContext:
+    def __init__(self, frame, index=0, size=(640, 360), small_size=(160, 90)):
+        self.frame = frame
+        self.index = index
+        self.size = size
+        self.small_size = small_size
+        self._products = {}
+
+    def get(self, name, compute):
+        """Return the named product, computing it with compute(self) on first use."""
+        if name not in self._products:
+            self._products[name] = compute(self)
+        return self._products[name]
+
+    def has(self, name):
+        return name in self._products
+
+    def put(self, name, value):
+        """Store a product computed elsewhere (e.g. by a parallel analysis worker)."""
+        self._products[name] = value
+
+    @property
+    def resized(self):
+        # Frames decoded at the working size (FrameSource's reduced MJPEG decoding) are used as is
+        return self.get("resized", lambda ctx: ctx.frame if ctx.frame.shape[1::-1] == ctx.size
+                        else cv2.resize(ctx.frame, ctx.size))
+
+    @property
+    def gray(self):
+        return self.get("gray", lambda ctx: cv2.cvtColor(ctx.resized, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def small_gray(self):
+        return self.get("small_gray", lambda ctx: cv2.resize(ctx.gray, ctx.small_size, interpolation=cv2.INTER_AREA))
+
+
+# A single filter step. check(ctx, reference) returns True to keep the frame.
+# reference is the FrameContext of the last accepted frame (None until one is accepted).
+# cost is a relative estimate used to run cheap stages first.
+class FilterStage:
+    def __init__(self, name, check, cost=1.0, needs_reference=False):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.needs_reference = needs_reference
+        self.calls = 0
+        self.rejects = 0
+        self.total_time = 0.0
+        self.latencies = deque(maxlen=1000)  # seconds per call, most recent calls
+
+    def record(self, seconds, rejected):
+        self.total_time += seconds
+        self.latencies.append(seconds)
+        self.calls += 1
+        if rejected:
+            self.rejects += 1
+
+    def reset_stats(self):
+        self.calls = 0
+        self.rejects = 0
+        self.total_time = 0.0
+        self.latencies.clear()
+
+    def percentile_ms(self, p):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+    def stats(self):
+        mean_ms = self.total_time / self.calls * 1000 if self.calls else 0.0
+        return {
+            "cost": self.cost,
+            "calls": self.calls,
+            "rejects": self.rejects,
+            "reject_rate": round(self.rejects / self.calls, 3) if self.calls else 0.0,
+            "total_ms": round(self.total_time * 1000, 2),
+            "mean_ms": round(mean_ms, 3),
+            "p50_ms": self.percentile_ms(0.5),
+            "p95_ms": self.percentile_ms(0.95),
+        }
+
+
+# Early-exit chain of FilterStages, run cheapest first.
+# The first stage that rejects stops the chain; a frame that passes every stage
+# becomes the new reference for the stages that compare against the last accepted frame.
+class FramePipeline:
+    def __init__(self, stages, order_by_cost=True):
+        self.stages = sorted(stages, key=lambda stage: stage.cost) if order_by_cost else list(stages)
+        self.reference = None
+        self.frames_seen = 0
+        self.frames_accepted = 0
+
+    def run(self, ctx):
+        """Run ctx through the stages. Returns (accepted, name of rejecting stage or None)."""
+        self.frames_seen += 1
+        for stage in self.stages:
+            if stage.needs_reference and self.reference is None:
+                continue
+            start = time.perf_counter()
+            keep = stage.check(ctx, self.reference)
+            stage.record(time.perf_counter() - start, rejected=not keep)
+            if not keep:
+                return False, stage.name
+
+        self.reference = ctx
+        self.frames_accepted += 1
+        return True, None
+
+    def reset(self):
+        self.reference = None
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def suggest_order(self):
+        """Stage names ordered by measured time spent per rejected frame (best early-exit first)."""
+        def time_per_reject(stage):
+            if stage.rejects == 0:
+                return float("inf")
+            return stage.total_time / stage.rejects
+        return [stage.name for stage in sorted(self.stages, key=time_per_reject)]
+
+    def report(self):
+        lines = [f"Frames seen: {self.frames_seen}, accepted: {self.frames_accepted}"]
+        lines.append(f"{'stage':<16}{'cost':>6}{'calls':>8}{'rejects':>9}{'rate':>7}{'mean ms':>10}{'p95 ms':>9}"
+                     f"{'total ms':>11}")
+        for name, s in self.stats().items():
+            lines.append(f"{name:<16}{s['cost']:>6}{s['calls']:>8}{s['rejects']:>9}{s['reject_rate']:>7}"
+                         f"{s['mean_ms']:>10}{s['p95_ms']:>9}{s['total_ms']:>11}")
+        return "\n".join(lines)
+
+
+# Cheap pre-gate: mean absolute difference of downsampled gray frames.
+# Rejects frames that are practically identical to the last accepted one before
+# optical flow or the CNN ever run. The difference is kept as the "frame_diff" product.
+def frame_difference_stage(diff_threshold=1.5, cost=1.0):
+    def check(ctx, reference):
+        difference = float(np.mean(cv2.absdiff(ctx.small_gray, reference.small_gray)))
+        ctx.put("frame_diff", difference)
+        return difference > diff_threshold
+    return FilterStage("frame_diff", check, cost=cost, needs_reference=True)
+
+
+# Tiled alternative to frame_difference_stage for fixed cameras (change_detection.TiledChangeDetector).
+# Every frame that reaches it updates the detector's background model; frames in which no tile
+# changed are rejected. The (rows, cols) mask of changed tiles is kept as the "changed_tiles"
+# product, to crop the mosaic to the changed region.
+def tile_change_stage(detector, cost=1.0):
+    def check(ctx, reference):
+        mask = ctx.get("changed_tiles", lambda c: detector.update(c.small_gray))
+        return bool(mask.any())
+    return FilterStage("tiles", check, cost=cost)
+
+
+# Perceptual hash (pHash) of a BGR frame, as the int of imagehash.phash's bits.
+# Compare hashes with frame_quality.hamming_distances; phash_batch hashes a stack at once.
+@timed("phash")
+def get_phash(image):
+    return int(phash_batch(image)[0])
+
+
+# Clear image check using Laplacian variance and edges (frame_quality.is_clear_batch for a stack)
+@timed("clarity")
+def is_clear_image(gray_frame, laplacian_threshold=300, edge_threshold=100):
+    return bool(is_clear_batch(gray_frame, laplacian_threshold, edge_threshold)[0])
+
+
+# Motion estimator used by the motion gate (MOTION_BACKEND, see motion.py; Farneback by default)
+motion_estimator = estimator_from_env()
+
+
+# Mean optical flow magnitude (pixels) between two gray frames
+@timed("motion")
+def motion_magnitude(gray1, gray2):
+    return motion_estimator(gray1, gray2)
+
+
+# Motion detection using optical flow
+def has_significant_motion(gray1, gray2, motion_threshold=0.05):
+    return motion_magnitude(gray1, gray2) > motion_threshold
+
+
+# The clarity verdict and the flow magnitude are stored as the "clear" / "motion_magnitude"
+# products, so a value precomputed by a parallel analysis worker is used instead of running
+# the check again (and the magnitude is there for the adaptive sampler).
+def clarity_stage(laplacian_threshold=300, edge_threshold=100, cost=3.0):
+    def check(ctx, reference):
+        return ctx.get("clear", lambda c: is_clear_image(c.gray, laplacian_threshold, edge_threshold))
+    return FilterStage("clarity", check, cost=cost)
+
+
+def motion_stage(motion_threshold=0.05, cost=10.0):
+    def check(ctx, reference):
+        return ctx.get("motion_magnitude", lambda c: motion_magnitude(reference.gray, c.gray)) > motion_threshold
+    return FilterStage("motion", check, cost=cost, needs_reference=True)
@@ -0,0 +1,180 @@
+import functools
+import math
+import threading
+
+import cv2
+import numpy as np
+
+# Batch frame quality scores: pHash, Laplacian variance and edge counts for a stack of frames.
+#
+# phash_batch() is bit-compatible with imagehash.phash (PIL "L" conversion, LANCZOS resize to
+# 32x32, 2-D DCT-II, low 8x8 block > median) and returns the hashes packed in uint64, with the
+# same bit order as int(str(imagehash), 16), so existing thresholds and cached hashes still apply.
+# To match exactly it reproduces Pillow's integer arithmetic:
+#   - luma is (19595 R + 38470 G + 7471 B + 32768) >> 16; the sum is an integer below 2**24,
+#     so it is computed exactly in float32 by one cv2.transform over the whole stack
+#   - the resize uses Pillow's fixed-point Lanczos coefficients (22 fractional bits), each pass
+#     rounded and clipped to 0-255 like Pillow's; the passes are float64 matrix products, exact
+#     because every partial sum is an integer far below 2**53
+#   - the DCT is scipy.fftpack's, as imagehash uses it
+# laplacian_variance() runs one float32 Laplacian over the stack (fixing the rows where two
+# frames meet) instead of a float64 one per frame; Canny has hysteresis across the whole image,
+# so edge counts stay per frame and is_clear_batch() only runs it where the variance passes.
+# Scratch buffers are reused per thread while the stack shape stays the same.
+
+PRECISION_BITS = 22  # Pillow's fixed-point precision for 8-bit resampling
+LUMA = np.array([[7471, 38470, 19595, 32768]], dtype=np.float32)  # B, G, R, rounding (BGR input)
+
+_buffers = threading.local()
+
+
+def _buffer(name, shape, dtype):
+    buffers = _buffers.__dict__
+    buffer = buffers.get(name)
+    if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+        buffer = buffers[name] = np.empty(shape, dtype=dtype)
+    return buffer
+
+
+def _lanczos(x):
+    def sinc(value):
+        if value == 0.0:
+            return 1.0
+        value *= math.pi
+        return math.sin(value) / value
+    if -3.0 <= x < 3.0:
+        return sinc(x) * sinc(x / 3)
+    return 0.0
+
+
+@functools.lru_cache(maxsize=16)
+def _resize_weights(in_size, out_size):
+    """(out_size, in_size) matrix of Pillow's integer LANCZOS coefficients (precompute_coeffs and
+    normalize_coeffs_8bpc in Resample.c)."""
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 3.0 * filterscale
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for out in range(out_size):
+        center = (out + 0.5) * scale
+        first = max(int(center - support + 0.5), 0)
+        last = min(int(center + support + 0.5), in_size)
+        taps = [_lanczos((x + first - center + 0.5) / filterscale) for x in range(last - first)]
+        total = sum(taps)
+        for x, tap in enumerate(taps):
+            if total != 0.0:
+                tap /= total
+            fixed = tap * (1 << PRECISION_BITS)
+            weights[out, first + x] = int(fixed - 0.5) if tap < 0 else int(fixed + 0.5)
+    weights.setflags(write=False)
+    return weights
+
+
+def _clip8(values):
+    """Pillow's clip8: round the fixed-point sums back to 0-255 (in place)."""
+    values += 1 << (PRECISION_BITS - 1)
+    values *= 1.0 / (1 << PRECISION_BITS)
+    np.floor(values, out=values)
+    return np.clip(values, 0, 255, out=values)
+
+
+def pil_luma(frames):
+    """(N, H, W) float32 luma of a (N, H, W, 3) BGR stack, equal to PIL's convert("L")."""
+    frames = np.asarray(frames)
+    count, height, width = frames.shape[:3]
+    rows = frames.reshape(count * height, width, 3)
+    source = _buffer("luma_source", rows.shape, np.float32)
+    source[...] = rows
+    luma = cv2.transform(source, LUMA)
+    luma *= np.float32(1.0 / 65536)
+    np.floor(luma, out=luma)
+    return luma.reshape(count, height, width)
+
+
+def pack_bits(bits):
+    """(N, 64) bools -> (N,) uint64, first bit most significant (imagehash's hex order)."""
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def phash_batch(frames, hash_size=8, highfreq_factor=4):
+    """imagehash.phash of every frame of a BGR stack (or list of same-sized frames), as uint64."""
+    import scipy.fftpack
+
+    if hash_size != 8:
+        raise ValueError("Packed hashes hold 64 bits: hash_size must be 8")
+    frames = np.asarray(frames)
+    if frames.ndim == 3:
+        frames = frames[None]
+    count, height, width = frames.shape[:3]
+    size = hash_size * highfreq_factor
+
+    luma = pil_luma(frames)
+    columns = _resize_weights(width, size).T
+    horizontal = _buffer("horizontal", (count, height, size), np.float64)
+    frame = _buffer("frame", (height, width), np.float64)
+    for index in range(count):  # frame by frame, so the float64 copy stays in cache
+        frame[...] = luma[index]
+        np.matmul(frame, columns, out=horizontal[index])
+    pixels = _clip8(_resize_weights(height, size) @ _clip8(horizontal))
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    low = dct[:, :hash_size, :hash_size].reshape(count, hash_size * hash_size)
+    return pack_bits(low > np.median(low, axis=1, keepdims=True))
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values)
+    bytes_ = values.view(np.uint8).reshape(*values.shape, 8)
+    return np.unpackbits(bytes_, axis=-1).sum(axis=(-2, -1)).astype(np.uint8)
+
+
+def hamming_distances(a, b):
+    """(len(a), len(b)) bit distances between two sets of packed uint64 hashes (scalars allowed)."""
+    a = np.atleast_1d(np.asarray(a, dtype=np.uint64))
+    b = np.atleast_1d(np.asarray(b, dtype=np.uint64))
+    return _popcount(a[:, None] ^ b[None, :])
+
+
+def laplacian_variance(grays):
+    """Variance of the 3x3 Laplacian (BORDER_REFLECT_101, as cv2.Laplacian) of each gray frame."""
+    grays = np.asarray(grays)
+    if grays.ndim == 2:
+        grays = grays[None]
+    count, height, width = grays.shape
+    laplacian = _buffer("laplacian", (count * height, width), np.float32)
+    cv2.Laplacian(grays.reshape(count * height, width), cv2.CV_32F, dst=laplacian)
+    laplacian = laplacian.reshape(count, height, width)
+    if count > 1:
+        # Stacked frames see their neighbour's edge row; put back the reflected row
+        laplacian[1:, 0] += grays[1:, 1].astype(np.float32) - grays[:-1, -1]
+        laplacian[:-1, -1] += grays[:-1, -2].astype(np.float32) - grays[1:, 0]
+    return np.array([cv2.meanStdDev(frame)[1][0, 0] ** 2 for frame in laplacian])
+
+
+def edge_counts(grays, low=100, high=200):
+    """Canny edge pixels per gray frame."""
+    return np.array([cv2.countNonZero(cv2.Canny(gray, low, high)) for gray in grays])
+
+
+def is_clear_batch(grays, laplacian_threshold=300, edge_threshold=100):
+    """is_clear_image for every gray frame; Canny only runs on frames whose variance passes."""
+    grays = np.asarray(grays)
+    if grays.ndim == 2:
+        grays = grays[None]
+    clear = laplacian_variance(grays) >= laplacian_threshold
+    for index in np.flatnonzero(clear):
+        clear[index] = cv2.countNonZero(cv2.Canny(grays[index], 100, 200)) > edge_threshold
+    return clear
+
+
+def quality_scores(frames, grays=None):
+    """{"phash", "laplacian_var", "edge_density"} arrays for a BGR stack (grays: its gray frames)."""
+    frames = np.asarray(frames)
+    if grays is None:
+        grays = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames])
+    pixels = grays.shape[-1] * grays.shape[-2]
+    return {
+        "phash": phash_batch(frames),
+        "laplacian_var": laplacian_variance(grays),
+        "edge_density": edge_counts(grays) / pixels,
+    }
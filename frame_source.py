@@ -0,0 +1,163 @@
+import time
+from collections import deque
+
+import cv2
+
+from metrics import stage_histogram
+
+grab_seconds = stage_histogram("grab")
+decode_seconds = stage_histogram("decode")
+
+# imdecode flags that decode a JPEG straight to 1/scale size (libjpeg DCT scaling)
+REDUCED_COLOR = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# FOURCCs FFmpeg reports for Motion JPEG (files, and IP cameras' multipart /video streams)
+MJPEG_FOURCCS = {"MJPG", "MJPE", "JPEG", "AVRN", "DMB1"}
+
+
+def fourcc_text(value):
+    value = int(value)
+    return "".join(chr((value >> shift) & 0xFF) for shift in (0, 8, 16, 24)).strip("\0 ")
+
+
+def reduction_for(source_size, size):
+    """Largest JPEG scale factor (1, 2, 4 or 8) whose decoded frame still covers size."""
+    width, height = source_size
+    for scale in (8, 4, 2):
+        if width // scale >= size[0] and height // scale >= size[1]:
+            return scale
+    return 1
+
+
+# Video reader that only decodes the frames that are used.
+# grab() advances the stream and retrieve() decodes the grabbed frame, so skipped frames are never
+# decoded. MJPEG sources read through FFmpeg are switched to raw packets: grab() then only
+# demuxes, and retrieve() decodes the JPEG with imdecode at the largest 1/2, 1/4 or 1/8 scale that
+# still covers `size` (reduced=False decodes in full). Other codecs decode inside grab(), as they
+# must for inter-frame compression; skipping retrieve() still saves the colour conversion.
+# stats() estimates the decode time saved against reading every frame in full. In raw mode with
+# a reduced scale, every calibrate_every-th kept frame (from the second, once the decoder is warm)
+# is also decoded in full to measure that.
+# read(), retrieve(), get() and isOpened() mirror cv2.VideoCapture's.
+class FrameSource:
+    def __init__(self, url, size=(640, 360), reduced=True, calibrate_every=100):
+        self.url = url
+        self.size = size
+        self.reduced = reduced
+        self.calibrate_every = calibrate_every
+        self.raw_packets = True  # cleared if the stream's raw packets turn out not to be JPEGs
+        self.cap = None
+        self.raw = False
+        self.scale = 1
+        self.source_size = None
+        self.decoded_size = None
+
+        self.grabbed = 0
+        self.retrieved = 0
+        self.grab_time = 0.0
+        self.retrieve_time = 0.0
+        self.calibration_time = 0.0
+        self.full_decodes = deque(maxlen=20)  # seconds per full-size decode (raw mode calibration)
+        self.open()
+
+    def open(self):
+        """(Re)connect to the stream. Returns False if it can't be opened."""
+        self.release()
+        self.cap = cv2.VideoCapture(self.url)
+        self.raw = False
+        self.scale = 1
+        if not self.cap.isOpened():
+            return False
+        width, height = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.source_size = (width, height) if width and height else None
+        if self.raw_packets and fourcc_text(self.cap.get(cv2.CAP_PROP_FOURCC)).upper() in MJPEG_FOURCCS:
+            # Backends without a raw mode (anything but FFmpeg) refuse this and keep decoding
+            self.raw = bool(self.cap.set(cv2.CAP_PROP_FORMAT, -1))
+        if self.raw and self.reduced and self.source_size is not None:
+            self.scale = reduction_for(self.source_size, self.size)
+        return True
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def grab(self):
+        started = time.perf_counter()
+        ok = self.cap is not None and self.cap.grab()
+        elapsed = time.perf_counter() - started
+        grab_seconds.observe(elapsed)
+        self.grab_time += elapsed
+        self.grabbed += ok
+        return ok
+
+    def retrieve(self):
+        """(ok, BGR frame of the last grab); MJPEG frames come out at 1/scale size."""
+        started = time.perf_counter()
+        ok, data = self.cap.retrieve()
+        frame = data
+        if ok and self.raw:
+            if self.source_size is None:
+                # Size unknown until the first frame: decode it in full and pick the scale from it
+                frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+                if frame is not None:
+                    self.source_size = frame.shape[1::-1]
+                    self.scale = reduction_for(self.source_size, self.size) if self.reduced else 1
+            else:
+                frame = cv2.imdecode(data, REDUCED_COLOR[self.scale])
+        elapsed = time.perf_counter() - started
+        if frame is None:
+            if ok and self.raw and not self.retrieved:
+                # Packets that imdecode can't read: fall back to FFmpeg's own decoding
+                print(f"Raw MJPEG packets from {self.url} don't decode; decoding in FFmpeg instead")
+                self.raw_packets = False
+                self.open()
+            return False, None
+        decode_seconds.observe(elapsed)
+        self.retrieve_time += elapsed
+        self.retrieved += 1
+        self.decoded_size = frame.shape[1::-1]
+        if self.raw and self.scale > 1 and (self.retrieved - 2) % self.calibrate_every == 0:
+            started = time.perf_counter()
+            cv2.imdecode(data, cv2.IMREAD_COLOR)
+            self.full_decodes.append(time.perf_counter() - started)
+            self.calibration_time += self.full_decodes[-1]
+        return True, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def stats(self):
+        mean_grab = self.grab_time / self.grabbed if self.grabbed else 0.0
+        mean_retrieve = self.retrieve_time / self.retrieved if self.retrieved else 0.0
+        full_decode = sum(self.full_decodes) / len(self.full_decodes) if self.full_decodes else mean_retrieve
+        # Reading every frame in full: each one demuxed (and, outside raw mode, decoded) by grab()
+        # and then fully decoded / converted by retrieve()
+        baseline = self.grabbed * (mean_grab + full_decode)
+        spent = self.grab_time + self.retrieve_time + self.calibration_time
+        return {
+            "mode": "mjpeg_raw" if self.raw else "decode",
+            "scale": self.scale,
+            "source_size": list(self.source_size) if self.source_size else None,
+            "decoded_size": list(self.decoded_size) if self.decoded_size else None,
+            "grabbed": self.grabbed,
+            "retrieved": self.retrieved,
+            "grab_ms": round(mean_grab * 1000, 3),
+            "retrieve_ms": round(mean_retrieve * 1000, 3),
+            "full_decode_ms": round(full_decode * 1000, 3),
+            "decode_seconds": round(spent, 3),
+            "decode_saved_seconds": round(baseline - spent, 3),
+            "decode_saved_fraction": round(1 - spent / baseline, 3) if baseline else 0.0,
+        }
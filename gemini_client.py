@@ -0,0 +1,327 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+from dotenv import load_dotenv
+
+import sse
+from metrics import stage_histogram, timed
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-2.5-flash-image"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+first_token_seconds = stage_histogram("gemini_first_token")
+stream_seconds = stage_histogram("gemini_stream")
+
+
+class GeminiError(Exception):
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+# Shared Gemini client used by vision-service.py and llama-gemini.py.
+# Owns one long-lived pooled aiohttp session (keep-alive, DNS cache) on its own event
+# loop thread, so it can be used from plain synchronous code (generate_sync) and from any
+# other asyncio loop (generate) without paying DNS/TCP/TLS setup on every call.
+class GeminiClient:
+    def __init__(self, api_key=None, base_url=None, model=None, max_concurrency=4,
+                 request_timeout=30.0, connect_timeout=5.0, total_budget=60.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        load_dotenv()
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        self.base_url = (base_url or os.getenv("GEMINI_API_BASE", DEFAULT_BASE_URL)).rstrip("/")
+        self.model = model or os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.total_budget = total_budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.status_counts = {}
+        self.latencies = deque(maxlen=1000)  # seconds, successful calls only
+        self.first_token_latencies = deque(maxlen=1000)  # seconds until a stream's first text
+
+        self._session = None
+        self._semaphore = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="gemini-client", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _get_session(self):
+        # Created lazily on the client's own loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency * 2,
+                limit_per_host=self.max_concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout, sock_connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def url(self, method="generateContent"):
+        url = f"{self.base_url}/models/{self.model}:{method}?key={self.api_key}"
+        if method == "streamGenerateContent":
+            url += "&alt=sse"  # one JSON response per event instead of a streamed JSON array
+        return url
+
+    @staticmethod
+    def build_payload(prompt, base64_image=None, mime_type="image/jpeg", temperature=0.8, max_output_tokens=900):
+        parts = [{"text": prompt}]
+        if base64_image is not None:
+            parts.append({"inline_data": {"mime_type": mime_type, "data": base64_image}})
+        return {
+            "contents": [{"role": "user", "parts": parts}],
+            "generation_config": {"temperature": temperature, "max_output_tokens": max_output_tokens},
+        }
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * (0.5 + random.random() / 2)  # jitter
+
+    async def _request(self, session, payload, method):
+        """POST with retries on 429/5xx and connection errors. Returns the open 200 response."""
+        deadline = time.monotonic() + self.total_budget
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = await session.post(self.url(method), json=payload)
+                self.status_counts[response.status] = self.status_counts.get(response.status, 0) + 1
+                if response.status == 200:
+                    return response
+                error_text = await response.text()
+                response.release()
+                error = GeminiError(f"Error processing image: {response.status}, {error_text}",
+                                    status=response.status, body=error_text)
+                if response.status not in RETRY_STATUSES:
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = GeminiError(f"Error: {str(e) or type(e).__name__}")
+
+            delay = self._backoff(attempt, retry_after)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _post(self, payload, method="generateContent"):
+        session = self._get_session()
+        async with self._semaphore:
+            self.requests += 1
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = await self._request(session, payload, method)
+                async with response:
+                    result = await response.json()
+                self.latencies.append(time.perf_counter() - start)
+                return result
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.failures += 1
+                raise GeminiError(f"Error: {str(e) or type(e).__name__}")
+            except GeminiError:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _text(result, default=None):
+        try:
+            return result['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, TypeError):
+            if default is not None:
+                return default
+            raise
+
+    @timed("gemini")
+    async def _generate(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        payload = self.build_payload(prompt, base64_image, mime_type, **generation_config)
+        result = await self._post(payload)
+        try:
+            return self._text(result)
+        except (KeyError, IndexError, TypeError) as e:
+            self.failures += 1
+            raise GeminiError(f"Error: unexpected response format ({e})", body=result)
+
+    async def _stream(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        # Retries happen only until the stream is open; once text has been yielded a failure
+        # is raised to the caller, who has already passed the partial text on
+        payload = self.build_payload(prompt, base64_image, mime_type, **generation_config)
+        session = self._get_session()
+        async with self._semaphore:
+            self.requests += 1
+            self.in_flight += 1
+            start = time.perf_counter()
+            first_token = None
+            try:
+                response = await self._request(session, payload, "streamGenerateContent")
+                async with response:
+                    async for data in sse.iter_data(response.content):
+                        try:
+                            text = self._text(json.loads(data), default="")
+                        except ValueError as e:
+                            raise GeminiError(f"Error: unexpected stream event ({e})", body=data)
+                        if not text:
+                            continue
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                            self.first_token_latencies.append(first_token)
+                            first_token_seconds.observe(first_token)
+                        yield text
+                elapsed = time.perf_counter() - start
+                self.latencies.append(elapsed)
+                stream_seconds.observe(elapsed)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.failures += 1
+                raise GeminiError(f"Error: {str(e) or type(e).__name__}")
+            except GeminiError:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    async def _pump(self, chunks, deliver):
+        # Runs on the client loop and hands ("chunk" | "error" | "done", value) to another thread
+        try:
+            async for chunk in chunks:
+                deliver(("chunk", chunk))
+        except Exception as e:
+            deliver(("error", e))
+        else:
+            deliver(("done", None))
+
+    async def generate(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        """Return the generated text. Raises GeminiError. Can be awaited from any event loop."""
+        coro = self._generate(prompt, base64_image, mime_type, **generation_config)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def generate_sync(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        """Blocking variant of generate() for synchronous callers."""
+        coro = self._generate(prompt, base64_image, mime_type, **generation_config)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def stream(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        """Async generator of text chunks as Gemini produces them (streamGenerateContent).
+        Raises GeminiError. Can be iterated from any event loop."""
+        chunks = self._stream(prompt, base64_image, mime_type, **generation_config)
+        running = asyncio.get_running_loop()
+        if running is self.loop:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        received = asyncio.Queue()
+
+        def deliver(item):
+            try:
+                running.call_soon_threadsafe(received.put_nowait, item)
+            except RuntimeError:
+                pass  # the caller's loop is gone
+
+        future = asyncio.run_coroutine_threadsafe(self._pump(chunks, deliver), self.loop)
+        try:
+            while True:
+                kind, value = await received.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()  # stops reading the response if the caller went away
+
+    def stream_sync(self, prompt, base64_image=None, mime_type="image/jpeg", **generation_config):
+        """Blocking generator variant of stream() for synchronous callers."""
+        received = queue.Queue()
+        chunks = self._stream(prompt, base64_image, mime_type, **generation_config)
+        future = asyncio.run_coroutine_threadsafe(self._pump(chunks, received.put), self.loop)
+        try:
+            while True:
+                kind, value = received.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    def metrics(self):
+        def percentiles(samples):
+            values = sorted(samples)
+
+            def percentile(p):
+                if not values:
+                    return None
+                return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1)
+
+            return {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "status_counts": dict(self.status_counts),
+            "latency_ms": percentiles(self.latencies),
+            "first_token_ms": percentiles(self.first_token_latencies),
+        }
+
+    def close(self):
+        async def _close():
+            if self._session is not None:
+                await self._session.close()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+# Process-wide shared client, created on first use
+def get_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = GeminiClient()
+        return _default_client
@@ -0,0 +1,70 @@
+import base64
+import queue
+import threading
+
+import cv2
+
+from metrics import timed
+
+
+# Encode an image to JPEG bytes in memory, optionally shrinking it so its longest side is max_dim
+def encode_jpeg(image, quality=90, max_dim=None):
+    if max_dim:
+        h, w = image.shape[:2]
+        scale = max_dim / max(h, w)
+        if scale < 1:
+            image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+# In-memory replacement for cv2.imwrite + encode_image_to_base64. Returns (base64 str, jpeg bytes).
+@timed("encode")
+def encode_jpeg_base64(image, quality=90, max_dim=None):
+    jpeg = encode_jpeg(image, quality=quality, max_dim=max_dim)
+    return base64.b64encode(jpeg).decode('utf-8'), jpeg
+
+
+# Optional side-channel that writes already-encoded JPEGs to disk on a background thread.
+# The hot path only pays for a queue put; when the queue is full the image is not archived.
+class ImageArchiver:
+    def __init__(self, max_pending=16):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="image-archiver", daemon=True)
+        self._thread.start()
+
+    def archive(self, path, jpeg_bytes):
+        """Queue jpeg_bytes to be written to path. Returns the path, or None if dropped."""
+        try:
+            self.queue.put_nowait((path, jpeg_bytes))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, jpeg_bytes = item
+            try:
+                with open(path, "wb") as image_file:
+                    image_file.write(jpeg_bytes)
+                self.written += 1
+            except OSError as e:
+                print(f"Failed to archive {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
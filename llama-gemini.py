@@ -1,39 +1,45 @@
+import time
+STARTED_AT = time.perf_counter()  # for start-up time reporting
+
 import cv2
-import os
-import torch
-import torch.nn as nn
-import torchvision.transforms as transforms
-from torchvision.models import resnet18
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from PIL import Image
-import imagehash
+import os
 import asyncio
-import aiohttp
-import time
-import json
 import sys
-import base64
+from collections import deque
 from icecream import ic
 import requests
-from dotenv import load_dotenv
 import os
-
-# Use GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(device)
-
-# Load pre-trained ResNet model (for feature extraction)
-model = resnet18(weights="IMAGENET1K_V1")
-model = nn.Sequential(*list(model.children())[:-1])  # Remove last fully connected layer
-model = model.to(device)
-model.eval()
-
-# Define the preprocessing pipeline
-preprocess = transforms.Compose([
-    transforms.Resize((224, 224)),  # Resize to the size expected by ResNet
-    transforms.ToTensor(),
-])
+from model_loader import embedding_config, embedding_model_from_env
+from submission_queue import SubmissionQueue
+from gemini_client import GeminiError, get_client
+from image_encoding import ImageArchiver
+from mosaic import composer_from_env, novelty_scores
+from result_cache import SemanticCache, mosaic_embedding
+from embedding_index import EmbeddingIndex
+from description_store import DescriptionStore
+from change_detection import crop_to_changes, detector_from_env
+from frame_filters import (FilterStage, FrameContext, FramePipeline, clarity_stage, frame_difference_stage,
+                           get_phash, motion_stage, tile_change_stage)
+from frame_quality import hamming_distances, phash_batch
+from frame_source import FrameSource
+from parallel_analysis import ParallelFrameAnalyzer
+from adaptive_sampler import AdaptiveSampler, pipeline_feedback
+import metrics
+from metrics import timed
+
+# Batched ResNet trunk (for feature extraction); EMBEDDING_BACKEND picks eager/torchscript/compile/bf16/int8.
+# Loaded in the background while the video stream connects (see main); uses GPU if available.
+embedding_model = embedding_model_from_env()
+
+# Gemini client, result cache, description store, archiver and submission queue are built by
+# setup() when main() starts, not on import: ANALYSIS_WORKERS processes are spawned and re-import
+# this script, and must not start their own threads or open the cache and descriptions.db
+gemini_client = None
+result_cache = None
+description_store = None
+archiver = None
+gemini_queue = None
 
 # # Prompt list
 # prompts = [
@@ -51,146 +57,213 @@ prompts = [
     "End the program."  # This prompt will terminate the program 
 ]
 
-# Global variables for prompt and descriptions
+# Picks the mosaic grid, tile scale and JPEG quality within the MOSAIC_* pixel / byte / token budgets
+mosaic_composer = composer_from_env()
+mosaic_reports = deque(maxlen=100)  # payload reports of the latest mosaics
+
+# Global variable for the prompt
 current_prompt_index = 0
-descriptions = []
+
 
 # Function to get frame features
+@timed("embed")
 def get_frame_features(frame):
-    pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    frame_preprocessed = preprocess(pil_image).unsqueeze(0).to(device)
-    with torch.no_grad():
-        features = model(frame_preprocessed)
-    return features.cpu()
-
-# Cosine similarity for frame comparison
-def is_different_cosine(features1, features2, threshold=0.9):
-    similarity = cosine_similarity(features1.view(1, -1), features2.view(1, -1))[0][0]
-    return similarity < threshold
-
-# Perceptual hashing (pHash) for frame comparison
-def get_phash(image):
-    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    return imagehash.phash(pil_image)
-
-def is_different_phash(hash1, hash2, hash_threshold=5):
-    return hash1 - hash2 > hash_threshold
-
-# Clear image check using Laplacian variance and edges
-def is_clear_image(gray_frame, laplacian_threshold=300, edge_threshold=100):
-    laplacian_var = cv2.Laplacian(gray_frame, cv2.CV_64F).var()
-    if laplacian_var < laplacian_threshold:
-        return False
-    edges = cv2.Canny(gray_frame, 100, 200)
-    return np.sum(edges > 0) > edge_threshold
-
-# Motion detection using optical flow
-def has_significant_motion(gray1, gray2, motion_threshold=0.05):
-    if gray1.shape != gray2.shape:
-        gray2 = cv2.resize(gray2, (gray1.shape[1], gray1.shape[0]))
-
-    flow = cv2.calcOpticalFlowFarneback(gray1, gray2, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-    magnitude, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-    return np.mean(magnitude) > motion_threshold
-
-# Combined check for frame difference
-def is_frame_significantly_different(features1, features2, hash1, hash2, cos_threshold=0.9, hash_threshold=5):
-    return is_different_cosine(features1, features2, threshold=cos_threshold) or is_different_phash(hash1, hash2, hash_threshold)
+    return embedding_model.get().embed([frame])
+
+# Shared per-frame products for the filter stages (computed once per frame)
+def frame_phash(ctx):
+    return ctx.get("phash", lambda c: get_phash(c.resized))
+
+def frame_features(ctx):
+    return ctx.get("features", lambda c: get_frame_features(c.resized)[0].numpy())
+
+# Embeddings and pHashes of recently accepted frames (about the last 10 mosaics)
+NOVELTY_HISTORY = 60
+recent_frames = EmbeddingIndex(dim=512, capacity=NOVELTY_HISTORY)
+recent_hashes = deque(maxlen=NOVELTY_HISTORY)
+
+# Novelty check against everything accepted recently, not just the last frame, so a scene
+# alternating between two views isn't accepted over and over.
+# pHash is much cheaper than the CNN, so the embedding is only computed when pHash can't decide.
+def is_novel_frame(ctx, reference, cos_threshold=0.9):
+    phash = frame_phash(ctx)
+    if not recent_hashes or hamming_distances(phash, recent_hashes).min() > 5:
+        return True
+    return recent_frames.is_novel(frame_features(ctx), threshold=cos_threshold)
+
+def remember_frame(ctx):
+    recent_hashes.append(frame_phash(ctx))
+    recent_frames.add(frame_features(ctx), payload=ctx.index)
+
+# CHANGE_DETECTION=tiles replaces the global frame difference with a per-tile background model
+# (CHANGE_GRID, CHANGE_THRESHOLD; see change_detection.py) and crops each mosaic to the tiles
+# that changed in its frames, unless they cover more than ROI_MAX_FRACTION of the frame
+TILED_CHANGES = os.getenv("CHANGE_DETECTION", "global") == "tiles"
+ROI_MAX_FRACTION = float(os.getenv("ROI_MAX_FRACTION", "0.6"))
+change_detector = detector_from_env() if TILED_CHANGES else None
+
+# Filter pipeline for the capture loop; stages run cheapest first and stop at the first reject
+def build_frame_pipeline():
+    if change_detector is not None:
+        change_stage = tile_change_stage(change_detector, cost=1.0)
+    else:
+        change_stage = frame_difference_stage(diff_threshold=1.5, cost=1.0)
+    return FramePipeline([
+        change_stage,
+        clarity_stage(cost=3.0),
+        motion_stage(cost=10.0),
+        FilterStage("novelty", is_novel_frame, cost=50.0),
+    ])
+
+SKIP_REASONS = {
+    "frame_diff": "no change since the last kept frame",
+    "tiles": "no tile differs from the background",
+    "clarity": "blurriness",
+    "motion": "minor motion",
+    "novelty": "similarity to a recently kept frame",
+}
+
+# Analysis worker processes (0 runs the pipeline in the capture loop)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+
+# Frames analysed per second of stream follow motion, blur rejects and the Gemini backlog
+# (FRAME_SAMPLING=fixed goes back to every 10th frame)
+ADAPTIVE_SAMPLING = os.getenv("FRAME_SAMPLING", "adaptive") != "fixed"
+SAMPLE_MIN_FPS = float(os.getenv("SAMPLE_MIN_FPS", "1"))
+SAMPLE_MAX_FPS = float(os.getenv("SAMPLE_MAX_FPS", "6"))
+SAMPLE_CPU_BUDGET = float(os.getenv("SAMPLE_CPU_BUDGET", "0.5"))  # fraction of one core
+
+# Print per-stage timing / reject counters every this many sampled frames
+STATS_EVERY = 500
+
+# Per-frame skip messages (off by default; the counts are in the stats report and /metrics)
+LOG_SKIPPED_FRAMES = os.getenv("LOG_SKIPPED_FRAMES", "0") == "1"
+
+# Serve /metrics (and /debug/profile with PROFILING=1) on this port while the loop runs
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Stream to analyse; a local video file is replayed once (see benchmarks/bench_replay.py)
+VIDEO_URL = os.getenv("VIDEO_URL", 'http://10.52.26.19:8080/video')
 
 # Function to get current timestamp with milliseconds
 def get_timestamp():
     return time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime()) + f"-{int(time.time() * 1000) % 1000:03d}"
 
-# Save the combined frame and descriptions to JSON
-def save_combined_image(image_list, folder, count):
-    combined_image = np.hstack(image_list)
+# Encode the combined frame and queue it for a description.
+# features are the frames' embeddings from the filter pipeline; with tile_masks (the changed tiles
+# of each frame) only the region that changed is sent, and the cropped frames are embedded again.
+def save_combined_image(image_list, folder, count, tile_masks=None, features=None):
+    roi = None
+    if tile_masks:
+        image_list, roi = crop_to_changes(image_list, tile_masks, max_fraction=ROI_MAX_FRACTION)
+
+    # The embeddings serve both the cache key and the tiles' novelty scores
+    if features is None or roi is not None:
+        features = embedding_model.get().embed(image_list).numpy()
+    else:
+        features = np.stack(features)
 
     # Use timestamp with milliseconds in filename
     timestamp = get_timestamp()
     filename = os.path.join(folder, f"combined_frame_{timestamp}.jpg")
 
-    cv2.imwrite(filename, combined_image)
-
-    # Process the image asynchronously and save description
-    asyncio.run(process_image_async(filename))
+    # Compose and encode in memory - no disk write + read back on the hot path
+    base64_image, jpeg_bytes, report = mosaic_composer.compose(image_list, scores=novelty_scores(features))
+    report["roi"] = roi
+    mosaic_reports.append(report)
+    region = f" of region {roi[2]}x{roi[3]}+{roi[0]}+{roi[1]}" if roi else ""
+    print(f"Mosaic{region} {report['layout']} {report['size'][0]}x{report['size'][1]} q{report['quality']}: "
+          f"{report['payload_bytes'] // 1024} KB base64, ~{report['estimated_tokens']} tokens")
+    if archiver is not None:
+        archiver.archive(filename, jpeg_bytes)
+
+    # Hand the image to the background Gemini queue; the capture loop never waits on the network.
+    # A newer mosaic for the same prompt replaces one that is still waiting in the queue.
+    prompt = prompts[current_prompt_index]
+    cache_key = (mosaic_embedding(features), phash_batch(image_list))
+    gemini_queue.submit((base64_image, prompt, cache_key), lambda result: save_description(filename, result, prompt), key=prompt)
+
+async def process_image_async(job):
+    base64_image, prompt, (embedding, hashes) = job
+
+    # Near-identical mosaic described recently - reuse that description
+    cached = result_cache.lookup(prompt, embedding, hashes)
+    if cached is not None:
+        print("\nScene unchanged, reusing cached description.")
+        return cached
 
-async def process_image_async(image_path):
     print("\nProcessing image... Please wait.")
     sys.stdout.flush()
 
-    asyncio.create_task(show_processing_progress())
+    progress = asyncio.create_task(show_processing_progress())
+    try:
+        # Process directly with Gemini API instead of uploading to a URL
+        result = await process_image_with_gemini(base64_image, prompt)
+    finally:
+        progress.cancel()
 
-    # Process directly with Gemini API instead of uploading to a URL
-    result = await process_image_with_gemini(image_path)
+    if not result.startswith("Error"):
+        result_cache.store(prompt, result, embedding, hashes)
+    return result
 
-    # Save description, filename, and timestamp
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    descriptions.append({"filename": image_path, "description": result, "timestamp": timestamp})
-    with open('descriptions.json', 'w') as json_file:
-        json.dump(descriptions, json_file, indent=4)
+# Store description, filename, and timestamp (called by the queue in submission order)
+def save_description(image_path, result, prompt=None):
+    if isinstance(result, Exception):
+        result = f"Error: {str(result)}"
+    description_store.add(image_path, result, prompt=prompt)
 
     ic(f"\nDESCRIPTION: {result}\n")
 
+def mosaic_summary():
+    """Layouts and mean payload of the latest mosaics (None before the first one)."""
+    if not mosaic_reports:
+        return None
+    reports = list(mosaic_reports)
+    return {
+        "mosaics": len(reports),
+        "layouts": sorted({report["layout"] for report in reports}),
+        "mean_payload_bytes": round(sum(report["payload_bytes"] for report in reports) / len(reports)),
+        "mean_estimated_tokens": round(sum(report["estimated_tokens"] for report in reports) / len(reports)),
+        "mean_compose_ms": round(sum(report["compose_ms"] for report in reports) / len(reports), 2),
+        "cropped": sum(report.get("roi") is not None for report in reports),
+        "last": reports[-1],
+    }
+
+def frame_outcome(result):
+    return metrics.REGISTRY.counter("frames_analysed", "Sampled frames by filter outcome", result=result)
+
+def collect_loop_metrics():
+    queue = gemini_queue.stats()
+    cache = result_cache.stats()
+    gemini = gemini_client.metrics()
+    return [
+        ("gemini_queue_depth", "gauge", "Mosaics waiting for Gemini", {}, queue["depth"]),
+        ("gemini_queue_dropped_total", "counter", "Mosaics dropped or coalesced away", {},
+         queue["dropped"] + queue["coalesced"]),
+        ("gemini_requests_total", "counter", "Gemini requests sent", {}, gemini["requests"]),
+        ("gemini_failures_total", "counter", "Gemini requests that failed", {}, gemini["failures"]),
+        ("cache_hits_total", "counter", "Result cache hits", {}, cache["hits"]),
+        ("cache_misses_total", "counter", "Result cache misses", {}, cache["misses"]),
+    ]
+
+metrics.REGISTRY.register_collector(collect_loop_metrics)
+
 async def show_processing_progress():
     for i in range(4):
         await asyncio.sleep(1)
         print("Processing...", "." * (i + 1), end='\r')
         sys.stdout.flush()
 
-# Function to encode image to base64
-def encode_image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-async def process_image_with_gemini(image_path):
+async def process_image_with_gemini(base64_image, prompt=None):
     global current_prompt_index
-    
-    # Replace with your Gemini API key
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    # Gemini API endpoint
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent?key={api_key}"
-    
-    # Encode image to base64
-    base64_image = encode_image_to_base64(image_path)
-    
-    # Create request payload
-    data = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [
-                    {
-                        "text": prompts[current_prompt_index]
-                    },
-                    {
-                        "inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": base64_image
-                        }
-                    }
-                ]
-            }
-        ],
-        "generation_config": {
-            "temperature": 0.8,
-            "max_output_tokens": 900
-        }
-    }
+    if prompt is None:
+        prompt = prompts[current_prompt_index]
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(api_url, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    # Extract text response from Gemini API response
-                    return result['candidates'][0]['content']['parts'][0]['text']
-                else:
-                    error_text = await response.text()
-                    return f"Error processing image: {response.status}, {error_text}"
-        except Exception as e:
-            return f"Error: {str(e)}"
+    # Shared pooled client (keep-alive, retries on 429/5xx, concurrency limit)
+    try:
+        return await gemini_client.generate(prompt, base64_image)
+    except GeminiError as e:
+        return str(e)
 
 # Function to replace keyword in the first prompt
 def replace_keyword_in_prompt():
@@ -198,67 +271,140 @@ def replace_keyword_in_prompt():
     prompts[1] = f"Can you find my {keyword}? Answer only in yes or not yet!"  # Update the prompt
     print(f"Updated prompt: {prompts[1]}")  # Print updated prompt to console
 
-def main():
+def setup():
+    global gemini_client, result_cache, description_store, archiver, gemini_queue
+
+    # Shared Gemini client (loads GEMINI_API_KEY from .env once)
+    gemini_client = get_client()
+
+    # Skip Gemini for mosaics that look like a recently described one (RESULT_CACHE_PATH persists it across restarts)
+    result_cache = SemanticCache(max_entries=256, ttl=600.0, path=os.getenv("RESULT_CACHE_PATH"))
+
+    # Append-only description history (SQLite, WAL); an existing descriptions.json is imported once.
+    # Read it back with description_store.recent() or `python description_store.py --limit 20`.
+    description_store = DescriptionStore(os.getenv("DESCRIPTIONS_DB", "descriptions.db"))
+
+    # Mosaics are encoded in memory; copies in captured_frames/ are written in the background (ARCHIVE_MOSAICS=0 turns this off)
+    archiver = ImageArchiver() if os.getenv("ARCHIVE_MOSAICS", "1") != "0" else None
+
+    # Background Gemini submission queue (bounded, coalesces pending mosaics per prompt)
+    gemini_queue = SubmissionQueue(process_image_async, max_depth=2, policy="coalesce")
+
+def main(video_url=VIDEO_URL, display=True, max_frames=None):
+    """Capture loop. Runs until '0' is pressed, or for a recorded file until it ends
+    (or after max_frames decoded frames). Returns a summary of the run.
+
+    display=False runs headless (no preview window, no key handling).
+    """
     global current_prompt_index
 
     save_folder = 'captured_frames'
     os.makedirs(save_folder, exist_ok=True)
+    setup()
+
+    # Load the model while the stream connects
+    embedding_model.warm_up()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
 
     # video_url = 'http://192.168.169.144:8080/video'  # Replace with actual video stream URL
-    video_url = 'http://10.52.26.19:8080/video' 
-    cap = cv2.VideoCapture(video_url)
+    # Frames the sampler skips are grabbed but never decoded; MJPEG decodes at reduced scale
+    cap = FrameSource(video_url, size=(640, 360))
 
     if not cap.isOpened():
         print("Error: Couldn't open video stream.")
-        return
+        return None
+    print(f"Stream connected {time.perf_counter() - STARTED_AT:.2f}s after start-up")
+
+    # A recording is replayed as fast as it decodes, so sampling follows its own timeline
+    replaying = os.path.isfile(video_url)
+    stream_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
 
     count = 0
-    last_frame = None
     frame_skip = 10
     frame_counter = 0
     image_buffer = []
+    buffer_features = []  # embeddings of the frames in image_buffer, from the novelty stage
+    tile_masks = []
+    frame_pipeline = build_frame_pipeline()
+    sampler = None
+    if ADAPTIVE_SAMPLING:
+        sampler = AdaptiveSampler(min_rate=SAMPLE_MIN_FPS, max_rate=SAMPLE_MAX_FPS, cpu_budget=SAMPLE_CPU_BUDGET)
+
+    # With ANALYSIS_WORKERS > 0 this loop only decodes; worker processes analyse the sampled
+    # frames and their results are merged back here in capture order
+    analyzer = None
+    if ANALYSIS_WORKERS > 0:
+        analyzer = ParallelFrameAnalyzer(
+            workers=ANALYSIS_WORKERS,
+            embedding=embedding_config(),
+        )
+        print(f"Analysing frames in {analyzer.workers} worker processes")
+
+    def merge(ctx):
+        nonlocal image_buffer, buffer_features, tile_masks, count
+        started = time.perf_counter()
+        accepted, rejected_by = frame_pipeline.run(ctx)
+        if sampler is not None:
+            activity, blurred = pipeline_feedback(ctx, rejected_by)
+            # In parallel mode most of the work happened in a worker process
+            cost = time.perf_counter() - started + ctx.get("analysis_seconds", lambda c: 0.0)
+            sampler.record(activity, blurred, cost, queue_depth=gemini_queue.depth)
+        frame_outcome(rejected_by or "accepted").inc()
+        if accepted:
+            remember_frame(ctx)
+            image_buffer.append(ctx.resized)
+            buffer_features.append(frame_features(ctx))
+            if ctx.has("changed_tiles"):
+                tile_masks.append(ctx.get("changed_tiles", None))
+            if analyzer is not None:
+                analyzer.set_reference(ctx)
+        elif LOG_SKIPPED_FRAMES:
+            print(f"Skipping frame {ctx.index} due to {SKIP_REASONS.get(rejected_by, rejected_by)}.")
+
+        if frame_pipeline.frames_seen % STATS_EVERY == 0:
+            print(frame_pipeline.report())
+            if sampler is not None:
+                print(f"Sampling: {sampler.stats()}")
 
-    features_last = None
-    phash_last = None
+        if len(image_buffer) == 6:
+            save_combined_image(image_buffer, save_folder, count, tile_masks if change_detector is not None else None,
+                                features=buffer_features)
+            image_buffer = []
+            buffer_features = []
+            tile_masks = []
+            count += 1
 
-    while True:
-        ret, frame = cap.read()
-        if not ret or frame is None:
+    loop_started = time.perf_counter()
+    while max_frames is None or frame_counter < max_frames:
+        if not cap.grab():
+            if replaying:
+                print("End of recording.")
+                break
             print("Failed to grab frame. Attempting to reconnect...")
-            cap.release()
-            cap = cv2.VideoCapture(video_url)  # Try to reconnect
+            cap.open()  # Try to reconnect
             continue
 
         frame_counter += 1
-        if frame_counter % frame_skip != 0:
-            continue
-
-        gray_frame = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (640, 360))
-        frame_resized = cv2.resize(frame, (640, 360))
-
-        if not is_clear_image(gray_frame):
-            print(f"Skipping frame {frame_counter} due to blurriness.")
-            continue
-
-        if last_frame is not None:
-            gray_last_frame = cv2.resize(cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY), (640, 360))
-            if not has_significant_motion(gray_last_frame, gray_frame):
-                print(f"Skipping frame {frame_counter} due to minor motion.")
+        if sampler is not None:
+            if not sampler.should_sample(frame_counter / stream_fps if replaying else None):
                 continue
+        elif frame_counter % frame_skip != 0:
+            continue
 
-        features_current = get_frame_features(frame_resized)
-        phash_current = get_phash(frame_resized)
+        ret, frame = cap.retrieve()
+        if not ret:
+            continue  # corrupt frame
 
-        if last_frame is None or is_frame_significantly_different(features_current, features_last, phash_current, phash_last):
-            image_buffer.append(frame_resized)
-            features_last = features_current
-            phash_last = phash_current
-            last_frame = frame_resized
+        if analyzer is None:
+            merge(FrameContext(frame, index=frame_counter))
+        else:
+            analyzer.submit(frame, frame_counter)
+            for ctx in analyzer.results():
+                merge(ctx)
 
-        if len(image_buffer) == 6:
-            save_combined_image(image_buffer, save_folder, count)
-            image_buffer = []
-            count += 1
+        if not display:
+            continue
 
         cv2.imshow('Video Stream', cv2.resize(frame, (700, 400)))
 
@@ -278,8 +424,47 @@ def main():
                 if current_prompt_index == 1:
                     replace_keyword_in_prompt()  # Ask user to enter keyword for prompt 2
 
+    parallel_stats = None
+    if analyzer is not None:
+        for ctx in analyzer.drain():
+            merge(ctx)
+        parallel_stats = analyzer.stats()
+        print(f"Parallel analysis: {parallel_stats}")
+        analyzer.close()
+    loop_seconds = time.perf_counter() - loop_started
+
+    print(frame_pipeline.report())
+    decode_stats = cap.stats()
+    print(f"Decoding: {decode_stats}")
     cap.release()
-    cv2.destroyAllWindows()
+    if display:
+        cv2.destroyAllWindows()
+
+    # Let queued Gemini requests finish before exiting
+    print(f"Waiting for pending Gemini requests: {gemini_queue.stats()}")
+    gemini_queue.close(timeout=60)
+    result_cache.save()
+    print(f"Result cache: {result_cache.stats()}")
+    if archiver is not None:
+        archiver.close()
+    description_store.close()
+
+    return {
+        "frames_read": frame_counter,
+        "loop_seconds": loop_seconds,
+        "decode": decode_stats,
+        "frames_analysed": frame_pipeline.frames_seen,
+        "frames_accepted": frame_pipeline.frames_accepted,
+        "mosaics": count,
+        "mosaic_payload": mosaic_summary(),
+        "stages": frame_pipeline.stats(),
+        "sampling": sampler.stats() if sampler is not None else None,
+        "tile_changes": change_detector.stats() if change_detector is not None else None,
+        "parallel": parallel_stats,
+        "gemini_queue": gemini_queue.stats(),
+        "result_cache": result_cache.stats(),
+        "descriptions": description_store.stats(),
+    }
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
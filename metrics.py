@@ -0,0 +1,309 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Hot-path instrumentation: per-stage latency histograms and counters, rendered in the Prometheus
+# text exposition format for GET /metrics.
+# METRICS=0 switches it off. timed() then returns the function itself and histogram() / counter()
+# a shared no-op, so instrumented code pays nothing (decorators) or one no-op call (timers in loops).
+# Scrape-time collectors (queue depths, cache hits...) cost nothing between scrapes and keep working.
+ENABLED = os.getenv("METRICS", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency bucket upper bounds in seconds, 100 us to 30 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(f"{name}_total", labels, self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class _Timing:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+# Fixed-bucket histogram: observe() is a bisect and three additions under an uncontended lock
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the seconds spent in its block."""
+        return _Timing(self)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th observation (None without observations)."""
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self, name, labels):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", dict(labels, le=repr(bound)), cumulative))
+        samples.append((f"{name}_bucket", dict(labels, le="+Inf"), self.count))
+        samples.append((f"{name}_sum", labels, self.sum))
+        samples.append((f"{name}_count", labels, self.count))
+        return samples
+
+    def snapshot(self):
+        def ms(bound):
+            return round(bound * 1000, 3) if bound is not None else None
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else None,
+            "p50_ms": ms(self.percentile(0.5)),
+            "p95_ms": ms(self.percentile(0.95)),
+            "p99_ms": ms(self.percentile(0.99)),
+        }
+
+
+class _NullTiming:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# Stands in for every metric while METRICS=0
+class _NullMetric:
+    __slots__ = ()
+    _timing = _NullTiming()
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self._timing
+
+
+NULL_METRIC = _NullMetric()
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="vision", enabled=ENABLED):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._families = {}  # name -> [kind, help, {label tuple: metric}]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _metric(self, factory, name, help, labels):
+        if not self.enabled:
+            return NULL_METRIC
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = [factory.kind, help, {}]
+            elif family[0] != factory.kind:
+                raise ValueError(f"Metric '{name}' is already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name, help="", **labels):
+        return self._metric(Counter, name, help, labels)
+
+    def histogram(self, name, help="", **labels):
+        return self._metric(Histogram, name, help, labels)
+
+    def register_collector(self, collect):
+        """collect() is called at scrape time and returns [(name, kind, help, labels, value)],
+        kind being "counter" or "gauge"."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            families = [(name, kind, help, list(metrics.items()))
+                        for name, (kind, help, metrics) in sorted(self._families.items())]
+        for name, kind, help, metrics in families:
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for key, metric in metrics:
+                for sample_name, labels, value in metric.samples(full_name, dict(key)):
+                    lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+
+        collected = {}
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                lines.append(f"# collector failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                if value is None:
+                    continue
+                collected.setdefault(name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, samples) in collected.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{full_name}{_format_labels(labels)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{name: {label text: value or histogram summary}} for JSON output (health, benchmarks)."""
+        with self._lock:
+            return {name: {_format_labels(dict(key)) or "": metric.snapshot() for key, metric in metrics.items()}
+                    for name, (kind, help, metrics) in sorted(self._families.items())}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def stage_histogram(stage):
+    """Latency histogram of one hot-path stage (decode, clarity, motion, embed, phash, encode, gemini)."""
+    return REGISTRY.histogram("stage_seconds", "Seconds spent per call of each hot-path stage", stage=stage)
+
+
+def timed(stage):
+    """Decorator recording each call's duration in stage_histogram(stage); works on coroutine
+    functions too. With metrics disabled it returns the function unchanged."""
+    def decorator(function):
+        if not REGISTRY.enabled:
+            return function
+        histogram = stage_histogram(stage)
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_coroutine(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return timed_coroutine
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return timed_function
+    return decorator
+
+
+def profile_request(query):
+    """(status, content type, body) for a /debug/profile request: a folded-stack CPU profile of
+    ?seconds= (default 10, at most 120) sampled every ?interval= seconds (at least 0.001).
+    404 unless PROFILING=1."""
+    import sampling_profiler
+
+    if not sampling_profiler.ENABLED:
+        return 404, "text/plain", "Profiling is disabled (set PROFILING=1)\n"
+    try:
+        seconds = float(query.get("seconds", 10))
+        interval = float(query.get("interval", 0.005))
+    except ValueError:
+        return 400, "text/plain", "seconds and interval must be numbers\n"
+    # Comparisons are False for NaN, so it is rejected too
+    if not 0 < seconds <= 120 or not 0.001 <= interval <= seconds:
+        return 400, "text/plain", "seconds must be in (0, 120] and interval in [0.001, seconds]\n"
+    try:
+        folded = sampling_profiler.profile(seconds, interval=interval, include_idle=query.get("idle") == "1")
+    except RuntimeError as e:
+        return 409, "text/plain", f"{e}\n"
+    return 200, "text/plain", folded
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            status, content_type, body = 200, CONTENT_TYPE, REGISTRY.render()
+        elif url.path == "/debug/profile":
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            status, content_type, body = profile_request(query)
+        else:
+            status, content_type, body = 404, "text/plain", "Not found\n"
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics (and /debug/profile) on a daemon thread, for scripts without a web server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
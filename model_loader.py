@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Deferred model initialisation.
+# Nothing is built until warm_up() (background thread) or the first get() (blocks until loaded),
+# so services can start answering liveness checks immediately and report readiness separately.
+class LazyModel:
+    def __init__(self, factory, name="model"):
+        self.factory = factory
+        self.name = name
+        self._model = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._thread = None
+        self.error = None
+        self.load_seconds = None
+
+    def _load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            start = time.perf_counter()
+            try:
+                self._model = self.factory()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+                print(f"Failed to load {self.name}: {e}")
+                raise
+            finally:
+                self.load_seconds = round(time.perf_counter() - start, 3)
+            print(f"{self.name} loaded in {self.load_seconds:.2f}s")
+            self._loaded.set()
+
+    def warm_up(self):
+        """Start loading on a background thread (no-op if already started)."""
+        if self._thread is None and not self._loaded.is_set():
+            def run():
+                try:
+                    self._load()
+                except Exception:
+                    pass  # reported through self.error / status()
+            self._thread = threading.Thread(target=run, name=f"warm-up-{self.name}", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def get(self):
+        """Return the model, loading it now (or waiting for the warm-up) if needed."""
+        if not self._loaded.is_set():
+            self._load()
+        return self._model
+
+    @property
+    def ready(self):
+        return self._loaded.is_set()
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "loading": self._thread is not None and self._thread.is_alive(),
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+# Factory for the ResNet embedding engine. torch/torchvision are only imported here, and the
+# trunk is cached as a TorchScript artifact in cache_dir so later boots skip torchvision.
+def load_embedding_engine(backend="eager", cache_dir=None, frame_size=(640, 360), pretrained=True):
+    from embedding_engine import EmbeddingEngine
+
+    engine = EmbeddingEngine(backend=backend, cache_dir=cache_dir, pretrained=pretrained)
+    print(f"Using device: {engine.device} (embedding backend: {engine.backend})")
+    # One dummy batch so lazy kernel / compile work happens before the first real request
+    engine.embed([np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)])
+    return engine
+
+
+def embedding_config():
+    """EmbeddingEngine arguments from EMBEDDING_BACKEND / MODEL_CACHE_DIR / EMBEDDING_PRETRAINED.
+
+    EMBEDDING_PRETRAINED=0 uses random weights (offline benchmarks; no download). Shared by the
+    lazily loaded engine and the analysis worker processes, so they embed with the same model.
+    """
+    return {
+        "backend": os.getenv("EMBEDDING_BACKEND", "eager"),
+        "cache_dir": os.getenv("MODEL_CACHE_DIR", ".model_cache") or None,
+        "pretrained": os.getenv("EMBEDDING_PRETRAINED", "1") != "0",
+    }
+
+
+def embedding_model_from_env(name="embedding engine"):
+    """LazyModel for the embedding engine configured by embedding_config()."""
+    config = embedding_config()
+    return LazyModel(lambda: load_embedding_engine(**config), name=name)
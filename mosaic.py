@@ -0,0 +1,216 @@
+import base64
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from image_encoding import encode_jpeg
+from metrics import REGISTRY, timed
+
+# Gemini bills an image by 768x768 tiles of 258 tokens each (one tile if both sides are <= 384 px);
+# used as an estimate of the model-side cost of a mosaic
+TOKENS_PER_TILE = 258
+TOKEN_TILE = 768
+SMALL_IMAGE = 384
+
+
+def estimate_tokens(width, height):
+    if width <= SMALL_IMAGE and height <= SMALL_IMAGE:
+        return TOKENS_PER_TILE
+    return TOKENS_PER_TILE * math.ceil(width / TOKEN_TILE) * math.ceil(height / TOKEN_TILE)
+
+
+def payload_size(jpeg_bytes):
+    """Length of the base64 encoding of jpeg_bytes bytes - what is actually sent."""
+    return 4 * math.ceil(jpeg_bytes / 3)
+
+
+def novelty_scores(features):
+    """Per frame, 1 - the highest cosine similarity to any other frame of the same mosaic
+    (high for a frame that shows something the others don't)."""
+    features = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+    if len(features) < 2:
+        return np.ones(len(features), dtype=np.float32)
+    features = features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+    similarity = features @ features.T
+    np.fill_diagonal(similarity, -1.0)
+    return 1.0 - similarity.max(axis=1)
+
+
+# Builds the image sent to Gemini from a set of frames within a budget.
+# For every rows x cols grid that fits the frames it finds the largest tile scale (<= 1) that keeps
+# the canvas within max_pixels, max_dim (longest side) and max_tokens, and picks the grid with the
+# most detail per tile; ties go to fewer tokens, then the squarer canvas. The JPEG starts at
+# `quality` and steps down through `qualities` until it fits max_bytes; if even the lowest does
+# not fit, the tiles are shrunk further. max_bytes counts the base64 payload as sent to Gemini.
+# 0 / None disables a budget.
+# With scores (novelty per frame) and max_tiles, the least novel frames are left out;
+# order="novelty" puts the most novel frame first instead of keeping capture order.
+# Tiles are resized straight into one canvas per thread, reused while the shape stays the same.
+class MosaicComposer:
+    def __init__(self, max_pixels=0, max_bytes=0, max_tokens=0, max_dim=0, max_tiles=0, quality=90,
+                 qualities=(90, 80, 70, 60, 50, 40), order="time", min_scale=0.1):
+        if order not in ("time", "novelty"):
+            raise ValueError(f"Unknown tile order '{order}', expected 'time' or 'novelty'")
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.max_dim = max_dim
+        self.max_tiles = max_tiles
+        self.quality = quality
+        self.qualities = sorted({q for q in qualities if q < quality} | {quality}, reverse=True)
+        self.order = order
+        self.min_scale = min_scale
+        self._local = threading.local()
+
+    def _select(self, count, scores):
+        indices = list(range(count))
+        if scores is None:
+            return indices
+        scores = np.asarray(scores, dtype=np.float32)
+        if self.max_tiles and count > self.max_tiles:
+            keep = np.argsort(-scores, kind="stable")[:self.max_tiles]
+            indices = sorted(int(i) for i in keep)
+        if self.order == "novelty":
+            indices.sort(key=lambda i: -scores[i])
+        return indices
+
+    def _max_scale(self, rows, cols, width, height):
+        canvas_w, canvas_h = cols * width, rows * height
+        scale = 1.0
+        if self.max_pixels:
+            scale = min(scale, math.sqrt(self.max_pixels / (canvas_w * canvas_h)))
+        if self.max_dim:
+            scale = min(scale, self.max_dim / max(canvas_w, canvas_h))
+        if self.max_tokens:
+            # Largest scale whose token tiles (a across, b down) stay within the budget
+            tiles = max(self.max_tokens // TOKENS_PER_TILE, 1)
+            best = 0.0
+            for across in range(1, tiles + 1):
+                down = tiles // across
+                best = max(best, min(across * TOKEN_TILE / canvas_w, down * TOKEN_TILE / canvas_h))
+            if tiles == 1:
+                best = max(best, min(SMALL_IMAGE / canvas_w, SMALL_IMAGE / canvas_h))
+            scale = min(scale, best)
+        return scale
+
+    def plan(self, count, width, height):
+        """(rows, cols, tile width, tile height) for count tiles of width x height."""
+        best = None
+        for rows in range(1, count + 1):
+            cols = math.ceil(count / rows)
+            if (rows - 1) * cols >= count:
+                continue  # a whole empty row
+            scale = self._max_scale(rows, cols, width, height)
+            tile_w, tile_h = max(int(width * scale), 1), max(int(height * scale), 1)
+            canvas_w, canvas_h = cols * tile_w, rows * tile_h
+            aspect = max(canvas_w, canvas_h) / min(canvas_w, canvas_h)
+            key = (tile_w * tile_h, -estimate_tokens(canvas_w, canvas_h), -aspect)
+            if best is None or key > best[0]:
+                best = (key, (rows, cols, tile_w, tile_h))
+        return best[1]
+
+    def _canvas(self, shape):
+        canvas = getattr(self._local, "canvas", None)
+        if canvas is None or canvas.shape != shape:
+            canvas = self._local.canvas = np.empty(shape, dtype=np.uint8)
+        return canvas
+
+    def _draw(self, frames, rows, cols, tile_w, tile_h):
+        canvas = self._canvas((rows * tile_h, cols * tile_w, 3))
+        if rows * cols > len(frames):
+            canvas[(rows - 1) * tile_h:, :] = 0  # unused cells of the last row
+        for position, frame in enumerate(frames):
+            y, x = (position // cols) * tile_h, (position % cols) * tile_w
+            cell = canvas[y:y + tile_h, x:x + tile_w]
+            if frame.shape[:2] == (tile_h, tile_w):
+                cell[...] = frame
+            else:
+                cv2.resize(frame, (tile_w, tile_h), dst=cell, interpolation=cv2.INTER_AREA)
+        return canvas
+
+    def _encode(self, canvas):
+        """(jpeg bytes, quality, encodes) - the highest quality in the list whose payload fits max_bytes."""
+        jpeg = encode_jpeg(canvas, quality=self.quality)
+        if not self.max_bytes or payload_size(len(jpeg)) <= self.max_bytes:
+            return jpeg, self.quality, 1
+        # Size falls monotonically with quality: binary search the rest of the list
+        low, high, encodes = 1, len(self.qualities) - 1, 1
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = encode_jpeg(canvas, quality=self.qualities[middle])
+            encodes += 1
+            if payload_size(len(candidate)) <= self.max_bytes:
+                best, high = (candidate, self.qualities[middle]), middle - 1
+            else:
+                jpeg, low = candidate, middle + 1
+        if best is None:
+            return jpeg, self.qualities[-1], encodes
+        return best[0], best[1], encodes
+
+    @timed("mosaic")
+    def compose(self, frames, scores=None):
+        """Returns (base64 str, jpeg bytes, report) for the mosaic of frames (same-sized BGR images)."""
+        if not frames:
+            raise ValueError("No frames to compose")
+        started = time.perf_counter()
+        indices = self._select(len(frames), scores)
+        tiles = [frames[i] for i in indices]
+        height, width = tiles[0].shape[:2]
+        rows, cols, tile_w, tile_h = self.plan(len(tiles), width, height)
+
+        encodes = 0
+        while True:
+            canvas = self._draw(tiles, rows, cols, tile_w, tile_h)
+            jpeg, quality, attempts = self._encode(canvas)
+            encodes += attempts
+            if not self.max_bytes or payload_size(len(jpeg)) <= self.max_bytes or tile_w * tile_h <= 1:
+                break
+            # Still over budget at the lowest quality: bytes scale roughly with pixel count
+            shrink = math.sqrt(self.max_bytes / payload_size(len(jpeg))) * 0.95
+            if tile_w * shrink < width * self.min_scale:
+                break
+            tile_w, tile_h = max(int(tile_w * shrink), 1), max(int(tile_h * shrink), 1)
+
+        base64_image = base64.b64encode(jpeg).decode('utf-8')
+        canvas_h, canvas_w = canvas.shape[:2]
+        report = {
+            "layout": f"{rows}x{cols}",
+            "tiles": len(tiles),
+            "dropped": len(frames) - len(tiles),
+            "order": indices,
+            "tile_size": [tile_w, tile_h],
+            "size": [canvas_w, canvas_h],
+            "scale": round(tile_w / width, 3),
+            "quality": quality,
+            "encodes": encodes,
+            "jpeg_bytes": len(jpeg),
+            "payload_bytes": len(base64_image),
+            "estimated_tokens": estimate_tokens(canvas_w, canvas_h),
+            "compose_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        mosaics_total.inc()
+        payload_bytes_total.inc(len(base64_image))
+        return base64_image, jpeg, report
+
+
+def composer_from_env():
+    """Composer configured by MOSAIC_MAX_PIXELS, MOSAIC_MAX_BYTES (base64 payload), MOSAIC_MAX_TOKENS,
+    MOSAIC_MAX_DIM, MOSAIC_MAX_TILES, MOSAIC_JPEG_QUALITY and MOSAIC_ORDER (time / novelty)."""
+    return MosaicComposer(
+        max_pixels=int(os.getenv("MOSAIC_MAX_PIXELS", "0")),
+        max_bytes=int(os.getenv("MOSAIC_MAX_BYTES", "0")),
+        max_tokens=int(os.getenv("MOSAIC_MAX_TOKENS", "0")),
+        max_dim=int(os.getenv("MOSAIC_MAX_DIM", "0")),
+        max_tiles=int(os.getenv("MOSAIC_MAX_TILES", "0")),
+        quality=int(os.getenv("MOSAIC_JPEG_QUALITY", "90")),
+        order=os.getenv("MOSAIC_ORDER", "time"),
+    )
+
+
+mosaics_total = REGISTRY.counter("mosaics", "Mosaics composed")
+payload_bytes_total = REGISTRY.counter("mosaic_payload_bytes", "Base64 image bytes sent to Gemini")
@@ -0,0 +1,142 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Motion estimation backends for the motion gate. Each returns the mean motion between two gray
+# frames in the units of the original full-resolution Farneback flow (mean magnitude in pixels of
+# the input frames), so motion_threshold (0.05) and the adaptive sampler's activity keep their
+# meaning whichever backend runs.
+#   farneback        - dense Farneback at input resolution, 3 levels (the original gate)
+#   farneback_small  - dense Farneback at 1/2 resolution, 2 levels
+#   dis              - dense inverse search (DIS, ultrafast preset) at 1/2 resolution
+#   lk               - sparse pyramidal Lucas-Kanade on up to 150 corners at 1/2 resolution
+#   blockdiff        - normal flow from 8x8-block frame differences at 1/4 resolution:
+#                      |dI/dt| / |grad I| per textured block
+# The downscaled backends multiply by the downscale factor; a calibration then maps the result to
+# farneback's: max(value - offset, 0) * scale, the offset removing the backend's own noise floor.
+# The defaults were fitted against farneback on noisy synthetic and real-texture clips, gate
+# decision first (benchmarks/bench_motion.py --calibrate fits them to your own recordings).
+# MOTION_BACKEND selects the backend; MOTION_OFFSET / MOTION_SCALE override its calibration.
+
+_local = threading.local()  # per-thread DIS instances (not thread-safe)
+
+
+def _downscale(gray, factor):
+    if factor == 1:
+        return gray
+    height, width = gray.shape[:2]
+    return cv2.resize(gray, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+
+
+def _mean_magnitude(flow):
+    return float(np.mean(cv2.magnitude(flow[..., 0], flow[..., 1])))
+
+
+def farneback(gray1, gray2):
+    return _mean_magnitude(cv2.calcOpticalFlowFarneback(gray1, gray2, None, 0.5, 3, 15, 3, 5, 1.2, 0))
+
+
+def farneback_small(gray1, gray2, factor=2):
+    small1, small2 = _downscale(gray1, factor), _downscale(gray2, factor)
+    flow = cv2.calcOpticalFlowFarneback(small1, small2, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+    return _mean_magnitude(flow) * factor
+
+
+def dis(gray1, gray2, factor=2):
+    estimator = getattr(_local, "dis", None)
+    if estimator is None:
+        estimator = _local.dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+    flow = estimator.calc(_downscale(gray1, factor), _downscale(gray2, factor), None)
+    return _mean_magnitude(flow) * factor
+
+
+def lk(gray1, gray2, factor=2, max_corners=150):
+    small1, small2 = _downscale(gray1, factor), _downscale(gray2, factor)
+    corners = cv2.goodFeaturesToTrack(small1, max_corners, 0.01, 8)
+    if corners is None:
+        return 0.0  # no texture to track, and nothing Farneback would see move either
+    tracked, status, _ = cv2.calcOpticalFlowPyrLK(small1, small2, corners, None, winSize=(15, 15), maxLevel=2)
+    found = status.ravel() == 1
+    if not found.any():
+        return float(gray1.shape[1])  # everything moved out of reach: report a full frame width
+    displacement = (tracked - corners).reshape(-1, 2)[found]
+    return float(np.mean(np.hypot(displacement[:, 0], displacement[:, 1]))) * factor
+
+
+def blockdiff(gray1, gray2, factor=4, block=8, min_gradient=4.0):
+    small1 = _downscale(gray1, factor).astype(np.float32)
+    small2 = _downscale(gray2, factor).astype(np.float32)
+    change = cv2.absdiff(small1, small2)
+    gradient = np.abs(cv2.Sobel(small1, cv2.CV_32F, 1, 0, ksize=3)) + np.abs(cv2.Sobel(small1, cv2.CV_32F, 0, 1, ksize=3))
+    grid = (small1.shape[1] // block, small1.shape[0] // block)
+    change = cv2.resize(change, grid, interpolation=cv2.INTER_AREA)
+    gradient = cv2.resize(gradient, grid, interpolation=cv2.INTER_AREA)
+    textured = gradient >= min_gradient
+    if not textured.any():
+        return 0.0
+    # Brightness constancy: dI/dt = -grad I . v, so |v| along the gradient is about |dI/dt| / |grad I|
+    # (Sobel gradients are 8x the per-pixel difference, hence the 8)
+    normal_flow = 8.0 * change[textured] / gradient[textured]
+    return float(np.sum(normal_flow) / change.size) * factor
+
+
+# name -> (estimator, calibration offset, calibration scale)
+BACKENDS = {
+    "farneback": (farneback, 0.0, 1.0),
+    "farneback_small": (farneback_small, 0.0, 0.8145),
+    "dis": (dis, 0.0634, 0.7583),
+    "lk": (lk, 0.0, 0.7824),
+    "blockdiff": (blockdiff, 0.3080, 1.0080),
+}
+
+
+def calibrate(values, reference, threshold=0.05):
+    """(offset, scale, gate agreement) mapping a backend's values onto reference (farneback)
+    values of the same frame pairs. Tries noise floors from the backend's lower values; for each
+    the scale is the median ratio over pairs above threshold. Best gate agreement wins, then the
+    smallest squared log error."""
+    values, reference = np.asarray(values, dtype=np.float64), np.asarray(reference, dtype=np.float64)
+    moved = reference > threshold
+    best = None
+    for offset in np.unique(np.concatenate([[0.0], np.percentile(values, np.arange(0, 61))])):
+        above = np.maximum(values - offset, 0)
+        usable = moved & (above > 0)
+        if not usable.any():
+            continue
+        scale = float(np.median(reference[usable] / above[usable]))
+        estimate = above * scale
+        agreement = float(np.mean((estimate > threshold) == moved))
+        error = float(np.mean((np.log(estimate + 1e-3) - np.log(reference + 1e-3)) ** 2))
+        if best is None or (agreement, -error) > best[0]:
+            best = ((agreement, -error), float(offset), scale)
+    if best is None:
+        return 0.0, 1.0, float(np.mean(~moved))
+    (agreement, _), offset, scale = best
+    return offset, scale, agreement
+
+
+class MotionEstimator:
+    def __init__(self, backend="farneback", offset=None, scale=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown motion backend '{backend}', expected one of {sorted(BACKENDS)}")
+        self.backend = backend
+        self.estimate, default_offset, default_scale = BACKENDS[backend]
+        self.offset = default_offset if offset is None else offset
+        self.scale = default_scale if scale is None else scale
+
+    def __call__(self, gray1, gray2):
+        """Mean motion from gray1 to gray2, in full-resolution Farneback pixels."""
+        if gray1.shape != gray2.shape:
+            gray2 = cv2.resize(gray2, (gray1.shape[1], gray1.shape[0]))
+        value = self.estimate(gray1, gray2)
+        if self.offset:
+            value = max(value - self.offset, 0.0)
+        return value * self.scale
+
+
+def estimator_from_env():
+    offset, scale = os.getenv("MOTION_OFFSET"), os.getenv("MOTION_SCALE")
+    return MotionEstimator(os.getenv("MOTION_BACKEND", "farneback"),
+                           offset=float(offset) if offset else None, scale=float(scale) if scale else None)
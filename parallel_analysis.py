@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from frame_filters import FrameContext, get_phash, is_clear_image, motion_magnitude
+
+
+# Fixed-size frames in one shared memory block: (slots, height, width, 3) uint8.
+# The decode stage resizes frames straight into a free slot and workers read them in place,
+# so full frames are never pickled between processes.
+class SharedFrameRing:
+    def __init__(self, slots, size=(640, 360), name=None):
+        self.shape = (slots, size[1], size[0], 3)
+        nbytes = int(np.prod(self.shape))
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=nbytes if self.owner else 0)
+        self.frames = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# The last accepted frame (index, gray, small gray), published by the merge stage for the workers.
+# Single writer, many readers: the version is odd while a write is in progress, and a reader
+# that sees it change during its copy discards what it read (a seqlock).
+class SharedReference:
+    def __init__(self, size=(640, 360), small_size=(160, 90), name=None):
+        gray_bytes = size[0] * size[1]
+        small_bytes = small_size[0] * small_size[1]
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=16 + gray_bytes + small_bytes if self.owner else 0)
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)  # version, frame index
+        self.gray = np.ndarray((size[1], size[0]), dtype=np.uint8, buffer=self.shm.buf, offset=16)
+        self.small_gray = np.ndarray((small_size[1], small_size[0]), dtype=np.uint8,
+                                     buffer=self.shm.buf, offset=16 + gray_bytes)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, index, gray, small_gray):
+        version = int(self.header[0])
+        self.header[0] = version + 1
+        self.header[1] = index
+        self.gray[:] = gray
+        self.small_gray[:] = small_gray
+        self.header[0] = version + 2
+
+    def read(self):
+        """Return (index, gray, small_gray) copies, or None if unset or being written."""
+        version = int(self.header[0])
+        if version == 0 or version % 2:
+            return None
+        index = int(self.header[1])
+        gray = self.gray.copy()
+        small_gray = self.small_gray.copy()
+        if int(self.header[0]) != version:
+            return None
+        return index, gray, small_gray
+
+    def close(self):
+        self.header = self.gray = self.small_gray = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Worker process state, set up once by _init_worker
+_worker = None
+
+
+class _WorkerState:
+    def __init__(self, ring_name, reference_name, config):
+        cv2.setNumThreads(1)
+        self.config = config
+        self.ring = SharedFrameRing(config["slots"], config["size"], name=ring_name)
+        self.reference = SharedReference(config["size"], config["small_size"], name=reference_name)
+        self.engine = None
+        if config["features"]:
+            import torch
+            from embedding_engine import EmbeddingEngine
+
+            torch.set_num_threads(config["threads_per_worker"])
+            self.engine = EmbeddingEngine(**config["embedding"])
+
+
+def _init_worker(ring_name, reference_name, config):
+    global _worker
+    _worker = _WorkerState(ring_name, reference_name, config)
+
+
+def _changed(ctx, small_gray):
+    return float(np.mean(cv2.absdiff(ctx.small_gray, small_gray))) > _worker.config["diff_threshold"]
+
+
+def _analyze(slot, previous_slot, previous_index):
+    start = time.perf_counter()
+    products = _frame_products(slot, previous_slot, previous_index)
+    products["analysis_seconds"] = time.perf_counter() - start
+    return products
+
+
+def _frame_products(slot, previous_slot, previous_index):
+    """Compute the products of one frame that the merge stage is likely to need.
+
+    The motion verdict depends on the last accepted frame, which isn't known yet, so it is
+    computed speculatively against the currently published reference and against the previous
+    frame (the reference whenever that one gets accepted). Returns a dict of products; "motion"
+    maps reference frame index -> flow magnitude. Anything skipped here is computed by the merge
+    stage if it turns out to be needed.
+    """
+    config = _worker.config
+    size, small_size = config["size"], config["small_size"]
+    ctx = FrameContext(_worker.ring.frames[slot], size=size, small_size=small_size)
+    ctx.put("resized", ctx.frame)
+    products = {"small_gray": ctx.small_gray}
+
+    references = []
+    published = _worker.reference.read()
+    if published is not None:
+        references.append(published)
+    if previous_slot is not None and (published is None or published[0] != previous_index):
+        previous = FrameContext(_worker.ring.frames[previous_slot], size=size, small_size=small_size)
+        previous.put("resized", previous.frame)
+        references.append((previous_index, previous.gray, previous.small_gray))
+    # Only references this frame differs from matter - against the others frame_diff rejects it
+    references = [ref for ref in references if _changed(ctx, ref[2])]
+    if published is not None and not references:
+        return products
+
+    products["clear"] = is_clear_image(ctx.gray, **config["clarity"])
+    if not products["clear"]:
+        return products
+
+    products["motion"] = {index: motion_magnitude(gray, ctx.gray) for index, gray, _ in references}
+    if references and max(products["motion"].values()) <= config["motion_threshold"]:
+        return products
+
+    products["phash"] = get_phash(ctx.frame)
+    if _worker.engine is not None:
+        products["features"] = _worker.engine.embed([ctx.frame])[0].numpy()
+    return products
+
+
+# Parallel front half of the frame pipeline.
+# submit() resizes a decoded frame into a shared slot and hands the slot to a process pool;
+# results() yields FrameContexts in submission order with the workers' products filled in.
+# The caller (the merge stage) runs the usual FramePipeline on them one by one and calls
+# set_reference() on every accepted frame, so accept/reject decisions match a sequential run:
+# a motion magnitude is only used if it was computed against the frame that really is the
+# reference at merge time, otherwise the motion stage runs in the merge stage as before.
+class ParallelFrameAnalyzer:
+    def __init__(self, workers=None, slots=None, size=(640, 360), small_size=(160, 90),
+                 diff_threshold=1.5, clarity=None, motion_threshold=0.05, features=True,
+                 embedding=None, threads_per_worker=1):
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = max(slots or 2 * self.workers + 2, self.workers + 2)
+        self.size = size
+        self.small_size = small_size
+        self.ring = SharedFrameRing(self.slots, size)
+        self.reference = SharedReference(size, small_size)
+        self.reference_index = None
+
+        config = {
+            "slots": self.slots,
+            "size": size,
+            "small_size": small_size,
+            "diff_threshold": diff_threshold,
+            "clarity": clarity or {},
+            "motion_threshold": motion_threshold,
+            "features": features,
+            "embedding": embedding or {},
+            "threads_per_worker": threads_per_worker,
+        }
+        # spawn: workers must not inherit torch / OpenMP state or running threads from this process
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.ring.name, self.reference.name, config),
+        )
+        self._free = list(range(self.slots))
+        self._in_flight = deque()  # (slot, index, future), submission order
+        self._ready = deque()      # (index, frame, products), submission order
+        self._last = None          # (slot, index) of the newest submitted frame
+        self._held = None          # slot still read as the previous frame of its successor
+
+        self.frames_submitted = 0
+        self.motion_reused = 0
+        self.motion_missed = 0
+
+    def _collect(self):
+        slot, index, future = self._in_flight.popleft()
+        products = future.result()
+        # Copy the frame out; an accepted frame outlives its slot
+        frame = self.ring.frames[slot].copy()
+        # The successor's worker has finished with the frame before this one
+        if self._held is not None:
+            self._free.append(self._held)
+        self._held = slot
+        self._ready.append((index, frame, products))
+
+    def submit(self, frame, index):
+        """Queue a decoded frame. Blocks only while every slot is busy."""
+        while self._in_flight and self._in_flight[0][2].done():
+            self._collect()
+        while not self._free:
+            self._collect()  # wait for the oldest frame
+        slot = self._free.pop()
+        cv2.resize(frame, self.size, dst=self.ring.frames[slot])
+        previous_slot, previous_index = self._last if self._last is not None else (None, None)
+        self._in_flight.append((slot, index, self.executor.submit(_analyze, slot, previous_slot, previous_index)))
+        self._last = (slot, index)
+        self.frames_submitted += 1
+
+    def results(self):
+        """Yield FrameContexts for finished frames, in submission order."""
+        while self._in_flight and self._in_flight[0][2].done():
+            self._collect()
+        while self._ready:
+            yield self._make_context(*self._ready.popleft())
+
+    def drain(self):
+        """Wait for everything in flight and yield the remaining FrameContexts in order."""
+        while self._in_flight:
+            self._collect()
+        yield from self.results()
+
+    def _make_context(self, index, frame, products):
+        ctx = FrameContext(frame, index=index, size=self.size, small_size=self.small_size)
+        ctx.put("resized", frame)
+        motion = products.pop("motion", {})
+        for name, value in products.items():
+            ctx.put(name, value)
+        if self.reference_index in motion:
+            ctx.put("motion_magnitude", motion[self.reference_index])
+            self.motion_reused += 1
+        elif motion:
+            self.motion_missed += 1
+        return ctx
+
+    def set_reference(self, ctx):
+        """Publish an accepted frame as the reference for frame_diff / motion."""
+        self.reference.write(ctx.index, ctx.gray, ctx.small_gray)
+        self.reference_index = ctx.index
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "slots": self.slots,
+            "frames_submitted": self.frames_submitted,
+            "in_flight": len(self._in_flight),
+            "motion_reused": self.motion_reused,
+            "motion_missed": self.motion_missed,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.ring.close()
+        self.reference.close()
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from frame_quality import hamming_distances
+
+
+def hash_to_int(value):
+    """Accept an int or an imagehash.ImageHash and return the hash as an int."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(str(value), 16)
+
+
+def pack_hashes(hashes):
+    """Frame hashes (ints, imagehash.ImageHash or a uint64 array) as a packed uint64 array."""
+    if isinstance(hashes, np.ndarray):
+        return hashes.astype(np.uint64, copy=False)
+    return np.array([hash_to_int(h) for h in hashes or []], dtype=np.uint64)
+
+
+# Single unit-length vector describing a whole mosaic: the mean of its L2-normalised frame embeddings
+def mosaic_embedding(features):
+    features = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+    features = features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+    mean = features.mean(axis=0)
+    return mean / max(float(np.linalg.norm(mean)), 1e-12)
+
+
+# Gemini response cache keyed on (prompt, mosaic embedding and/or frame pHash set).
+# A lookup hits when an entry for the same prompt is within cos_threshold cosine similarity
+# and every query frame hash is within hash_radius bits of one of the entry's hashes.
+# Entries expire after ttl seconds and the least recently used entry is evicted at max_entries.
+# With a path, the cache is loaded at start-up and saved every save_every stores (and on save()).
+class SemanticCache:
+    def __init__(self, max_entries=256, ttl=600.0, cos_threshold=0.97, hash_radius=6, path=None, save_every=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cos_threshold = cos_threshold
+        self.hash_radius = hash_radius
+        self.path = path
+        self.save_every = save_every
+
+        self.entries = OrderedDict()  # id -> entry dict, least recently used first
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # one save at a time: they share the temp file
+        self._next_id = 0
+        self._unsaved = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def _matches(self, entry, prompt, embedding, hashes):
+        if entry["prompt"] != prompt:
+            return False
+        if embedding is not None and entry["embedding"] is not None:
+            if float(np.dot(embedding, entry["embedding"])) < self.cos_threshold:
+                return False
+        if len(hashes) and len(entry["hashes"]):
+            # Every query hash needs an entry hash within hash_radius bits
+            if hamming_distances(hashes, entry["hashes"]).min(axis=1).max() > self.hash_radius:
+                return False
+        return embedding is not None or bool(len(hashes))
+
+    def _expire(self, now):
+        expired = [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self.entries[key]
+        self.expirations += len(expired)
+
+    def lookup(self, prompt, embedding=None, hashes=None):
+        """Return the cached description for a similar enough request, or None."""
+        embedding = None if embedding is None else np.asarray(embedding, dtype=np.float32)
+        hashes = pack_hashes(hashes)
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            for key, entry in reversed(self.entries.items()):
+                if self._matches(entry, prompt, embedding, hashes):
+                    self.entries.move_to_end(key)
+                    entry["hits"] += 1
+                    self.hits += 1
+                    return entry["description"]
+            self.misses += 1
+            return None
+
+    def nearest(self, prompt, embedding, min_similarity=0.9):
+        """Description of the most similar entry for prompt whose embedding is at least
+        min_similarity cosine similar, or None. A looser match than lookup() for when there is
+        no time to ask Gemini; it doesn't count as a hit or miss."""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        best, best_similarity = None, min_similarity
+        with self.lock:
+            self._expire(time.time())
+            for entry in self.entries.values():
+                if entry["prompt"] != prompt or entry["embedding"] is None:
+                    continue
+                similarity = float(np.dot(embedding, entry["embedding"]))
+                if similarity >= best_similarity:
+                    best, best_similarity = entry["description"], similarity
+        return best
+
+    def store(self, prompt, description, embedding=None, hashes=None):
+        entry = {
+            "prompt": prompt,
+            "description": description,
+            "embedding": None if embedding is None else np.asarray(embedding, dtype=np.float32),
+            "hashes": pack_hashes(hashes),
+            "created": time.time(),
+            "hits": 0,
+        }
+        with self.lock:
+            self.entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        # The snapshot is taken under save_lock too, so a later snapshot is never overwritten
+        # by an earlier one
+        with self.save_lock:
+            with self.lock:
+                data = [
+                    {**entry, "embedding": None if entry["embedding"] is None else entry["embedding"].tolist(),
+                     "hashes": [int(h) for h in entry["hashes"]]}
+                    for entry in self.entries.values()
+                ]
+                self._unsaved = 0
+            # Write to a temp file first so a crash never leaves a half-written cache
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump(data, cache_file)
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print(f"Could not load result cache from {self.path}: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            for entry in data:
+                if now - entry["created"] > self.ttl:
+                    continue
+                if entry["embedding"] is not None:
+                    entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+                entry["hashes"] = pack_hashes(entry["hashes"])
+                self.entries[self._next_id] = entry
+                self._next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
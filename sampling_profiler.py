@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# On-demand sampling profiler for flame graphs (GET /debug/profile when PROFILING=1).
+# Off by default: the endpoint exposes code structure, and nothing is sampled until a profile is
+# requested. While one runs, a background thread snapshots every thread's Python stack each
+# interval seconds; identical stacks are counted and returned in the folded format
+# ("thread;outer;...;inner count" per line) read by flamegraph.pl, speedscope and inferno.
+# Native code (OpenCV, torch) is attributed to the Python frame that called it.
+ENABLED = os.getenv("PROFILING", "0") == "1"
+
+# Innermost frames in these files are threads parked on a lock, queue or socket
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socketserver.py")
+
+_running = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, include_idle=False, max_depth=128, exclude=()):
+        self.interval = interval
+        self.exclude = set(exclude)  # thread idents not to sample
+        self.include_idle = include_idle
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident in self.exclude:
+                    continue
+                if not self.include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile(seconds, interval=0.005, include_idle=False):
+    """Sample all other threads for seconds and return the folded stacks. One profile at a
+    time; raises RuntimeError if another one is running."""
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A profile is already being captured")
+    try:
+        profiler = SamplingProfiler(interval=interval, include_idle=include_idle, exclude=[threading.get_ident()])
+        profiler.start()
+        time.sleep(seconds)
+        profiler.stop()
+        return profiler.folded()
+    finally:
+        _running.release()
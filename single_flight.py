@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+ROLES = ("leader", "joined", "reused")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Single-flight request coalescing: concurrent calls with the same key share one execution.
+# The first caller for a key (the leader) runs the work; callers arriving while it is in flight
+# join it and receive the same result (or exception). A result that passes reusable(result) is
+# also handed to callers arriving within reuse_window seconds after it completed.
+# do() is for threads (Flask), do_async() for one asyncio event loop (the async server). In the
+# async version the work runs as its own task, so a leader whose client disconnects doesn't
+# cancel it for the callers that joined.
+class SingleFlight:
+    def __init__(self, reuse_window=2.0, reusable=None):
+        self.reuse_window = reuse_window
+        self.reusable = reusable or (lambda result: True)
+        self._calls = {}    # key -> _Call (threads)
+        self._tasks = {}    # key -> asyncio.Task
+        self._recent = {}   # key -> (completed monotonic time, result)
+        self._lock = threading.Lock()
+
+        self.counts = dict.fromkeys(ROLES, 0)
+        self.failed = 0
+
+    def _reuse(self, key, now):
+        recent = self._recent.get(key)
+        if recent is None:
+            return None
+        if now - recent[0] > self.reuse_window:
+            del self._recent[key]
+            return None
+        return recent
+
+    def _completed(self, key, result):
+        if not self.reuse_window or not self.reusable(result):
+            return
+        now = time.monotonic()
+        with self._lock:
+            for stale in [k for k, (completed, _) in self._recent.items() if now - completed > self.reuse_window]:
+                del self._recent[stale]
+            self._recent[key] = (now, result)
+
+    def do(self, key, function):
+        """(function() or the shared result, role) - role is "leader", "joined" or "reused"."""
+        with self._lock:
+            recent = self._reuse(key, time.monotonic())
+            if recent is not None:
+                self.counts["reused"] += 1
+                return recent[1], "reused"
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self.counts["leader" if leader else "joined"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, "joined"
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            self.failed += 1
+            raise
+        else:
+            self._completed(key, call.result)
+            return call.result, "leader"
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, function):
+        """Coroutine version of do(); function() returns the awaitable doing the work. It is
+        called under the lock, only when this call leads; if it raises, the call fails and no
+        flight is started."""
+        with self._lock:
+            recent = self._reuse(key, time.monotonic())
+            if recent is not None:
+                self.counts["reused"] += 1
+                return recent[1], "reused"
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(function())
+                task.add_done_callback(lambda done: self._task_done(key, done))
+            self.counts["leader" if leader else "joined"] += 1
+        return await asyncio.shield(task), "leader" if leader else "joined"
+
+    def _task_done(self, key, task):
+        with self._lock:
+            del self._tasks[key]
+        if task.cancelled():
+            self.failed += 1
+        elif task.exception() is not None:  # also marks it retrieved if every caller went away
+            self.failed += 1
+        else:
+            self._completed(key, task.result())
+
+    def stats(self):
+        requests = sum(self.counts.values())
+        shared = self.counts["joined"] + self.counts["reused"]
+        return {
+            "requests": requests,
+            "executions": self.counts["leader"],
+            "joined": self.counts["joined"],
+            "reused": self.counts["reused"],
+            "failed": self.failed,
+            "in_flight": len(self._calls) + len(self._tasks),
+            "dedup_ratio": round(shared / requests, 3) if requests else 0.0,
+            "reuse_window": self.reuse_window,
+        }
@@ -0,0 +1,50 @@
+import json
+
+# Server-Sent Events helpers: encoding the vision service's progressive responses and reading
+# event streams (Gemini's streamGenerateContent?alt=sse, or the service's own from a client).
+
+
+def encode_event(event, data):
+    """One SSE event with a JSON data payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _field(line):
+    name, _, value = line.partition(":")
+    return name, value[1:] if value.startswith(" ") else value
+
+
+def parse_events(lines):
+    """(event, data) pairs from an iterable of text lines; event defaults to "message"."""
+    event, data = None, []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            if data:
+                yield event or "message", "\n".join(data)
+            event, data = None, []
+            continue
+        name, value = _field(line)
+        if name == "event":
+            event = value
+        elif name == "data":
+            data.append(value)
+    if data:
+        yield event or "message", "\n".join(data)
+
+
+async def iter_data(content):
+    """Data payloads of an SSE stream read from an aiohttp StreamReader, as they arrive."""
+    data = []
+    async for raw in content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield "\n".join(data)
+            data = []
+            continue
+        name, value = _field(line)
+        if name == "data":
+            data.append(value)
+    if data:
+        yield "\n".join(data)
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+POLICIES = ("drop_oldest", "coalesce")
+
+
+# Background queue for slow async work (Gemini calls) submitted from a synchronous loop.
+# An asyncio event loop runs on its own thread; submit() never blocks the caller.
+# The queue depth is bounded:
+#   drop_oldest - when full, the oldest pending job is dropped
+#   coalesce    - a new job replaces a pending job with the same key (drop_oldest otherwise)
+# Callbacks run on the queue thread, strictly in submission order, even when
+# concurrency > 1 lets several jobs be in flight at once.
+class SubmissionQueue:
+    def __init__(self, handler, max_depth=2, policy="drop_oldest", concurrency=1, name="submission-queue"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {POLICIES}")
+        self.handler = handler
+        self.max_depth = max_depth
+        self.policy = policy
+        self.concurrency = concurrency
+
+        self._pending = deque()  # [seq, key, job, callback]
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._next_delivery = 0
+        self._finished = {}  # seq -> (callback, result), None for dropped jobs
+        self._workers = 0
+        self._idle = threading.Event()
+        self._idle.set()
+
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, job, callback=None, key=None):
+        """Queue job for handler(job); callback(result) is called once it completes. Never blocks."""
+        with self._lock:
+            seq = next(self._seq)
+            self.submitted += 1
+            self._idle.clear()
+
+            if self.policy == "coalesce" and key is not None:
+                for entry in self._pending:
+                    if entry[1] == key:
+                        # Newer job takes over the older one's place in line
+                        self._finished[entry[0]] = None
+                        entry[0], entry[2], entry[3] = seq, job, callback
+                        self.coalesced += 1
+                        break
+                else:
+                    self._enqueue(seq, key, job, callback)
+            else:
+                self._enqueue(seq, key, job, callback)
+
+        self.loop.call_soon_threadsafe(self._spawn_workers)
+        return seq
+
+    def _enqueue(self, seq, key, job, callback):
+        while len(self._pending) >= self.max_depth:
+            dropped = self._pending.popleft()
+            self._finished[dropped[0]] = None
+            self.dropped += 1
+        self._pending.append([seq, key, job, callback])
+
+    def _spawn_workers(self):
+        while self._workers < self.concurrency and self._pending:
+            self._workers += 1
+            self.loop.create_task(self._worker())
+        self._deliver()
+
+    async def _worker(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    seq, _, job, callback = self._pending.popleft()
+                try:
+                    result = await self.handler(job)
+                    self.completed += 1
+                except Exception as e:
+                    self.failed += 1
+                    result = e
+                with self._lock:
+                    self._finished[seq] = (callback, result)
+                self._deliver()
+        finally:
+            self._workers -= 1
+            self._deliver()
+
+    def _deliver(self):
+        # Hand results to callbacks in submission order, skipping dropped/coalesced jobs
+        while True:
+            with self._lock:
+                if self._next_delivery not in self._finished:
+                    if not self._pending and self._workers == 0:
+                        self._idle.set()
+                    return
+                entry = self._finished.pop(self._next_delivery)
+                self._next_delivery += 1
+            if entry is not None:
+                callback, result = entry
+                if callback is not None:
+                    try:
+                        callback(result)
+                    except Exception as e:
+                        print(f"Submission callback failed: {e}")
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": self.depth,
+            "in_flight": self._workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def join(self, timeout=None):
+        """Wait until every queued job has finished and been delivered."""
+        return self._idle.wait(timeout)
+
+    def close(self, timeout=None):
+        self.join(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
@@ -26,6 +26,19 @@ def test_vision_service():
         print(f"❌ Error: {e}")
         return False
     
+    # Readiness: the service answers /health right away but loads the model in the background
+    try:
+        response = requests.get("http://localhost:5000/ready", timeout=5)
+        status = response.json()
+        if response.status_code == 200:
+            print(f"✅ Model ready (loaded in {status['model']['load_seconds']}s)")
+        else:
+            print("⚠️ Model still loading - the first analysis will wait for it")
+            if status['model'].get('error'):
+                print(f"   Load error: {status['model']['error']}")
+    except Exception as e:
+        print(f"⚠️ Readiness check failed: {e}")
+    
     # Test 2: Video Stream Check
     print("\n2. Testing video stream accessibility...")
     video_url = input("Enter your video stream URL (or press Enter for default): ").strip()
@@ -1,186 +1,331 @@
-import cv2
+import time
+STARTED_AT = time.perf_counter()  # for start-up time reporting
+
 import os
-import torch
-import torch.nn as nn
-import torchvision.transforms as transforms
-from torchvision.models import resnet18
-import numpy as np
-from PIL import Image
-import imagehash
 import asyncio
-import aiohttp
-import time
-import json
-import base64
-from flask import Flask, jsonify, request
+import sys
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
+from capture_workers import CaptureWorkerPool
+from camera_registry import CameraRegistry
+from deadline import Deadline, StageEstimates
+from frame_filters import is_clear_image
+from frame_quality import phash_batch
+from model_loader import embedding_model_from_env
+from gemini_client import GeminiError, get_client
+from image_encoding import ImageArchiver
+from mosaic import MosaicComposer, composer_from_env, novelty_scores
+from result_cache import SemanticCache, mosaic_embedding
+from single_flight import SingleFlight
+from sse import encode_event
+import metrics
+from metrics import timed
 
 load_dotenv()
 
-# Use GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
+# Batched ResNet trunk (for feature extraction); EMBEDDING_BACKEND picks eager/torchscript/compile/bf16/int8.
+# Loaded lazily: torch is only imported once warm_up() runs or the first request needs it,
+# and the trunk is cached under MODEL_CACHE_DIR so later boots skip torchvision.
+embedding_model = embedding_model_from_env()
 
-# Load pre-trained ResNet model (for feature extraction)
-model = resnet18(weights="IMAGENET1K_V1")
-model = nn.Sequential(*list(model.children())[:-1])  # Remove last fully connected layer
-model = model.to(device)
-model.eval()
-
-# Define the preprocessing pipeline
-preprocess = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
+# Shared Gemini client with a pooled keep-alive session
+gemini_client = get_client()
 
 # Flask app
 app = Flask(__name__)
 CORS(app)
 
+# Picks the mosaic grid, tile scale and JPEG quality within the MOSAIC_* pixel / byte / token budgets
+mosaic_composer = composer_from_env()
+
+# Mosaics are encoded in memory; copies in captured_frames/ are written in the background (ARCHIVE_MOSAICS=0 turns this off)
+archiver = ImageArchiver() if os.getenv("ARCHIVE_MOSAICS", "1") != "0" else None
+
+# Descriptions of recently seen scenes, reused when the captured frames barely changed
+result_cache = SemanticCache(max_entries=256, ttl=300.0, path=os.getenv("RESULT_CACHE_PATH"))
+
+ENVIRONMENT_PROMPT = "I am providing you an image. Describe the scene in the image with utmost detail, focusing on every minute aspect such as colors, objects, textures, lighting, and any visible patterns. Provide a natural, conversational description as if you're telling someone what you see. Keep it concise but informative, around 3-4 sentences."
+
+# Used instead when a request's deadline leaves too little time for the full description
+SHORT_ENVIRONMENT_PROMPT = "I am providing you an image. Describe the scene in one or two sentences: the setting, the main objects and any people."
+SHORT_MAX_OUTPUT_TOKENS = 120
+
+# Seconds a request waits for the capture worker to buffer enough frames
+CAPTURE_TIMEOUT = 10.0
+
+# Latency budget of an /analyze-environment request that doesn't send deadline_ms (0: none).
+# With a deadline, capture gets the time the later stages are not expected to need, and the
+# mosaic, prompt and result source are degraded as the time left shrinks (see
+# prepare_environment_analysis and prepare_frames_analysis).
+DEFAULT_DEADLINE_MS = float(os.getenv("ANALYZE_DEADLINE_MS", "0"))
+# Share of the remaining time capture gets even when the later stages' estimates take it all,
+# and the point of the capture wait from which blurrier frames are accepted
+MIN_CAPTURE_SHARE = 0.25
+RELAX_AFTER_SHARE = 0.5
+# Cosine similarity at which an older description stands in when Gemini can't answer in time
+APPROXIMATE_SIMILARITY = float(os.getenv("DEADLINE_CACHE_SIMILARITY", "0.9"))
+# Seconds of the deadline kept back from the Gemini call for building the response
+FINISH_MARGIN = 0.05
+
+# Recent stage latencies for planning against a deadline, starting from these defaults.
+# gemini_compact / gemini_short are calls with the compact mosaic / also the short prompt.
+stage_estimates = StageEstimates({"embed": 0.3, "encode": 0.05, "gemini": 6.0, "gemini_compact": 4.5,
+                                  "gemini_short": 2.5},
+                                 groups=[("gemini", "gemini_compact", "gemini_short")])
+
+# Single-tile mosaic for requests short on time
+compact_composer = MosaicComposer(max_tokens=int(os.getenv("DEADLINE_MOSAIC_TOKENS", "258")),
+                                  max_tiles=mosaic_composer.max_tiles, quality=80, order=mosaic_composer.order)
+
+# Concurrent /analyze-environment requests for the same stream and prompt share one capture and
+# Gemini call; a successful result is also handed to identical requests for ANALYZE_REUSE_SECONDS
+# after it completes (0 turns the reuse window off)
+analysis_flights = SingleFlight(reuse_window=float(os.getenv("ANALYZE_REUSE_SECONDS", "2")),
+                                reusable=lambda result: "error" not in result)
+
+def analysis_options(data):
+    """prepare_environment_analysis keyword arguments from a request body. Raises ValueError."""
+    return {"deadline": Deadline.from_ms(data.get("deadline_ms", DEFAULT_DEADLINE_MS))}
+
+# Requests only share an analysis planned for the same deadline
+def analysis_key(video_url, deadline=None):
+    return (video_url, ENVIRONMENT_PROMPT, deadline.seconds if deadline is not None else None)
+
 # Function to get frame features
+@timed("embed")
 def get_frame_features(frame):
-    pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    frame_preprocessed = preprocess(pil_image).unsqueeze(0).to(device)
-    with torch.no_grad():
-        features = model(frame_preprocessed)
-    return features.cpu()
-
-def get_phash(image):
-    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    return imagehash.phash(pil_image)
-
-def is_clear_image(gray_frame, laplacian_threshold=300, edge_threshold=100):
-    laplacian_var = cv2.Laplacian(gray_frame, cv2.CV_64F).var()
-    if laplacian_var < laplacian_threshold:
-        return False
-    edges = cv2.Canny(gray_frame, 100, 200)
-    return np.sum(edges > 0) > edge_threshold
-
-def encode_image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-async def process_image_with_gemini(image_path, prompt):
-    api_key = os.getenv("GEMINI_API_KEY")
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent?key={api_key}"
-    
-    base64_image = encode_image_to_base64(image_path)
-    
-    data = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [
-                    {"text": prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": base64_image
-                        }
-                    }
-                ]
-            }
-        ],
-        "generation_config": {
-            "temperature": 0.8,
-            "max_output_tokens": 900
-        }
+    return embedding_model.get().embed([frame])
+
+# Batched variant - one forward pass for the whole list of frames
+@timed("embed")
+def get_frames_features(frames):
+    return embedding_model.get().embed(frames)
+
+# Frames checked per second of stream adapt to scene activity (FRAME_SAMPLING=fixed: every 5th frame).
+# The minimum keeps enough fresh frames buffered for a request (4 within CAPTURE max_age).
+SAMPLING_OPTIONS = None
+if os.getenv("FRAME_SAMPLING", "adaptive") != "fixed":
+    SAMPLING_OPTIONS = {
+        "min_rate": float(os.getenv("SAMPLE_MIN_FPS", "2")),
+        "max_rate": float(os.getenv("SAMPLE_MAX_FPS", "8")),
+        "cpu_budget": float(os.getenv("SAMPLE_CPU_BUDGET", "0.25")),
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(api_url, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['candidates'][0]['content']['parts'][0]['text']
-                else:
-                    error_text = await response.text()
-                    return f"Error processing image: {response.status}, {error_text}"
-        except Exception as e:
-            return f"Error: {str(e)}"
-
-def capture_and_analyze_environment(video_url, num_frames=4):
-    """Capture frames from video stream and analyze with Gemini"""
+# One long-lived reader thread per video URL, with the relaxed quality check applied as frames arrive
+capture_pool = CaptureWorkerPool(
+    idle_ttl=120.0,
+    frame_skip=5,
+    frame_filter=lambda gray: is_clear_image(gray, laplacian_threshold=100, edge_threshold=50),
+    sampler_options=SAMPLING_OPTIONS,
+)
+
+# Frames the capture filter rejected that a request running out of time still takes
+def is_roughly_clear(gray):
+    return is_clear_image(gray, laplacian_threshold=50, edge_threshold=25)
+
+async def process_image_with_gemini(base64_image, prompt, timeout=None, **generation_config):
+    # Shared pooled client (keep-alive, retries on 429/5xx, concurrency limit); timeout is what
+    # is left of the request's deadline
+    try:
+        if timeout is None:
+            return await gemini_client.generate(prompt, base64_image, **generation_config)
+        if timeout <= 0:
+            return "Error: no time left for Gemini within the deadline"
+        return await asyncio.wait_for(gemini_client.generate(prompt, base64_image, **generation_config), timeout)
+    except asyncio.TimeoutError:
+        return f"Error: Gemini did not answer within the deadline ({timeout:.1f}s left)"
+    except GeminiError as e:
+        return str(e)
+
+def with_budget(result, deadline):
+    """result plus the degradations applied and the budget summary, for requests with a deadline"""
+    if deadline is not None and deadline.bounded:
+        result["degradations"] = list(deadline.degradations)
+        result["budget"] = deadline.report()
+    return result
+
+def capture_within_deadline(video_url, num_frames, deadline):
+    """Capture for a request with a deadline: clear frames for as long as the later stages'
+    estimates leave, accepting blurrier frames once half of that time is gone."""
+    remaining = deadline.remaining()
+    reserve = stage_estimates.total("embed", "encode", "gemini")
+    allowance = min(CAPTURE_TIMEOUT, max(remaining - reserve, remaining * MIN_CAPTURE_SHARE))
+    started = time.monotonic()
+    # A stream still connecting when the allowance is up is left to connect for the next request
+    worker = capture_pool.open_worker(video_url, open_timeout=max(allowance, 0), keep_connecting=True)
+    if worker is None:
+        return None
+    allowance -= time.monotonic() - started
+    image_buffer, counts = worker.get_frames_relaxed(num_frames, timeout=max(allowance, 0),
+                                                     relax_after=allowance * RELAX_AFTER_SHARE,
+                                                     relaxed_filter=is_roughly_clear)
+    if counts["relaxed"]:
+        deadline.degrade("relaxed_clarity")
+    if counts["any"]:
+        deadline.degrade("unfiltered_frames")
+    if 0 < len(image_buffer) < num_frames:
+        deadline.degrade("fewer_frames")
+    return image_buffer
+
+def prepare_environment_analysis(video_url, num_frames=4, deadline=None):
+    """Capture frames and build the mosaic - the CPU-bound half of an analysis.
+
+    Returns (result, pending). result is a finished response (error or cached description);
+    otherwise pending holds the encoded mosaic and cache key for the Gemini call. With a
+    deadline (deadline.Deadline) capture only waits as long as the budget allows.
+    """
     print(f"Starting frame capture from: {video_url}")
-    cap = cv2.VideoCapture(video_url)
-    
-    if not cap.isOpened():
+    print(f"Attempting to capture {num_frames} frames...")
+
+    # Frames come from the stream's long-lived capture worker instead of a fresh VideoCapture
+    if deadline is not None and deadline.bounded:
+        image_buffer = capture_within_deadline(video_url, num_frames, deadline)
+    else:
+        image_buffer = capture_pool.get_frames(video_url, num_frames, timeout=CAPTURE_TIMEOUT)
+    if image_buffer is None:
         print("ERROR: Could not open video stream")
-        return {"error": "Couldn't open video stream"}
+        return with_budget({"error": "Couldn't open video stream"}, deadline), None
+
+    if len(image_buffer) == 0:
+        print("ERROR: No clear frames captured")
+        return with_budget({"error": "Could not capture clear frames"}, deadline), None
     
+    print(f"Successfully captured {len(image_buffer)} frames, combining...")
+    return prepare_frames_analysis(image_buffer, deadline=deadline)
+
+def prepare_frames_analysis(image_buffer, features=None, name="environment", deadline=None):
+    """Cache lookup and mosaic encoding for already captured frames.
+
+    features are the frames' embeddings when the caller has batched them (camera registry);
+    name prefixes the archived mosaic's filename. With a deadline, the mosaic and prompt are
+    planned against the time left.
+    """
     save_folder = 'captured_frames'
     os.makedirs(save_folder, exist_ok=True)
-    
-    image_buffer = []
-    frame_skip = 5  # Reduced from 10 for faster capture
-    frame_counter = 0
-    max_attempts = 300  # Reduced from 500
-    attempts = 0
-    
-    print(f"Attempting to capture {num_frames} frames...")
-    
-    try:
-        while len(image_buffer) < num_frames and attempts < max_attempts:
-            ret, frame = cap.read()
-            if not ret or frame is None:
-                attempts += 1
-                time.sleep(0.01)  # Small delay to prevent busy loop
-                continue
-            
-            frame_counter += 1
-            if frame_counter % frame_skip != 0:
-                continue
-            
-            attempts += 1
-            frame_resized = cv2.resize(frame, (640, 360))
-            gray_frame = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2GRAY)
-            
-            # Relaxed quality check - accept more frames
-            if not is_clear_image(gray_frame, laplacian_threshold=100, edge_threshold=50):
-                continue
-            
-            image_buffer.append(frame_resized)
-            print(f"Captured frame {len(image_buffer)}/{num_frames}")
-        
-        if len(image_buffer) == 0:
-            print("ERROR: No clear frames captured")
-            return {"error": "Could not capture clear frames"}
-        
-        print(f"Successfully captured {len(image_buffer)} frames, combining...")
-        
-        # Combine frames horizontally (or vertically if too many)
-        if len(image_buffer) <= 3:
-            combined_image = np.hstack(image_buffer)
-        else:
-            # For 4+ frames, arrange in a 2x2 grid
-            top_row = np.hstack(image_buffer[:len(image_buffer)//2])
-            bottom_row = np.hstack(image_buffer[len(image_buffer)//2:])
-            combined_image = np.vstack([top_row, bottom_row])
-        
-        # Save combined image
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-        filename = os.path.join(save_folder, f"environment_{timestamp}.jpg")
-        cv2.imwrite(filename, combined_image)
-        
-        print(f"Image saved to {filename}, sending to Gemini...")
-        
-        # Analyze with Gemini
-        prompt = "I am providing you an image. Describe the scene in the image with utmost detail, focusing on every minute aspect such as colors, objects, textures, lighting, and any visible patterns. Provide a natural, conversational description as if you're telling someone what you see. Keep it concise but informative, around 3-4 sentences."
-        
-        description = asyncio.run(process_image_with_gemini(filename, prompt))
-        
-        print("Analysis complete!")
-        
-        return {
+    deadline = deadline or Deadline()
+
+    # Same scene as a recent request? Return its description without calling Gemini
+    prompt = ENVIRONMENT_PROMPT
+    if features is None:
+        started = time.perf_counter()
+        features = get_frames_features(image_buffer).numpy()
+        stage_estimates.record("embed", time.perf_counter() - started)
+    embedding = mosaic_embedding(features)
+    hashes = phash_batch(image_buffer)
+    cached = result_cache.lookup(prompt, embedding, hashes)
+    if cached is not None:
+        print("Scene unchanged, returning cached description")
+        return with_budget({
             "success": True,
-            "description": description,
-            "image_path": filename,
-            "frames_captured": len(image_buffer)
-        }
-        
-    finally:
-        cap.release()
+            "description": cached,
+            "image_path": None,
+            "frames_captured": len(image_buffer),
+            "cached": True
+        }, deadline), None
+
+    # Against a deadline: the full mosaic and prompt if Gemini's usual latency fits in the time
+    # left, else a compact mosaic, else a description of a similar enough scene, else the compact
+    # mosaic with a short prompt. The similar description also stands in if Gemini runs late.
+    plan, composer, fallback = "gemini", mosaic_composer, None
+    if deadline.bounded:
+        fallback = result_cache.nearest(prompt, embedding, APPROXIMATE_SIMILARITY)
+        encode = stage_estimates.estimate("encode")
+        if not deadline.allows(encode + stage_estimates.estimate("gemini")):
+            if deadline.allows(encode + stage_estimates.estimate("gemini_compact")):
+                plan, composer = "gemini_compact", compact_composer
+                deadline.degrade("compact_mosaic")
+            elif fallback is not None:
+                print("No time left for Gemini, returning the description of a similar scene")
+                deadline.degrade("approximate_cache")
+                return with_budget({
+                    "success": True,
+                    "description": fallback,
+                    "image_path": None,
+                    "frames_captured": len(image_buffer),
+                    "cached": True
+                }, deadline), None
+            else:
+                plan, composer, prompt = "gemini_short", compact_composer, SHORT_ENVIRONMENT_PROMPT
+                deadline.degrade("compact_mosaic")
+                deadline.degrade("short_prompt")
+
+    # Grid, scale and quality within the mosaic budget, encoded in memory; the archived copy is
+    # written in the background
+    started = time.perf_counter()
+    base64_image, jpeg_bytes, mosaic = composer.compose(image_buffer, scores=novelty_scores(features))
+    stage_estimates.record("encode", time.perf_counter() - started)
+    timestamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+    filename = os.path.join(save_folder, f"{name}_{timestamp}.jpg")
+    if archiver is None or archiver.archive(filename, jpeg_bytes) is None:
+        filename = None
+
+    print(f"Encoded {mosaic['layout']} mosaic ({len(jpeg_bytes) // 1024} KB, ~{mosaic['estimated_tokens']} tokens), "
+          f"sending to Gemini...")
+
+    # process_image_with_gemini arguments: what is left of the deadline, and a shorter answer
+    # with the short prompt
+    describe_options = {}
+    if deadline.bounded:
+        describe_options["timeout"] = deadline.remaining() - FINISH_MARGIN
+    if plan == "gemini_short":
+        describe_options["max_output_tokens"] = SHORT_MAX_OUTPUT_TOKENS
+
+    return None, {
+        "base64_image": base64_image,
+        "prompt": prompt,
+        "embedding": embedding,
+        "hashes": hashes,
+        "image_path": filename,
+        "frames_captured": len(image_buffer),
+        "mosaic": mosaic,
+        "deadline": deadline,
+        "plan": plan,
+        "fallback": fallback,
+        "describe_options": describe_options,
+        "prepared_at": time.monotonic()
+    }
+
+def finish_environment_analysis(pending, description):
+    """Cache the Gemini description and build the response"""
+    deadline = pending.get("deadline")
+    plan = pending.get("plan", "gemini")
+    cached = False
+    if not description.startswith("Error"):
+        if "prepared_at" in pending:
+            stage_estimates.record(plan, time.monotonic() - pending["prepared_at"])
+        # Descriptions of a compact mosaic or a short prompt aren't reused for full requests
+        if plan == "gemini":
+            result_cache.store(pending["prompt"], description, pending["embedding"], pending["hashes"])
+    elif pending.get("fallback") is not None:
+        print(f"{description}; returning the description of a similar scene")
+        deadline.degrade("approximate_cache")
+        description, cached = pending["fallback"], True
+    elif deadline is not None and deadline.bounded:
+        return with_budget({"error": description, "frames_captured": pending["frames_captured"],
+                            "mosaic": pending["mosaic"]}, deadline)
+
+    print("Analysis complete!")
+    
+    return with_budget({
+        "success": True,
+        "description": description,
+        "image_path": pending["image_path"],
+        "frames_captured": pending["frames_captured"],
+        "mosaic": pending["mosaic"],
+        "cached": cached
+    }, deadline)
+
+def capture_and_analyze_environment(video_url, num_frames=4, deadline=None):
+    """Capture frames from video stream and analyze with Gemini"""
+    result, pending = prepare_environment_analysis(video_url, num_frames, deadline)
+    if result is not None:
+        return result
+
+    # Analyze with Gemini
+    description = asyncio.run(process_image_with_gemini(pending["base64_image"], pending["prompt"],
+                                                        **pending["describe_options"]))
+    return finish_environment_analysis(pending, description)
 
 @app.route('/analyze-environment', methods=['POST'])
 def analyze_environment():
@@ -188,13 +333,21 @@ def analyze_environment():
     try:
         data = request.json
         video_url = data.get('video_url', 'http://10.52.26.19:8080/video')
+        try:
+            options = analysis_options(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid deadline_ms: {e}"}), 400
         
         print(f"\n{'='*60}")
         print(f"New vision analysis request")
         print(f"Video URL: {video_url}")
         print(f"{'='*60}\n")
         
-        result = capture_and_analyze_environment(video_url)
+        result, role = analysis_flights.do(analysis_key(video_url, **options),
+                                           lambda: capture_and_analyze_environment(video_url, **options))
+        result = dict(result, coalesced=role != "leader")
+        if role != "leader":
+            print(f"Request {role} an analysis of the same stream")
         
         if "error" in result:
             print(f"ERROR: {result['error']}")
@@ -218,11 +371,215 @@ def analyze_environment():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def stream_environment_analysis(result, pending):
+    """SSE events for a prepared analysis: "meta", then "chunk" events with the description
+    text as Gemini generates it, then "done" with the same result /analyze-environment returns
+    (or "error")."""
+    if pending is None:
+        # Cached description - delivered whole
+        yield encode_event("meta", {"frames_captured": result["frames_captured"], "image_path": None, "cached": True})
+        yield encode_event("chunk", {"text": result["description"]})
+        yield encode_event("done", result)
+        return
+
+    yield encode_event("meta", {"frames_captured": pending["frames_captured"],
+                                "image_path": pending["image_path"], "mosaic": pending["mosaic"],
+                                "cached": False})
+    parts = []
+    try:
+        for text in gemini_client.stream_sync(pending["prompt"], pending["base64_image"]):
+            parts.append(text)
+            yield encode_event("chunk", {"text": text})
+    except GeminiError as e:
+        yield encode_event("error", {"error": str(e)})
+        return
+    description = "".join(parts)
+    if not description.strip():
+        # Nothing to cache or return - a stream that ends without text is a failed analysis
+        yield encode_event("error", {"error": "Gemini returned an empty description"})
+        return
+    yield encode_event("done", finish_environment_analysis(pending, description))
+
+@app.route('/analyze-environment/stream', methods=['POST'])
+def analyze_environment_stream():
+    """Like /analyze-environment, but the description is sent as Server-Sent Events while
+    Gemini generates it (see stream_environment_analysis)"""
+    data = request.get_json(silent=True) or {}
+    video_url = data.get('video_url', 'http://10.52.26.19:8080/video')
+    print(f"New streaming vision analysis request, video URL: {video_url}")
+
+    # Capture errors are still answered with a status code, before the stream starts
+    result, pending = prepare_environment_analysis(video_url)
+    if result is not None and "error" in result:
+        return jsonify(result), 500
+    return Response(stream_environment_analysis(result, pending), content_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Registered cameras analysed periodically in this process, sharing the capture pool, the
+# batched model and the Gemini client (VISION_CAMERAS names a JSON file to load at start-up)
+camera_registry = CameraRegistry(
+    capture_pool,
+    prepare=prepare_frames_analysis,
+    describe=process_image_with_gemini,
+    finish=finish_environment_analysis,
+    embed=lambda frames: get_frames_features(frames).numpy(),
+    policy=os.getenv("CAMERA_SCHEDULING", "weighted"),
+    max_batch=int(os.getenv("CAMERA_MAX_BATCH", "4")),
+    max_in_flight=int(os.getenv("CAMERA_MAX_IN_FLIGHT", "4")),
+)
+
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    """Scheduler and per-camera throughput / lag statistics"""
+    return jsonify(camera_registry.status()), 200
+
+@app.route('/cameras', methods=['POST'])
+def add_camera():
+    """Register a camera: {"camera_id", "video_url", "weight"?, "interval"?, "num_frames"?}"""
+    try:
+        camera = camera_registry.add_from_config(request.get_json(silent=True))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(camera.stats()), 201
+
+@app.route('/cameras/<camera_id>', methods=['GET'])
+def camera_status(camera_id):
+    status = camera_registry.camera_status(camera_id)
+    if status is None:
+        return jsonify({"error": f"Unknown camera '{camera_id}'"}), 404
+    return jsonify(status), 200
+
+@app.route('/cameras/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    if not camera_registry.remove_camera(camera_id):
+        return jsonify({"error": f"Unknown camera '{camera_id}'"}), 404
+    return jsonify({"removed": camera_id}), 200
+
+def load_cameras():
+    path = os.getenv("VISION_CAMERAS")
+    if path:
+        cameras = camera_registry.load(path)
+        print(f"Loaded {len(cameras)} cameras from {path}")
+
+# Seconds from process start until the server was about to accept requests
+startup_seconds = None
+
+def health_status():
+    return {
+        "status": "healthy",
+        "service": "vision-service",
+        "startup_seconds": startup_seconds,
+        "model": embedding_model.status(),
+        "gemini": gemini_client.metrics(),
+        "cache": result_cache.stats(),
+        "coalescing": analysis_flights.stats(),
+        "deadline": {"default_ms": DEFAULT_DEADLINE_MS, "estimates": stage_estimates.stats()},
+        "cameras": camera_registry.stats()
+    }
+
+def readiness_status():
+    return {
+        "ready": embedding_model.ready,
+        "service": "vision-service",
+        "model": embedding_model.status()
+    }
+
+# Counters and gauges read from the components' own stats when /metrics is scraped
+def collect_service_metrics():
+    gemini = gemini_client.metrics()
+    cache = result_cache.stats()
+    cameras = camera_registry.stats()
+    flights = analysis_flights.stats()
+    samples = [
+        ("model_ready", "gauge", "1 once the embedding model is loaded", {}, int(embedding_model.ready)),
+        ("gemini_requests_total", "counter", "Gemini requests sent", {}, gemini["requests"]),
+        ("gemini_failures_total", "counter", "Gemini requests that failed", {}, gemini["failures"]),
+        ("gemini_retries_total", "counter", "Gemini request retries", {}, gemini["retries"]),
+        ("gemini_in_flight", "gauge", "Gemini requests in progress", {}, gemini["in_flight"]),
+        ("cache_hits_total", "counter", "Result cache hits", {}, cache["hits"]),
+        ("cache_misses_total", "counter", "Result cache misses", {}, cache["misses"]),
+        ("cache_entries", "gauge", "Result cache entries", {}, cache["entries"]),
+        ("analyze_executions_total", "counter", "Analyses run for /analyze-environment", {},
+         flights["executions"]),
+        ("analyze_coalesced_total", "counter", "Requests answered by another request's analysis", {"mode": "joined"},
+         flights["joined"]),
+        ("analyze_coalesced_total", "counter", "Requests answered by another request's analysis", {"mode": "reused"},
+         flights["reused"]),
+        ("analyze_dedup_ratio", "gauge", "Share of analysis requests served without their own analysis", {},
+         flights["dedup_ratio"]),
+        ("cameras", "gauge", "Registered cameras", {}, cameras["cameras"]),
+        ("camera_analyses_in_flight", "gauge", "Camera analyses in progress", {}, cameras["in_flight"]),
+    ]
+    for worker in capture_pool.stats():
+        stream = {"video_url": worker["video_url"]}
+        samples += [
+            ("capture_frames_read_total", "counter", "Frames decoded per stream", stream, worker["frames_read"]),
+            ("capture_frames_buffered_total", "counter", "Clear frames buffered per stream", stream,
+             worker["frames_buffered"]),
+            ("capture_frames_rejected_total", "counter", "Frames rejected as blurry per stream", stream,
+             worker["frames_rejected"]),
+            ("capture_reconnects_total", "counter", "Stream reconnects", stream, worker["reconnects"]),
+            ("capture_decode_saved_seconds_total", "counter",
+             "Decode time saved by skipping unsampled frames and reduced MJPEG decoding", stream,
+             worker["decode"]["decode_saved_seconds"] if worker["decode"] else None),
+        ]
+    return samples
+
+metrics.REGISTRY.register_collector(collect_service_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text format: per-stage latency histograms plus service counters"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Folded-stack CPU profile for flame graphs (PROFILING=1 only), e.g. ?seconds=10"""
+    status, content_type, body = metrics.profile_request(request.args.to_dict())
+    return Response(body, status=status, content_type=content_type)
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "vision-service"}), 200
+    """Liveness check - answers as soon as the server is up"""
+    return jsonify(health_status()), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check - 503 until the model has finished loading"""
+    status = readiness_status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def report_startup():
+    global startup_seconds
+    startup_seconds = round(time.perf_counter() - STARTED_AT, 3)
+    print(f"Start-up took {startup_seconds:.2f}s (model loading in the background)")
 
 if __name__ == '__main__':
-    print("Starting Vision Service on port 5000...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # --async (or VISION_SERVER_MODE=async) serves the same endpoints from an asyncio server
+    if '--async' in sys.argv or os.getenv("VISION_SERVER_MODE") == "async":
+        from vision_async import run_async_server
+        print("Starting Vision Service (async) on port 5000...")
+        embedding_model.warm_up()
+        load_cameras()
+        report_startup()
+        run_async_server(
+            prepare=prepare_environment_analysis,
+            describe=process_image_with_gemini,
+            finish=finish_environment_analysis,
+            health=health_status,
+            readiness=readiness_status,
+            cameras=camera_registry,
+            stream=gemini_client.stream,
+            single_flight=analysis_flights,
+            flight_key=analysis_key,
+            request_options=analysis_options,
+            port=5000,
+        )
+    else:
+        print("Starting Vision Service on port 5000...")
+        # With debug=True the reloader re-runs this file in a child process; only that one serves
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            embedding_model.warm_up()
+            load_cameras()
+            report_startup()
+        app.run(host='0.0.0.0', port=5000, debug=True)
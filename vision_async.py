@@ -0,0 +1,298 @@
+import asyncio
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiohttp import web
+
+import metrics
+from sse import encode_event
+
+DEFAULT_VIDEO_URL = 'http://10.52.26.19:8080/video'
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # Same permissive CORS policy as flask_cors' CORS(app)
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+class ServiceBusy(Exception):
+    """max_pending analyses are already in progress (answered with 429)"""
+
+
+# Async serving mode for the vision service endpoints.
+# The CPU-bound half of an analysis (capture, OpenCV, torch, JPEG encoding) runs on a bounded
+# thread pool, the Gemini call is awaited without blocking, and once max_pending requests are
+# in progress new ones are turned away with 429 + Retry-After instead of piling up.
+# With stream (an async generator of text chunks for (prompt, base64_image)),
+# /analyze-environment/stream sends the description as Server-Sent Events while it is generated.
+# With single_flight (a single_flight.SingleFlight), /analyze-environment requests with the same
+# flight_key(video_url) share one analysis; requests that can join one aren't turned away as busy.
+# request_options(body) turns an /analyze-environment request body into keyword arguments for
+# prepare and flight_key (raising ValueError for a bad request); pending["describe_options"] are
+# passed on to describe.
+class AsyncVisionServer:
+    def __init__(self, prepare, describe, finish, health, readiness=None, cameras=None, stream=None,
+                 single_flight=None, flight_key=None, request_options=None, cpu_workers=2, max_pending=8,
+                 retry_after=2):
+        self.prepare = prepare
+        self.describe = describe
+        self.stream = stream
+        self.finish = finish
+        self.health_status = health
+        self.readiness_status = readiness
+        self.cameras = cameras
+        self.single_flight = single_flight
+        self.flight_key = flight_key or (lambda video_url, **options: video_url)
+        self.request_options = request_options or (lambda data: {})
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="vision-cpu")
+
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def make_app(self):
+        app = web.Application(middlewares=[cors_middleware])
+        app.router.add_post('/analyze-environment', self.analyze_environment)
+        if self.stream is not None:
+            app.router.add_post('/analyze-environment/stream', self.analyze_environment_stream)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/ready', self.ready)
+        app.router.add_get('/metrics', self.metrics)
+        app.router.add_get('/debug/profile', self.profile)
+        if self.cameras is not None:
+            app.router.add_get('/cameras', self.list_cameras)
+            app.router.add_post('/cameras', self.add_camera)
+            app.router.add_get('/cameras/{camera_id}', self.camera_status)
+            app.router.add_delete('/cameras/{camera_id}', self.remove_camera)
+        app.on_cleanup.append(self._shutdown)
+        return app
+
+    async def _shutdown(self, app):
+        self.executor.shutdown(wait=False)
+
+    async def analyze_environment(self, request):
+        """API endpoint to analyze environment from video stream"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        video_url = (data or {}).get('video_url', DEFAULT_VIDEO_URL)
+        try:
+            options = self.request_options(data or {})
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+        try:
+            print(f"New vision analysis request (async), video URL: {video_url}")
+            if self.single_flight is None:
+                result = await self._start_analysis(video_url, options)
+            else:
+                # Only a request that leads the flight starts an analysis, so only it can be turned
+                # away; joining one in flight (or just finished) costs no capture or Gemini call
+                key = self.flight_key(video_url, **options)
+                result, role = await self.single_flight.do_async(key, lambda: self._start_analysis(video_url, options))
+                result = dict(result, coalesced=role != "leader")
+        except ServiceBusy:
+            self.rejected += 1
+            return web.json_response(
+                {"error": "Vision service is busy, please retry"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        except Exception as e:
+            print(f"EXCEPTION in analyze_environment: {str(e)}")
+            traceback.print_exc()
+            self.failed += 1
+            return web.json_response({"error": str(e)}, status=500)
+
+        if "error" in result:
+            print(f"ERROR: {result['error']}")
+            self.failed += 1
+            return web.json_response(result, status=500)
+        self.completed += 1
+        return web.json_response(result, status=200)
+
+    def _start_analysis(self, video_url, options):
+        """Awaitable running one analysis, counted in pending from now until it finishes.
+        Raises ServiceBusy instead once max_pending analyses are in progress. As a flight's
+        function it runs under the SingleFlight lock, so the check and the flight registration
+        can't be separated."""
+        if self.pending >= self.max_pending:
+            raise ServiceBusy()
+        self.pending += 1
+        return self._release_pending(self._analyze(video_url, **options))
+
+    async def _release_pending(self, work):
+        try:
+            return await work
+        finally:
+            self.pending -= 1
+
+    async def _analyze(self, video_url, **options):
+        loop = asyncio.get_running_loop()
+        result, pending = await loop.run_in_executor(self.executor, partial(self.prepare, video_url, **options))
+        if pending is not None:
+            description = await self.describe(pending["base64_image"], pending["prompt"],
+                                              **pending.get("describe_options", {}))
+            result = self.finish(pending, description)
+        return result
+
+    async def analyze_environment_stream(self, request):
+        """Like /analyze-environment, but the description is sent as Server-Sent Events: "meta",
+        "chunk" events as Gemini generates the text, then "done" with the full result (or "error")"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return web.json_response(
+                {"error": "Vision service is busy, please retry"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        self.pending += 1
+        try:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            video_url = (data or {}).get('video_url', DEFAULT_VIDEO_URL)
+            print(f"New streaming vision analysis request (async), video URL: {video_url}")
+
+            loop = asyncio.get_running_loop()
+            try:
+                result, pending = await loop.run_in_executor(self.executor, self.prepare, video_url)
+            except Exception as e:
+                traceback.print_exc()
+                self.failed += 1
+                return web.json_response({"error": str(e)}, status=500)
+            if result is not None and "error" in result:
+                self.failed += 1
+                return web.json_response(result, status=500)
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                                   "Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            await response.prepare(request)
+            try:
+                await self._write_events(response, result, pending)
+            except ConnectionResetError:
+                print("Client disconnected from the description stream")
+            return response
+        finally:
+            self.pending -= 1
+
+    async def _write_events(self, response, result, pending):
+        if pending is None:
+            # Cached description - delivered whole
+            await response.write(encode_event("meta", {"frames_captured": result["frames_captured"],
+                                                       "image_path": None, "cached": True}).encode())
+            await response.write(encode_event("chunk", {"text": result["description"]}).encode())
+            await response.write(encode_event("done", result).encode())
+        else:
+            await response.write(encode_event("meta", {"frames_captured": pending["frames_captured"],
+                                                       "image_path": pending["image_path"],
+                                                       "mosaic": pending.get("mosaic"),
+                                                       "cached": False}).encode())
+            parts = []
+            try:
+                async for text in self.stream(pending["prompt"], pending["base64_image"]):
+                    parts.append(text)
+                    await response.write(encode_event("chunk", {"text": text}).encode())
+            except ConnectionResetError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                await response.write(encode_event("error", {"error": str(e)}).encode())
+                await response.write_eof()
+                return
+            description = "".join(parts)
+            if not description.strip():
+                # Nothing to cache or return - a stream that ends without text is a failed analysis
+                self.failed += 1
+                await response.write(encode_event("error", {"error": "Gemini returned an empty description"}).encode())
+                await response.write_eof()
+                return
+            await response.write(encode_event("done", self.finish(pending, description)).encode())
+        await response.write_eof()
+        self.completed += 1
+
+    async def health(self, request):
+        """Health check endpoint"""
+        status = self.health_status()
+        status["server"] = self.stats()
+        return web.json_response(status, status=200)
+
+    async def ready(self, request):
+        """Readiness check - 503 until the model has finished loading"""
+        status = self.readiness_status() if self.readiness_status else {"ready": True}
+        return web.json_response(status, status=200 if status["ready"] else 503)
+
+    async def metrics(self, request):
+        """Prometheus text format: per-stage latency histograms plus service counters"""
+        return web.Response(body=metrics.REGISTRY.render().encode("utf-8"),
+                            headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    async def profile(self, request):
+        """Folded-stack CPU profile for flame graphs (PROFILING=1 only), e.g. ?seconds=10"""
+        loop = asyncio.get_running_loop()
+        # Sampling sleeps for the whole duration; keep it off the event loop and the CPU pool
+        status, content_type, body = await loop.run_in_executor(None, metrics.profile_request, dict(request.query))
+        return web.Response(text=body, status=status, content_type=content_type)
+
+    async def list_cameras(self, request):
+        """Scheduler and per-camera throughput / lag statistics"""
+        return web.json_response(self.cameras.status(), status=200)
+
+    async def add_camera(self, request):
+        try:
+            config = await request.json()
+        except ValueError:
+            config = None
+        try:
+            camera = self.cameras.add_from_config(config)
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response(camera.stats(), status=201)
+
+    async def camera_status(self, request):
+        camera_id = request.match_info["camera_id"]
+        status = self.cameras.camera_status(camera_id)
+        if status is None:
+            return web.json_response({"error": f"Unknown camera '{camera_id}'"}, status=404)
+        return web.json_response(status, status=200)
+
+    async def remove_camera(self, request):
+        camera_id = request.match_info["camera_id"]
+        if not self.cameras.remove_camera(camera_id):
+            return web.json_response({"error": f"Unknown camera '{camera_id}'"}, status=404)
+        return web.json_response({"removed": camera_id}, status=200)
+
+    def stats(self):
+        return {
+            "mode": "async",
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+def run_async_server(prepare, describe, finish, health, readiness=None, cameras=None, stream=None,
+                     single_flight=None, flight_key=None, request_options=None, host='0.0.0.0', port=5000):
+    server = AsyncVisionServer(
+        prepare, describe, finish, health, readiness, cameras, stream, single_flight, flight_key, request_options,
+        cpu_workers=int(os.getenv("VISION_CPU_WORKERS", "2")),
+        max_pending=int(os.getenv("VISION_MAX_PENDING", "8")),
+    )
+    web.run_app(server.make_app(), host=host, port=port)